@@ -0,0 +1,148 @@
+#!/usr/bin/python3
+# alldifferent.py
+# The "all different" constraint over code to letter domains: every code
+# has to end up with its own letter, so a letter which can't be part of any
+# complete one-letter-per-code assignment can be taken out of a domain.
+#
+# This is Regin's filtering: find one maximum matching of codes to letters,
+# then an edge (code, letter) is part of some maximum matching if it is in the
+# matching, lies on an alternating path from a free letter, or joins two
+# nodes in the same strongly connected component of the matching graph.
+#
+# Domains are letter masks as in wordindex: bit 0 for a ... bit 25 for z.
+
+
+def maximumMatching(codes, domains):
+    """
+    Match each code to a different letter from its domain, as far as
+    possible. Returns codeLetter (the letter number for each code in codes,
+    or -1 if it couldn't be matched) and letterCode (the position in codes
+    of the code each letter is matched to, or -1).
+    """
+    codeLetter = [-1] * len(codes)
+    letterCode = [-1] * 26
+
+    # Greedy first, it gets most of the way there for the cost of one pass.
+    taken = 0
+    for ci, code in enumerate(codes):
+        free = domains[code] & ~taken
+        if free:
+            bit = free & -free
+            taken |= bit
+            letter = bit.bit_length() - 1
+            codeLetter[ci] = letter
+            letterCode[letter] = ci
+
+    # Then augmenting paths for the rest.
+    def augment(ci, seen):
+        mask = domains[codes[ci]] & ~seen[0]
+        while mask:
+            bit = mask & -mask
+            mask ^= bit
+            seen[0] |= bit
+            letter = bit.bit_length() - 1
+            if letterCode[letter] == -1 or augment(letterCode[letter], seen):
+                codeLetter[ci] = letter
+                letterCode[letter] = ci
+                return True
+        return False
+
+    for ci in range(len(codes)):
+        if codeLetter[ci] == -1:
+            augment(ci, [0])
+
+    return codeLetter, letterCode
+
+
+def allDifferentDomains(domains):
+    """
+    Prune domains (code -> letter mask, for codes which must all get
+    different letters) down to the letters which are part of at least one
+    complete assignment.
+    Returns a dict of the codes whose domains have narrowed, with their new
+    masks, or None if there is no way of giving every code its own letter.
+    """
+    codes = list(domains)
+    codeLetter, letterCode = maximumMatching(codes, domains)
+    if -1 in codeLetter:
+        return None
+
+    # The matching graph. Nodes 0 .. n-1 are the codes, n .. n+25 the letters.
+    # Matched edges go code -> letter, the others letter -> code.
+    n = len(codes)
+    edges = [list() for _ in range(n + 26)]
+    for ci, code in enumerate(codes):
+        edges[ci].append(n + codeLetter[ci])
+        mask = domains[code] & ~(1 << codeLetter[ci])
+        while mask:
+            bit = mask & -mask
+            mask ^= bit
+            edges[n + bit.bit_length() - 1].append(ci)
+
+    # Anything reachable from a letter no code is matched to is on an even
+    # alternating path, so can be swapped into a matching.
+    reachable = [False] * (n + 26)
+    stack = [n + letter for letter in range(26) if letterCode[letter] == -1]
+    for node in stack:
+        reachable[node] = True
+    while len(stack) > 0:
+        node = stack.pop()
+        for other in edges[node]:
+            if not reachable[other]:
+                reachable[other] = True
+                stack.append(other)
+
+    component = stronglyConnectedComponents(edges)
+
+    narrowed = dict()
+    for ci, code in enumerate(codes):
+        mask = domains[code]
+        keep = 1 << codeLetter[ci]
+        rest = mask & ~keep
+        while rest:
+            bit = rest & -rest
+            rest ^= bit
+            letterNode = n + bit.bit_length() - 1
+            if reachable[letterNode] or component[letterNode] == component[ci]:
+                keep |= bit
+        if keep != mask:
+            narrowed[code] = keep
+    return narrowed
+
+
+def stronglyConnectedComponents(edges):
+    """
+    Tarjan's algorithm over a graph given as a list of lists of node
+    numbers. Returns the component number of each node.
+    """
+    index = [-1] * len(edges)
+    lowLink = [0] * len(edges)
+    onStack = [False] * len(edges)
+    component = [-1] * len(edges)
+    stack = list()
+    counter = [0, 0]  # next index, next component
+
+    def visit(node):
+        index[node] = lowLink[node] = counter[0]
+        counter[0] += 1
+        stack.append(node)
+        onStack[node] = True
+        for other in edges[node]:
+            if index[other] == -1:
+                visit(other)
+                lowLink[node] = min(lowLink[node], lowLink[other])
+            elif onStack[other]:
+                lowLink[node] = min(lowLink[node], index[other])
+        if lowLink[node] == index[node]:
+            while True:
+                other = stack.pop()
+                onStack[other] = False
+                component[other] = counter[1]
+                if other == node:
+                    break
+            counter[1] += 1
+
+    for node in range(len(edges)):
+        if index[node] == -1:
+            visit(node)
+    return component
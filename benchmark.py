@@ -0,0 +1,794 @@
+#!/usr/bin/python3
+# benchmark.py
+# Time the solvers on the sample puzzles so that changes to the search can be
+# compared on numbers rather than on feel.
+#
+# Usage: benchmark.py <name> [options]    (benchmark.py --help for the names)
+
+import argparse, concurrent.futures, gc, heapq, itertools, json, math, os, random, subprocess, sys, tempfile, time, tracemalloc
+
+import codeword
+import nogoods
+import puzzlegen
+import solveserver
+import themetable
+import wordcache
+import wordindex
+import wordlayers
+
+DIR_PATH = os.path.dirname(os.path.realpath(__file__))
+# The generated puzzles of the suite benchmark (see puzzlegen.py), and the
+# results it is compared against.
+SUITE_PUZZLES = os.path.join(DIR_PATH, "benchmark_puzzles.jsonl")
+SUITE_BASELINE = os.path.join(DIR_PATH, "benchmark_baseline.json")
+
+
+def loadDictionary():
+    return wordcache.loadDictionary()
+
+
+def samplePuzzle(emptyRubric=True):
+    """
+    The setPuzzle() grid, by default with the "hunt harder" empty rubric.
+    """
+    matrix, rubric = codeword.setPuzzle()
+    if emptyRubric:
+        rubric = dict()
+    return matrix, rubric
+
+
+def quietSolver(matrix, rubric, dictionary, **kwargs):
+    cwts = codeword.CodewordToSolve(matrix, rubric, dictionary, **kwargs)
+    cwts.verbose = False
+    cwts.xwts.verbose = False
+    cwts.xwts.veryVerbose = False
+    return cwts
+
+
+def showTable(headings, rows):
+    widths = [max(len(str(h)), *(len(str(r[i])) for r in rows)) for i, h in enumerate(headings)]
+    print("  ".join(str(h).rjust(w) for h, w in zip(headings, widths)))
+    for r in rows:
+        print("  ".join(str(c).rjust(w) for c, w in zip(r, widths)))
+
+
+def benchEngines(args, dictionary):
+    """
+    Nodes (candidate words tried) per second of the search for each candidate engine.
+    """
+    matrix, rubric = samplePuzzle(not args.hints)
+    rows = list()
+    for engine in args.engines.split(","):
+        best = None
+        for _ in range(args.repeat):
+            cwts = quietSolver(matrix, rubric, dictionary, engine=engine)
+            if args.many:
+                cwts.assumeManySolutions()
+            start = time.perf_counter()
+            results = cwts.solve()
+            total = time.perf_counter() - start
+            xwts = cwts.xwts
+            if best is None or xwts.searchTime < best[3]:
+                best = (engine, len(results), xwts.nodesVisited, xwts.searchTime, total)
+        engine, solutions, nodes, search, total = best
+        rows.append((engine, solutions, "{:,}".format(nodes), "%.3f" % search, "%.3f" % total,
+                     "{:,.0f}".format(nodes / max(search, 1e-9))))
+    showTable(("engine", "solutions", "nodes", "search s", "total s", "nodes/s"), rows)
+
+
+def benchMemory(args, dictionary):
+    """
+    Traced memory of the search for each candidate engine: its peak, what is
+    still held at the end per solution kept, what filtering a node allocates
+    on the way (freed or not) and what each level deeper holds while it is
+    live (the trail and the generator frames, from the memory in use as each
+    depth is first reached).
+    """
+    matrix, rubric = samplePuzzle(not args.hints)
+    rows = list()
+    for engine in args.engines.split(","):
+        # Build the index first, with a warm up solve, so that it isn't counted
+        # as part of the search.
+        index = wordindex.makeEngine(engine, dictionary)
+        quietSolver(matrix, rubric, index, engine=engine).solve()
+        cwts = quietSolver(matrix, rubric, index, engine=engine)
+        if args.many:
+            cwts.assumeManySolutions()
+
+        xwts = cwts.xwts
+        xwts.setWordsToSolve(cwts.parse())
+        xwts.setBaseDictionary(index)
+        filterWordsBelow = xwts.filterWordsBelow
+        transient = [0, 0]
+        atDepth = dict()
+
+        def measuredFilter(wordToSolveList, letterList, depth, word, trailMark):
+            before = tracemalloc.get_traced_memory()[0]
+            atDepth.setdefault(depth, before)
+            tracemalloc.reset_peak()
+            ok = filterWordsBelow(wordToSolveList, letterList, depth, word, trailMark)
+            transient[0] += tracemalloc.get_traced_memory()[1] - before
+            transient[1] += 1
+            return ok
+
+        xwts.filterWordsBelow = measuredFilter
+        gc.collect()
+        tracemalloc.start()
+        try:
+            start = tracemalloc.get_traced_memory()[0]
+            results = xwts.solve(cwts.multipleResults)
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+            del xwts.filterWordsBelow
+
+        depths = sorted(atDepth)
+        perFrame = 0
+        if len(depths) > 1:
+            perFrame = (atDepth[depths[-1]] - atDepth[depths[0]]) / (depths[-1] - depths[0])
+        rows.append((engine, len(results), "{:,}".format(xwts.nodesVisited), "{:,.1f}".format((peak - start) / 1024),
+                     "{:,.0f}".format((current - start) / max(1, len(results))),
+                     "{:,.0f}".format(transient[0] / max(1, transient[1])), "{:,.0f}".format(perFrame)))
+    showTable(("engine", "solutions", "nodes", "peak KiB", "kept B/solution", "B/node", "B/live depth"), rows)
+
+
+def benchPropagation(args, dictionary):
+    """
+    Nodes and search time with no propagation, with forward checking of the
+    code domains and with all different pruning on top, and what the all
+    different pruning itself costs. Uses the first of the engines.
+    """
+    engine = args.engines.split(",")[0]
+    index = wordindex.makeEngine(engine, dictionary)
+    matrix, rubric = samplePuzzle(not args.hints)
+    rows = list()
+    for name, forwardChecking, allDifferent in (("none", False, False),
+                                                ("forward checking", True, False),
+                                                ("+ all different", True, True)):
+        best = None
+        for _ in range(args.repeat):
+            cwts = quietSolver(matrix, rubric, index, engine=engine)
+            cwts.xwts.forwardChecking = forwardChecking
+            cwts.xwts.allDifferent = allDifferent
+            if args.many:
+                cwts.assumeManySolutions()
+            results = cwts.solve()
+            xwts = cwts.xwts
+            if best is None or xwts.searchTime < best[3]:
+                best = (name, len(results), xwts.nodesVisited, xwts.searchTime,
+                        xwts.allDifferentCalls, xwts.allDifferentPrunes, xwts.allDifferentTime)
+        name, solutions, nodes, search, calls, prunes, allDiffTime = best
+        rows.append((name, solutions, "{:,}".format(nodes), "%.3f" % search,
+                     "{:,}".format(calls), "{:,}".format(prunes), "%.3f" % allDiffTime))
+    showTable(("propagation", "solutions", "nodes", "search s", "alldiff calls", "letters pruned", "alldiff s"), rows)
+
+
+# Run in a fresh process by benchStartup: load the dictionary, solve the sample
+# and report the time to the first node of the search (after the imports).
+STARTUP_CHILD = """
+import sys, time
+sys.path.insert(0, %r)
+import benchmark, wordcache
+start = time.perf_counter()
+dictionary = wordcache.loadDictionary(useCache=%r)
+loaded = time.perf_counter()
+matrix, rubric = benchmark.samplePuzzle(True)
+cwts = benchmark.quietSolver(matrix, rubric, dictionary, engine=%r)
+cwts.solve()
+print(loaded - start, loaded - start + cwts.xwts.setupTime)
+"""
+
+
+def benchStartup(args, dictionary):
+    """
+    Time from starting a fresh process to the first node of the search, for
+    each engine, reading the word list as text and using the compiled cache.
+    """
+    rows = list()
+    for engine in args.engines.split(","):
+        for useCache in (False, True):
+            best = None
+            for _ in range(args.repeat):
+                output = subprocess.run([sys.executable, "-c", STARTUP_CHILD % (DIR_PATH, useCache, engine)],
+                                        check=True, capture_output=True, text=True).stdout
+                load, firstNode = (float(t) for t in output.split())
+                if best is None or firstNode < best[1]:
+                    best = (load, firstNode)
+            rows.append((engine, "cache" if useCache else "text", "%.1f" % (best[0] * 1000), "%.1f" % (best[1] * 1000)))
+    showTable(("engine", "dictionary", "load ms", "first node ms"), rows)
+
+
+def suitePuzzles(args, dictionary):
+    """
+    The puzzles of the suite, generated (see puzzlegen.py) if they aren't there.
+    """
+    if not os.path.exists(args.puzzles):
+        print("Generating %s" % args.puzzles)
+        with open(args.puzzles, "w") as puzzleFile:
+            for puzzle in puzzlegen.makeSuite(dictionary):
+                puzzleFile.write(json.dumps(puzzle) + "\n")
+    with open(args.puzzles, "r") as puzzleFile:
+        return [json.loads(line) for line in puzzleFile if len(line.strip()) > 0]
+
+
+def benchFilterCache(args, dictionary):
+    """
+    Search time over the suite's puzzles (all solutions) for each engine
+    with no filter cache, a cache for each puzzle and one cache shared by
+    all of them, with the hits and misses.
+    """
+    puzzles = suitePuzzles(args, dictionary)
+    rows = list()
+    for engine in args.engines.split(","):
+        index = wordindex.makeEngine(engine, dictionary)
+        for name in ("none", "each puzzle", "shared"):
+            best = None
+            for _ in range(args.repeat):
+                shared = wordindex.FilterCache(index)
+                search = 0.0
+                hits = misses = 0
+                for puzzle in puzzles:
+                    matrix = tuple(tuple(row) for row in puzzle['grid'])
+                    rubric = {int(code): letter for code, letter in puzzle['rubric'].items()}
+                    cwts = quietSolver(matrix, rubric, index, engine=engine)
+                    cwts.assumeManySolutions()
+                    if name == "each puzzle":
+                        cwts.useFilterCache()
+                    elif name == "shared":
+                        cwts.useFilterCache(cache=shared)
+                    cwts.solve()
+                    search += cwts.xwts.searchTime
+                    if name == "each puzzle":
+                        hits += cwts.xwts.filterCache.hits
+                        misses += cwts.xwts.filterCache.misses
+                if name == "shared":
+                    hits, misses = shared.hits, shared.misses
+                if best is None or search < best[0]:
+                    best = (search, hits, misses)
+            search, hits, misses = best
+            rows.append((engine, name, "%.3f" % search, "{:,}".format(hits), "{:,}".format(misses),
+                         "-" if hits + misses == 0 else "%.0f%%" % (100 * hits / (hits + misses))))
+    showTable(("engine", "filter cache", "search s", "hits", "misses", "hit rate"), rows)
+
+
+def anagramQueries(dictionary, count, length=7, seed=1):
+    """
+    count random queries of length letters: half the letters of a dictionary
+    word shuffled (so there is at least one anagram), half letters drawn at
+    the rate they turn up in the dictionary's words of that length.
+    """
+    rng = random.Random(seed)
+    words = [word for word in wordindex.puzzleWords(dictionary) if len(word) == length]
+    letters = "".join(words)
+    queries = list()
+    for i in range(count):
+        if i % 2 == 0:
+            query = list(rng.choice(words))
+            rng.shuffle(query)
+        else:
+            query = [rng.choice(letters) for _ in range(length)]
+        queries.append("".join(query))
+    return queries
+
+
+def benchAnagrams(args, dictionary):
+    """
+    Random 7 letter queries answered by scanning the dictionary, by the
+    circlegram AnagramIndex and by the LetterCountIndex with and without
+    numpy: exact anagrams, and all the words of 3 letters or more which can
+    be made from them. The scans and the pure Python index only get the
+    first --scan-queries of the queries, being slow; their rates are over those.
+    """
+    queries = anagramQueries(dictionary, args.queries)
+    scanQueries = queries[:args.scan_queries]
+    words = list(wordindex.puzzleWords(dictionary))
+
+    def scanExact(query):
+        key = wordindex.anagramKey(query)
+        return [word for word in words if len(word) == len(query) and wordindex.anagramKey(word) == key]
+
+    def scanSubset(query):
+        counts = wordindex.letterCounts(query)
+        found = list()
+        for word in words:
+            if 3 <= len(word) <= len(query):
+                wordCounts = wordindex.letterCounts(word)
+                if all(n <= counts[i] for i, n in enumerate(wordCounts)):
+                    found.append(word)
+        return found
+
+    indexes = list()
+    start = time.perf_counter()
+    anagramIndex = wordindex.AnagramIndex(dictionary)
+    anagramIndex.lengthIndex(7)
+    indexes.append(("anagram", time.perf_counter() - start))
+    start = time.perf_counter()
+    countIndex = wordindex.LetterCountIndex(dictionary)
+    indexes.append(("counts (numpy)", time.perf_counter() - start))
+    start = time.perf_counter()
+    pythonIndex = wordindex.LetterCountIndex(dictionary, useNumpy=False)
+    indexes.append(("counts (python)", time.perf_counter() - start))
+    print("Index build: " + ", ".join("%s %.3fs" % (name, seconds) for name, seconds in indexes))
+
+    rows = list()
+    for name, query, run, batch in (
+            ("scan", "exact", lambda qs: [scanExact(q) for q in qs], scanQueries),
+            ("anagram", "exact", anagramIndex.anagramsMany, queries),
+            ("counts (numpy)", "exact", countIndex.anagramsMany, queries),
+            ("counts (python)", "exact", pythonIndex.anagramsMany, scanQueries),
+            ("scan", "3+ letters", lambda qs: [scanSubset(q) for q in qs], scanQueries),
+            ("counts (numpy)", "3+ letters", lambda qs: countIndex.query(qs, minLength=3), queries),
+            ("counts (python)", "3+ letters", lambda qs: pythonIndex.query(qs, minLength=3), scanQueries)):
+        best = None
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            found = run(batch)
+            seconds = time.perf_counter() - start
+            if best is None or seconds < best:
+                best = seconds
+        rows.append((name, query, "{:,}".format(len(batch)), "%.3f" % best,
+                     "{:,.0f}".format(len(batch) / max(best, 1e-9)), "{:,}".format(sum(len(f) for f in found))))
+    showTable(("index", "query", "queries", "seconds", "queries/s", "words found"), rows)
+
+
+def benchThemes(args, dictionary):
+    """
+    Time to find the top 10 triples by theme score for three word lists of
+    each size, half words with a theme and half without: the chunked numpy
+    scoring of themetable.ThemeTable.topTriples, and scoring every triple in
+    Python (for the smaller sizes).
+    """
+    table = themetable.loadThemeTable(dictionary)
+    rng = random.Random(1)
+    themed = sorted(table.rows)
+    plain = [word for word in wordindex.dictionaryWords(dictionary) if word not in table.rows]
+
+    def pythonTop(wordLists, k):
+        vectors = [[table.wordVectors([word])[0].tolist() for word in words] for words in wordLists]
+        best = list()
+        for i, j, l in itertools.product(*(range(len(words)) for words in wordLists)):
+            a, b, c = vectors[0][i], vectors[1][j], vectors[2][l]
+            score = sum(x * y * z + themetable.PAIR_WEIGHT * (x * y + x * z + y * z) for x, y, z in zip(a, b, c))
+            if score > 0:
+                best.append((score, i, j, l))
+        return heapq.nlargest(k, best)
+
+    rows = list()
+    for size in (20, 50, 100, 200):
+        wordLists = [rng.sample(themed, size // 2) + rng.sample(plain, size - size // 2) for _ in range(3)]
+        ways = [("numpy", lambda: table.topTriples(wordLists, 10))]
+        if size <= 50:
+            ways.append(("python", lambda: pythonTop(wordLists, 10)))
+        for name, run in ways:
+            best = None
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                run()
+                seconds = time.perf_counter() - start
+                if best is None or seconds < best:
+                    best = seconds
+            rows.append((size, "{:,}".format(size ** 3), name, "%.4f" % best,
+                         "{:,.0f}".format(size ** 3 / max(best, 1e-9))))
+    showTable(("words each", "triples", "scoring", "seconds", "triples/s"), rows)
+
+
+def benchBackjumping(args, dictionary):
+    """
+    Nodes, backjumps, nogood prunes and search time on the sample and over
+    the suite's puzzles (all solutions), with and without forward checking:
+    chronological backtracking, conflict-directed backjumping, and
+    backjumping with nogoods. Uses the first of the engines.
+    """
+    engine = args.engines.split(",")[0]
+    index = wordindex.makeEngine(engine, dictionary)
+    matrix, rubric = samplePuzzle(not args.hints)
+    puzzleSets = [("sample", [(matrix, rubric, args.many)]),
+                  ("suite", [(tuple(tuple(row) for row in puzzle['grid']),
+                              {int(code): letter for code, letter in puzzle['rubric'].items()}, True)
+                             for puzzle in suitePuzzles(args, dictionary)])]
+    rows = list()
+    for setName, puzzles in puzzleSets:
+        for forwardChecking in (True, False):
+            for name, backjumping, nogoodLimit in (("backtracking", False, 0),
+                                                   ("backjumping", True, 0),
+                                                   ("+ nogoods", True, nogoods.DEFAULT_LIMIT)):
+                best = None
+                for _ in range(args.repeat):
+                    solutions = nodes = backjumps = prunes = 0
+                    search = 0.0
+                    for puzzleMatrix, puzzleRubric, many in puzzles:
+                        cwts = quietSolver(puzzleMatrix, puzzleRubric, index, engine=engine)
+                        cwts.xwts.forwardChecking = forwardChecking
+                        cwts.xwts.backjumping = backjumping
+                        cwts.xwts.nogoodLimit = nogoodLimit
+                        if many:
+                            cwts.assumeManySolutions()
+                        solutions += len(cwts.solve())
+                        xwts = cwts.xwts
+                        nodes += xwts.nodesVisited
+                        backjumps += xwts.backjumps
+                        prunes += xwts.nogoodPrunes
+                        search += xwts.searchTime
+                    if best is None or search < best[4]:
+                        best = (solutions, nodes, backjumps, prunes, search)
+                solutions, nodes, backjumps, prunes, search = best
+                rows.append((setName, "on" if forwardChecking else "off", name, "{:,}".format(solutions),
+                             "{:,}".format(nodes), "{:,}".format(backjumps), "{:,}".format(prunes), "%.3f" % search))
+    showTable(("puzzles", "forward checking", "search", "solutions", "nodes", "backjumps", "nogood prunes",
+               "search s"), rows)
+
+
+def benchUnique(args, dictionary):
+    """
+    Checking the suite's puzzles have one solution each: finding all their
+    solutions as Solutions, counting them all (count_solutions()) and
+    stopping at the second (is_unique()). The nodes, the time, and the peak
+    traced memory of the search and what it holds on to after, the worst
+    over the puzzles. Uses the first of the engines.
+    """
+    engine = args.engines.split(",")[0]
+    index = wordindex.makeEngine(engine, dictionary)
+    puzzles = suitePuzzles(args, dictionary)
+    # Each gives what it has to show for the search, and how many solutions that is.
+    ways = (("all solutions", lambda cwts: cwts.solve(), len),
+            ("count_solutions()", lambda cwts: cwts.count_solutions(), lambda count: count),
+            ("is_unique()", lambda cwts: cwts.is_unique(), lambda unique: 1 if unique else 2))
+    rows = list()
+    for name, way, counted in ways:
+        nodes = unique = 0
+        seconds = 0.0
+        worstPeak = worstHeld = 0
+        for puzzle in puzzles:
+            matrix = tuple(tuple(row) for row in puzzle['grid'])
+            rubric = {int(code): letter for code, letter in puzzle['rubric'].items()}
+            # Timed without tracing, which slows it down, then traced.
+            for traced in (False, True):
+                cwts = quietSolver(matrix, rubric, index, engine=engine)
+                cwts.assumeManySolutions()
+                cwts.setTimeLimit(args.timeout)
+                gc.collect()
+                if not traced:
+                    began = time.perf_counter()
+                    count = counted(way(cwts))
+                    seconds += time.perf_counter() - began
+                    continue
+                tracemalloc.start()
+                try:
+                    start = tracemalloc.get_traced_memory()[0]
+                    result = way(cwts)
+                    held, peak = tracemalloc.get_traced_memory()
+                    worstPeak = max(worstPeak, peak - start)
+                    worstHeld = max(worstHeld, held - start)
+                    del result
+                finally:
+                    tracemalloc.stop()
+            nodes += cwts.xwts.nodesVisited
+            unique += count == 1
+        rows.append((name, "%d/%d" % (unique, len(puzzles)), "{:,}".format(nodes), "%.3f" % seconds,
+                     "{:,.1f}".format(worstPeak / 1024), "{:,.1f}".format(worstHeld / 1024)))
+    showTable(("check", "unique", "nodes", "seconds", "worst peak KiB", "worst held KiB"), rows)
+
+
+def runSuitePuzzle(puzzle, index, engine, limit, timeout):
+    """
+    Search one suite puzzle for up to limit solutions. Returns the seconds to
+    the first solution (from the start, parsing included), the seconds in
+    all, the nodes, the solutions found, whether the answer was one of them
+    and whether it ran out of time.
+    """
+    matrix = tuple(tuple(row) for row in puzzle['grid'])
+    rubric = {int(code): letter for code, letter in puzzle['rubric'].items()}
+    answer = {int(code): letter for code, letter in puzzle['answer'].items()}
+    cwts = quietSolver(matrix, rubric, index, engine=engine)
+    first = None
+    found = 0
+    answerFound = False
+    start = time.perf_counter()
+    for solution in cwts.iter_solutions(limit, time.time() + timeout):
+        if first == None:
+            first = time.perf_counter() - start
+        found += 1
+        answerFound = answerFound or solution.solvedRubric == answer
+    return first, time.perf_counter() - start, cwts.xwts.nodesVisited, found, answerFound, cwts.xwts.timedOut
+
+
+def answerWords(puzzle):
+    """
+    The words of a suite puzzle's answer, as the grid is parsed.
+    """
+    matrix = tuple(tuple(row) for row in puzzle['grid'])
+    answer = {int(code): letter for code, letter in puzzle['answer'].items()}
+    return ["".join(answer[code] for code in wts.wordInCode)
+            for wts in codeword.CodewordToSolve(matrix, dict(), list()).parse()]
+
+
+def benchOrdering(args, dictionary):
+    """
+    Time (and nodes) to the first solution of each suite puzzle trying the
+    candidates in dictionary order and in the frequency order of
+    --frequencies (see wordlayers.py); no frequency list comes with the
+    word list, so without one the orders aren't compared. Then the time to
+    put a layer into a warm index against building the index again over
+    the changed word list.
+    """
+    puzzles = suitePuzzles(args, dictionary)
+    engine = args.engines.split(",")[0]
+    index = wordindex.makeEngine(engine, dictionary)
+    if args.frequencies != None:
+        compareOrders(args, puzzles, index, engine)
+    else:
+        print("No --frequencies FILE: not comparing the orders")
+    timeLayer(puzzles, index, engine, dictionary)
+
+
+def compareOrders(args, puzzles, index, engine):
+    """
+    The ordering benchmark's comparison of dictionary order with the ranks
+    in args.frequencies.
+    """
+    ranks = wordlayers.loadFrequencies(args.frequencies)
+    print("Ranks from %s: %s words" % (args.frequencies, "{:,}".format(len(ranks))))
+    rows = list()
+    totals = [0.0, 0.0, 0, 0]
+    for puzzle in puzzles:
+        runs = list()
+        for wordRanks in (None, ranks):
+            index.ranks = wordRanks
+            best = None
+            for _ in range(args.repeat):
+                first, seconds, nodes, found, answerFound, timedOut = runSuitePuzzle(puzzle, index, engine, 1,
+                                                                                     args.timeout)
+                if best is None or seconds < best[0]:
+                    best = (seconds, nodes)
+            runs.append(best)
+        (plainSeconds, plainNodes), (rankedSeconds, rankedNodes) = runs
+        totals[0] += plainSeconds
+        totals[1] += rankedSeconds
+        totals[2] += plainNodes
+        totals[3] += rankedNodes
+        rows.append((puzzle['id'], "{:,}".format(plainNodes), "{:,}".format(rankedNodes),
+                     "%.4f" % plainSeconds, "%.4f" % rankedSeconds,
+                     "%.2fx" % (plainSeconds / max(rankedSeconds, 1e-9))))
+    index.ranks = None
+    showTable(("puzzle", "nodes dict", "nodes ranked", "first s dict", "first s ranked", "speedup"), rows)
+    print("\nTo the first solution: %s nodes in %.3fs in dictionary order, %s nodes in %.3fs ranked (%.2fx)" %
+          ("{:,}".format(totals[2]), totals[0], "{:,}".format(totals[3]), totals[1],
+           totals[0] / max(totals[1], 1e-9)))
+
+
+def timeLayer(puzzles, index, engine, dictionary):
+    """
+    The ordering benchmark's time to put a layer of a few hundred words in
+    and out into index (warmed up by the suite), against building it again.
+    """
+    rng = random.Random(1)
+    words = wordindex.dictionaryWords(dictionary)
+    present = set(words)
+    exclusions = rng.sample(words, 500)
+    additions = [word[::-1] for word in rng.sample(words, 2000) if word[::-1] not in present][:500]
+    layer = wordlayers.Layer("benchmark", additions, exclusions)
+    codeWords = [word for puzzle in puzzles for word in answerWords(puzzle)]
+    start = time.perf_counter()
+    wordlayers.applyLayers(index, [layer])
+    layerSeconds = time.perf_counter() - start
+    excluded = set(exclusions)
+    start = time.perf_counter()
+    rebuilt = wordindex.makeEngine(engine, [word for word in words if word not in excluded] + additions)
+    for word in codeWords:
+        rebuilt.initialCandidates(word)
+    rebuildSeconds = time.perf_counter() - start
+    print("Layer of %d in, %d out: %.1f ms into the warm index, %.1f ms to build one again (for the suite's words)" %
+          (len(additions), len(exclusions), layerSeconds * 1000, rebuildSeconds * 1000))
+
+
+def benchSuite(args, dictionary):
+    """
+    Time the generated puzzles of the suite (made by puzzlegen.py if they
+    aren't there): nodes per second, time to the first solution and peak
+    traced memory for each, against the stored baseline. Uses the first of
+    the engines. --save-baseline makes this run the new baseline.
+    """
+    puzzles = suitePuzzles(args, dictionary)
+
+    baseline = dict()
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, "r") as baselineFile:
+            baseline = json.load(baselineFile)['puzzles']
+
+    engine = args.engines.split(",")[0]
+    index = wordindex.makeEngine(engine, dictionary)
+    results = dict()
+    rows = list()
+    for puzzle in puzzles:
+        best = None
+        for _ in range(args.repeat):
+            run = runSuitePuzzle(puzzle, index, engine, args.limit, args.timeout)
+            if best is None or run[1] < best[1]:
+                best = run
+        first, seconds, nodes, found, answerFound, timedOut = best
+
+        # Memory on a run of its own, as tracing slows everything else down.
+        gc.collect()
+        tracemalloc.start()
+        try:
+            runSuitePuzzle(puzzle, index, engine, args.limit, args.timeout)
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        result = results[puzzle['id']] = {
+            'first': None if first == None else round(first, 6), 'seconds': round(seconds, 6),
+            'nodes': nodes, 'solutions': found, 'peakKiB': round(peak / 1024, 1)}
+        status = "timeout" if timedOut else ("ok" if answerFound else ("limit" if found >= args.limit else "WRONG"))
+        base = baseline.get(puzzle['id'])
+        vsBase = "-" if base == None else "%.2fx" % (seconds / max(base['seconds'], 1e-9))
+        rows.append((puzzle['id'], status, found, "{:,}".format(nodes),
+                     "-" if first == None else "%.4f" % first, "%.4f" % seconds,
+                     "{:,.0f}".format(nodes / max(seconds, 1e-9)), "{:,.1f}".format(result['peakKiB']),
+                     vsBase, "-" if base == None else "{:+,}".format(nodes - base['nodes'])))
+    showTable(("puzzle", "status", "solutions", "nodes", "first s", "all s", "nodes/s", "peak KiB",
+               "time vs base", "nodes vs base"), rows)
+
+    totalSeconds = sum(r['seconds'] for r in results.values())
+    totalNodes = sum(r['nodes'] for r in results.values())
+    print("\nTotal: %s nodes in %.3fs, %s nodes/s" % ("{:,}".format(totalNodes), totalSeconds,
+                                                    "{:,.0f}".format(totalNodes / max(totalSeconds, 1e-9))))
+    common = [id for id in results if id in baseline]
+    if len(common) > 0:
+        baseSeconds = sum(baseline[id]['seconds'] for id in common)
+        baseNodes = sum(baseline[id]['nodes'] for id in common)
+        print("Baseline, same %d puzzles: %s nodes in %.3fs; now %.2fx the time, %.2fx the nodes" %
+              (len(common), "{:,}".format(baseNodes), baseSeconds,
+               sum(results[id]['seconds'] for id in common) / max(baseSeconds, 1e-9),
+               sum(results[id]['nodes'] for id in common) / max(baseNodes, 1)))
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as baselineFile:
+            json.dump({'engine': engine, 'limit': args.limit, 'puzzles': results}, baselineFile, indent=1)
+            baselineFile.write("\n")
+        print("Saved as the baseline in %s" % args.baseline)
+
+
+def benchGrids(args, dictionary):
+    """
+    Parse and solve times across grid sizes (--sizes, square and not),
+    on puzzles made for the purpose by puzzlegen.py with no letters given:
+    the words parsed and how many cross, the time to parse a grid (best of
+    --repeat), and the nodes, time to the first solution and time to all
+    of them (up to --limit). Uses the first of the engines.
+    """
+    engine = args.engines.split(",")[0]
+    index = wordindex.makeEngine(engine, dictionary)
+    sizes = [puzzlegen.gridSize(size) for size in args.sizes.split(",")]
+    puzzles = puzzlegen.makeSuite(dictionary, sizes, (0.36, 0.48), (0,), 2)
+    rows = list()
+    for size in sizes:
+        name = puzzlegen.sizeName(size)
+        ofSize = [puzzle for puzzle in puzzles if puzzle['id'].startswith("gen-%s-" % name)]
+        if len(ofSize) == 0:
+            continue
+        words = crossings = 0
+        parseSeconds = first = seconds = 0.0
+        nodes = timeouts = 0
+        for puzzle in ofSize:
+            cwts = quietSolver(tuple(tuple(row) for row in puzzle['grid']), dict(), index, engine=engine)
+            best = None
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                wordList = cwts.parse()
+                best = min(best or math.inf, time.perf_counter() - start)
+            parseSeconds += best
+            words += len(wordList)
+            crossings += sum(len(wts.crossings) for wts in wordList) // 2
+            run = runSuitePuzzle(puzzle, index, engine, args.limit, args.timeout)
+            first += run[0] or 0.0
+            seconds += run[1]
+            nodes += run[2]
+            timeouts += run[5]
+        rows.append((name, len(ofSize), words, crossings, "%.3f" % (parseSeconds / len(ofSize) * 1000),
+                     "{:,}".format(nodes), "%.4f" % (first / len(ofSize)), "%.4f" % (seconds / len(ofSize)),
+                     timeouts))
+    showTable(("grid", "puzzles", "words", "crossings", "parse ms", "nodes", "first s", "all s", "timeouts"), rows)
+
+
+def benchServer(args, dictionary):
+    """
+    Latency of codewords solved by a solveserver.py on a Unix socket, against
+    solving each in a fresh codeword.py --batch process (the first few suite
+    puzzles), then --clients clients at once sending every suite puzzle:
+    latency percentiles, throughput and the server's own /metrics.
+    """
+    puzzles = suitePuzzles(args, dictionary)
+    lines = [json.dumps({'id': p['id'], 'grid': p['grid'], 'rubric': p['rubric'], 'timeout': args.timeout})
+             for p in puzzles]
+    engine = args.engines.split(",")[0]
+
+    def percentile(latencies, fraction):
+        ordered = sorted(latencies)
+        return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+    fresh = list()
+    for line in lines[:10]:
+        start = time.perf_counter()
+        subprocess.run([sys.executable, os.path.join(DIR_PATH, "codeword.py"), "--batch", "-", "--engine", engine],
+                       input=line + "\n", check=True, capture_output=True, text=True)
+        fresh.append(time.perf_counter() - start)
+
+    with tempfile.TemporaryDirectory() as tmpDir:
+        socketPath = os.path.join(tmpDir, "solve.sock")
+        server = subprocess.Popen([sys.executable, os.path.join(DIR_PATH, "solveserver.py"), "--socket", socketPath,
+                                   "--engine", engine, "--timeout", str(args.timeout)],
+                                  stderr=subprocess.PIPE, text=True)
+        try:
+            server.stderr.readline()    # "Serving on ..." once it's listening
+
+            def send(line):
+                start = time.perf_counter()
+                status, answer = solveserver.request("POST", "/codeword", json.loads(line), socketPath)
+                return time.perf_counter() - start, status
+
+            warm = [send(line)[0] for line in lines[:10]]
+            rows = [("fresh process", len(fresh), "%.1f" % (percentile(fresh, 0.5) * 1000),
+                     "%.1f" % (percentile(fresh, 0.99) * 1000), "%.1f" % (len(fresh) / sum(fresh))),
+                    ("server, 1 client", len(warm), "%.1f" % (percentile(warm, 0.5) * 1000),
+                     "%.1f" % (percentile(warm, 0.99) * 1000), "%.1f" % (len(warm) / sum(warm)))]
+
+            start = time.perf_counter()
+            with concurrent.futures.ThreadPoolExecutor(args.clients) as clients:
+                sent = list(clients.map(send, lines))
+            seconds = time.perf_counter() - start
+            latencies = [latency for latency, status in sent]
+            rows.append(("server, %d clients" % args.clients, len(sent),
+                         "%.1f" % (percentile(latencies, 0.5) * 1000), "%.1f" % (percentile(latencies, 0.99) * 1000),
+                         "%.1f" % (len(sent) / seconds)))
+            showTable(("solved by", "puzzles", "p50 ms", "p99 ms", "puzzles/s"), rows)
+            failed = sum(1 for latency, status in sent if status != 200)
+            if failed > 0:
+                print("%d requests failed" % failed)
+
+            status, metrics = solveserver.request("GET", "/metrics", None, socketPath)
+            print("\nServer metrics: %s" % json.dumps(metrics['kinds']['codeword']))
+        finally:
+            server.terminate()
+            server.wait()
+
+
+BENCHMARKS = {
+    'anagrams': benchAnagrams,
+    'backjumping': benchBackjumping,
+    'engines': benchEngines,
+    'filtercache': benchFilterCache,
+    'grids': benchGrids,
+    'memory': benchMemory,
+    'ordering': benchOrdering,
+    'propagation': benchPropagation,
+    'server': benchServer,
+    'startup': benchStartup,
+    'suite': benchSuite,
+    'themes': benchThemes,
+    'unique': benchUnique,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the word puzzle solvers.")
+    parser.add_argument("name", choices=sorted(BENCHMARKS), help="which benchmark to run")
+    parser.add_argument("--engines", default="bitset,regex", help="comma separated candidate engines")
+    parser.add_argument("--hints", action="store_true", help="use the setPuzzle() rubric rather than an empty one")
+    parser.add_argument("--many", action="store_true", help="look for all the solutions, not just the first")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per measurement (best is reported)")
+    parser.add_argument("--puzzles", default=SUITE_PUZZLES, help="suite, filtercache, unique: the puzzles (default %(default)s)")
+    parser.add_argument("--baseline", default=SUITE_BASELINE, help="suite: the baseline (default %(default)s)")
+    parser.add_argument("--save-baseline", action="store_true", help="suite: save this run as the baseline")
+    parser.add_argument("--limit", type=int, default=1000, help="suite, grids: most solutions to look for (default 1000)")
+    parser.add_argument("--queries", type=int, default=5000, help="anagrams: random queries (default 5000)")
+    parser.add_argument("--scan-queries", type=int, default=100,
+                        help="anagrams: queries for the slow ways (default 100)")
+    parser.add_argument("--timeout", type=float, default=30, help="suite, server, unique, grids: seconds per puzzle (default 30)")
+    parser.add_argument("--frequencies", metavar="FILE", help="ordering: word frequency file (see wordlayers.py)")
+    parser.add_argument("--sizes", default="7,11,15,21,21x15,25x13,31",
+                        help="grids: comma separated grid sizes, n or WxH (default %(default)s)")
+    parser.add_argument("--clients", type=int, default=4, help="server: clients sending at once (default 4)")
+    args = parser.parse_args()
+
+    BENCHMARKS[args.name](args, loadDictionary())
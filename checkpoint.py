@@ -0,0 +1,60 @@
+#!/usr/bin/python3
+# checkpoint.py
+# Saving a search part way through, so that a later run can pick it up where
+# it was rather than starting again (after the process was killed, say, or
+# ran out of time). A checkpoint is one JSON file, written to one side and
+# moved into place as wordcache does, so being killed while writing one
+# leaves the last one whole.
+#
+# What is in it is up to the solver (see XwordToSolve.saveCheckpoint). Here
+# it is tagged with a key for the search it is of, made from whatever
+# describes that search, and a checkpoint of any other search is ignored.
+
+import hashlib, json, os
+
+VERSION = 2
+
+# Seconds between checkpoints.
+DEFAULT_INTERVAL = 30.0
+
+
+def searchKey(description):
+    """
+    The key of a search, from a description of it (anything JSON can write).
+    """
+    return hashlib.sha1(json.dumps(description, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def save(path, key, state):
+    """
+    Write state (a dict JSON can write) to path as the checkpoint of the search with key.
+    """
+    tmpPath = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmpPath, "w") as checkpointFile:
+        json.dump({'version': VERSION, 'key': key, 'state': state}, checkpointFile)
+    os.replace(tmpPath, path)
+
+
+def load(path, key):
+    """
+    The state saved at path for the search with key, or None if there isn't
+    one (no file, one for another search, or one that can't be read).
+    """
+    try:
+        with open(path, "r") as checkpointFile:
+            saved = json.load(checkpointFile)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(saved, dict) or saved.get('version') != VERSION or saved.get('key') != key:
+        return None
+    return saved.get('state')
+
+
+def remove(path):
+    """
+    Remove the checkpoint at path, once the search it is of is over.
+    """
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -1,12 +1,26 @@
 #!/usr/bin/python3
-# codeword.py
-# Solve the the codeword puzzle
+# circlegram.py
+# Solve the circlegram puzzle
 #
 #
 # John Clarke, john@johnclarke.net
 # V0.1 2021-03-30
 
-import re, os, time
+import argparse, heapq, itertools, json, sys, time
+
+import themetable
+import wordcache
+import wordindex
+import wordlayers
+
+# Results kept when culling by theme.
+TOP_K = 10
+
+# The indexes the anagrams can be looked up in, by name.
+INDEXES = {
+    'anagram': wordindex.AnagramIndex,
+    'counts': wordindex.LetterCountIndex,
+}
 
 # This problem has three collections of letters:
 # each pair of collection share one ketter, and all theee share one.
@@ -20,55 +34,256 @@ def setPuzzle():
     puzzle += (('r', 'e', 'u', 'h', 'p', 'b'),)
     puzzle += (('b', 'g', 'm', 'a', 'r', 'e'),)
     puzzle += (('e', 'i', 't', 's', 'w', 'r'),)
-    
+
     return puzzle
 
 
 class CircleGramToSolve:
-    def __init__(self, starting_puzzle: tuple, base_dictionary: dict):
-        self.starting_puzzle = starting_grid
+    def __init__(self, starting_puzzle: tuple, base_dictionary):
+        """
+        starting_puzzle is the letters of each circle, without the shared
+        letter. base_dictionary is the word list, or one of the INDEXES
+        already built over it (so many puzzles can share one).
+        """
+        self.starting_puzzle = tuple(tuple("".join(circle).lower()) for circle in starting_puzzle)
         self.base_dictionary = base_dictionary
+        if hasattr(base_dictionary, 'anagramsMany'):
+            self.index = base_dictionary
+        else:
+            self.index = wordindex.AnagramIndex(base_dictionary)
+
+        self.verbose = False
+
+        # The themetable.ThemeTable to cull the results with (None for no
+        # culling) and how many to keep. With how many triples the last solve
+        # scored and how long it took.
+        self.themes = None
+        self.topK = TOP_K
+        self.triplesScored = 0
+        self.scoringTime = 0.0
+
+        # The event which tells a solve to stop where it is (a
+        # multiprocessing.Event, None for none), and whether the last one did.
+        self.cancelEvent = None
+        self.cancelled = False
+
+    def useThemes(self, themes, topK=TOP_K):
+        """
+        Keep only the topK results whose words have most in common, by the
+        themes in themes (a themetable.ThemeTable, None to keep them all).
+        """
+        self.themes = themes
+        self.topK = topK
 
-        self.verbose = True
-        
     class Result:
-        def __init__(self, solution_letter, three_words):
-            self.soltuion_letter = solution_letter
-            self.three_words = three_words
-        
-        def show():
+        def __init__(self, solution_letter, three_words, score=None):
+            self.solution_letter = solution_letter
+            self.three_words = tuple(three_words)
+            # How well the words go together (see themetable.py), if scored.
+            self.score = score
+
+        def show(self):
             print("Common Letter: "+self.solution_letter)
-            print("Three words: "+self.three_words
-            
-     def showResult(r: result):
-         CircleGramToSolve.Result.show(r)
-         
-     def solve():
-         results = list()
-         
-         # There are 26 possibilities for the unknown letter, just go through them and
-         # get anagram lists for each of the three letter combinations. If any combination
-         # yields zero words, then this solution letter is invalid. If the letter yields
-         # words for each of the three, create a potential result for each combination of
-         # words (with the shared letter)
-         
-         
-         # Now cull those where the words don't have a common theme.
-         
-         return results
+            print("Three words: "+", ".join(self.three_words))
+            if self.score != None:
+                print("Theme score: %g" % self.score)
+
+        def toDict(self):
+            result = {'letter': self.solution_letter, 'words': list(self.three_words)}
+            if self.score != None:
+                result['score'] = self.score
+            return result
+
+    def showResult(self, r: Result):
+        r.show()
+
+    def searchStopped(self):
+        """
+        True if the solve should stop where it is, as cancelEvent is set.
+        """
+        if self.cancelEvent != None and self.cancelEvent.is_set():
+            self.cancelled = True
+        return self.cancelled
+
+    def solve(self):
+        results = list()
+        self.cancelled = False
+
+        # There are 26 possibilities for the unknown letter, just go through them and
+        # get anagram lists for each of the three letter combinations. If any combination
+        # yields zero words, then this solution letter is invalid. If the letter yields
+        # words for each of the three, create a potential result for each combination of
+        # words (with the shared letter)
+        # All the lookups go to the index in one go, which is how a
+        # LetterCountIndex likes them.
+        circles = len(self.starting_puzzle)
+        anagrams = self.index.anagramsMany([circle + (letter,) for letter in wordindex.LETTERS
+                                            for circle in self.starting_puzzle])
+        if self.searchStopped():
+            return results
+        letterLists = list()
+        for i, letter in enumerate(wordindex.LETTERS):
+            wordLists = anagrams[i * circles:(i + 1) * circles]
+            if all(len(words) > 0 for words in wordLists):
+                if self.verbose:
+                    print("Letter %s gives %s" % (letter, " / ".join(",".join(words) for words in wordLists)))
+                letterLists.append((letter, wordLists))
+
+        if self.themes == None or circles != 3:
+            for letter, wordLists in letterLists:
+                if self.searchStopped():
+                    break
+                for three_words in itertools.product(*wordLists):
+                    results.append(CircleGramToSolve.Result(letter, three_words))
+            return results
+
+        # Now cull those where the words don't have a common theme: score the
+        # triples of each letter, a chunk at a time, and keep the best topK overall.
+        start = time.perf_counter()
+        self.triplesScored = 0
+        best = list()
+        for letter, wordLists in letterLists:
+            if self.searchStopped():
+                break
+            triples, scored = self.themes.topTriples(wordLists, self.topK)
+            self.triplesScored += scored
+            best.extend((score, letter, three_words) for score, three_words in triples)
+        best = heapq.nlargest(self.topK, best, key=lambda entry: entry[0])
+        if len(best) < self.topK:
+            # Too few triples share a theme (the table only has so many), so
+            # the rest come from those that don't, scoring 0, ranked last: a
+            # puzzle with answers is never left with none.
+            scored = set((letter, three_words) for score, letter, three_words in best)
+            for letter, wordLists in letterLists:
+                for three_words in itertools.product(*wordLists):
+                    if len(best) >= self.topK:
+                        break
+                    if (letter, three_words) not in scored:
+                        best.append((0.0, letter, three_words))
+        for score, letter, three_words in best:
+            results.append(CircleGramToSolve.Result(letter, three_words, score))
+        self.scoringTime = time.perf_counter() - start
+        if self.verbose:
+            print("Scored %s triples in %.6fs" % ("{:,}".format(self.triplesScored), self.scoringTime))
+
+        return results
+
+    def formableWords(self, letter, minLength=4):
+        """
+        For each circle, the words which can be made from some of its letters
+        and letter, at least minLength long: the circle's words when the full
+        anagram isn't in the dictionary. Needs a LetterCountIndex.
+        """
+        return self.index.query([circle + (letter,) for circle in self.starting_puzzle], minLength=minLength)
+
+
+# Batch solving: puzzles come in as JSON lines, each an object with the
+# letters of each circle as a string (or list of letters) and an optional id:
+#   {"id": "planets", "circles": ["mercry", "jpiter", "neptne"]}
+# and the results go out as JSON lines, in the same order:
+#   {"id": "planets", "status": "solved",
+#    "results": [{"letter": "u", "words": ["mercury", "jupiter", "neptune"]}], "seconds": ...}
+# status is "solved", "unsolved" (no letter works), "cancelled" (stopped by
+# cancelEvent, see solvePuzzle, with what it had got to) or "error" (with "error"
+# saying why). With a theme table the results are the best scoring few, each
+# with its "score" (0, after the rest, for words sharing no theme), and the
+# result has "triplesScored" and "scoringSeconds".
+
+def solvePuzzle(line, index, themes=None, topK=TOP_K, cancelEvent=None):
+    """
+    Solve one puzzle of a batch, given as its line of JSON, against index (one
+    of the INDEXES, shared by all the puzzles), culling by themes (a
+    themetable.ThemeTable, or None) if given. Returns the result as a dict
+    ready to be written out as JSON. The solve stops between letters if
+    cancelEvent (a multiprocessing.Event, or None) is set.
+    """
+    start = time.time()
+    result = {'id': None}
+    try:
+        puzzle = json.loads(line)
+        result['id'] = puzzle.get('id')
+        cgts = CircleGramToSolve(puzzle['circles'], index)
+        cgts.useThemes(themes, topK)
+        cgts.cancelEvent = cancelEvent
+        results = cgts.solve()
+        if cgts.cancelled:
+            result['status'] = 'cancelled'
+        else:
+            result['status'] = 'solved' if len(results) > 0 else 'unsolved'
+        result['results'] = [r.toDict() for r in results]
+        if themes != None:
+            result['triplesScored'] = cgts.triplesScored
+            result['scoringSeconds'] = round(cgts.scoringTime, 6)
+    except Exception as e:
+        # One bad puzzle shouldn't stop the rest of the batch.
+        result['status'] = 'error'
+        result['error'] = "%s: %s" % (type(e).__name__, e)
+    result['seconds'] = round(time.time() - start, 6)
+    return result
+
+
+def solveBatch(inputLines, output, dictionary, indexName='anagram', themes=None, topK=TOP_K, layers=()):
+    """
+    Solve a stream of puzzles (see above) from inputLines, writing each
+    result to output as it finishes, with one index (INDEXES[indexName])
+    over dictionary, with layers put in (see wordlayers.py), shared by every
+    puzzle, and culling by themes (a themetable.ThemeTable, or None) if given.
+    Returns the number of puzzles solved, and the time taken.
+    """
+    start = time.time()
+    index = wordlayers.applyLayers(INDEXES[indexName](dictionary), layers)
+    count = 0
+    for line in inputLines:
+        if len(line.strip()) == 0:
+            continue
+        output.write(json.dumps(solvePuzzle(line, index, themes, topK)) + "\n")
+        output.flush()
+        count += 1
+    return count, time.time() - start
+
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Solve circlegram puzzles: the sample in setPuzzle(), or a batch.")
+    parser.add_argument("--batch", metavar="FILE",
+                        help="solve the puzzles in FILE, JSON lines (see solveBatch), - for stdin")
+    parser.add_argument("--index", default='anagram', choices=sorted(INDEXES),
+                        help="what to look the anagrams up in (default %(default)s)")
+    parser.add_argument("--themes", nargs="?", const=themetable.DEFAULT_THEMES, metavar="FILE",
+                        help="keep only the answers whose words share a theme, from FILE (default themes.txt)")
+    parser.add_argument("--top", type=int, default=TOP_K, help="answers kept with --themes (default %(default)s)")
+    parser.add_argument("--layer", action="append", default=list(), metavar="FILE",
+                        help="add words to and take words out of the dictionary, from FILE (see wordlayers.py)")
+    parser.add_argument("--verbose", action="store_true", help="print the letters which work as they are found")
+    args = parser.parse_args()
 
     # Get the thing you need to solve it: the puzzle and the dictionary
-    puzze = setPuzzle()
-    dir_path = os.path.dirname(os.path.realpath(__file__))
-    with open(dir_path + "/ukenglish.txt", "r", encoding="latin-1") as myfile:
-        my_dictionary = myfile.read().splitlines()
+    my_dictionary = wordcache.loadDictionary()
+    themes = None
+    if args.themes != None:
+        themes = themetable.loadThemeTable(my_dictionary, args.themes)
+        if themes == None:
+            print("Theme scoring needs numpy, returning every answer", file=sys.stderr)
+
+    if args.batch != None:
+        if args.batch == "-":
+            count, seconds = solveBatch(sys.stdin, sys.stdout, my_dictionary, args.index, themes, args.top, args.layer)
+        else:
+            with open(args.batch, "r") as batchFile:
+                count, seconds = solveBatch(batchFile, sys.stdout, my_dictionary, args.index, themes, args.top,
+                                            args.layer)
+        print("%d puzzles in %.3fs: %.1f puzzles/second" % (count, seconds, count / max(seconds, 1e-9)),
+              file=sys.stderr)
+        sys.exit()
 
+    puzzle = setPuzzle()
 
     # Set up the class and solve
-    cgts = CircleGram(puzzle, my_dictionary)
+    cgts = CircleGramToSolve(puzzle, wordlayers.applyLayers(INDEXES[args.index](my_dictionary), args.layer))
+    cgts.verbose = args.verbose
+    cgts.useThemes(themes, args.top)
     results = cgts.solve()
+    if themes != None:
+        print("Scored %s triples in %.6fs" % ("{:,}".format(cgts.triplesScored), cgts.scoringTime))
 
     # Output results
     if (len(results) == 0) :
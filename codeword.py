@@ -6,7 +6,15 @@
 # John Clarke, john@johnclarke.net
 # V0.1 2021-03-30
 
-import re, os, time
+import argparse, concurrent.futures, itertools, json, multiprocessing, sys, time
+
+import alldifferent
+import checkpoint
+import nogoods
+import searchstats
+import wordcache
+import wordindex
+import wordlayers
 
 # Set the puzzle, at present a hand encoded version of a sample puzzle.
 # Ideally this will somehow aut import a puzzled from a puzzle source and encode it.
@@ -19,6 +27,24 @@ SQ_UNSET = -1 # Awaiting a letter but with no hint as to what that letter is.
 
 LIST_UNSET = -1
 
+# The fewest squares in a run which make it a word; shorter runs are left to
+# be solved by the words crossing them.
+MIN_WORD_LENGTH = 4
+
+# A rubric kept for later (in a solution) is packed into bytes: the letter of
+# code n at n, 0 where the code has no letter. Room for codes 1 to 26 to start with.
+RUBRIC_SLOTS = 27
+
+def packRubric(rubric):
+    packed = bytearray(max(RUBRIC_SLOTS, max(rubric, default=0) + 1))
+    for code, letter in rubric.items():
+        packed[code] = ord(letter)
+    return bytes(packed)
+
+def unpackRubric(packed):
+    return {code: chr(letter) for code, letter in enumerate(packed) if letter}
+
+
 def setPuzzle():
     """
     Returns a tuple of tuples containing the puzzle to be solved
@@ -48,7 +74,12 @@ def setPuzzle():
 
 
 class WordToSolve:
-    def __init__(self, x, y, direction, wordInCode, candidateWordsList=None):
+    # A search has a few dozen of these live and makes a copy of each for every
+    # solution it keeps, so they don't carry a __dict__ each.
+    __slots__ = ('posX', 'posY', 'direction', 'wordInCode', 'length', 'codePositions', 'engine',
+                 'candidates', 'numberCandidateWords', 'prunedBy', 'index', 'crossings')
+
+    def __init__(self, x, y, direction, wordInCode, candidateWordsList=None, engine=None):
         # Integers with the start position and direction of the first letter and the word.
         # Different puzzle tpyes can and will use this differently.
         self.posX = x
@@ -59,9 +90,26 @@ class WordToSolve:
         # The word as a array of numbers, the numbers which represent a letter, known or unknown.
         self.wordInCode = wordInCode.copy()
         self.length = len(self.wordInCode)
+        # Each different code in the word, with the position it first turns up at.
+        self.codePositions = list()
+        for pos, code in enumerate(self.wordInCode):
+            if code not in self.wordInCode[:pos]:
+                self.codePositions.append((code, pos))
+        # The engine (see wordindex.py) which holds and filters the candidate words.
+        # The candidates are in whatever form the engine uses.
+        self.engine = engine
         # The dictionary from which this word must come. If None, use the overall puzzle one
-        self.candidateWordsList = None
+        self.candidates = None
+        self.numberCandidateWords = LIST_UNSET
         self.setCandidateWordsList(candidateWordsList)
+        # While searching, a mask of the depths whose candidates took candidates away
+        # from this word (bit d for depth d), see XwordToSolve.generateSolutions.
+        self.prunedBy = 0
+        # While searching, where this word is in the search's word list, see
+        # XwordToSolve.propagateDomains.
+        self.index = -1
+        # The words which cross this one on a grid, see CodewordToSolve.crossWords.
+        self.crossings = tuple()
 
     def string(self):
         return "at "+"{:,}".format(self.posX)+", "+"{:,}".format(self.posY)+" "+self.direction+"; "+"["+",".join(str(c) for c in self.wordInCode)+"]"
@@ -82,69 +130,46 @@ class WordToSolve:
             depth = depth + 1
 
     def copy(self):
-        return WordToSolve(self.posX, self.posY, self.direction, self.wordInCode, self.candidateWordsList)
+        # The code word and its positions never change once made, so the copy shares them.
+        newWTS = WordToSolve.__new__(WordToSolve)
+        for name in WordToSolve.__slots__:
+            setattr(newWTS, name, getattr(self, name))
+        return newWTS
+
+    @property
+    def candidateWordsList(self):
+        # The candidates as a list of words, whatever the engine holds them as.
+        if self.candidates is None:
+            return None
+        return self.engine.wordList(self.wordInCode, self.candidates)
 
     def setCandidateWordsList(self, candidateWordsList):
         if candidateWordsList == None :
-            self.candidateWordsList = None
-            self.numberCandidateWords = LIST_UNSET
+            self.setCandidates(None)
         else :
-            self.candidateWordsList = candidateWordsList.copy()
-            self.numberCandidateWords = len(self.candidateWordsList)
+            self.setCandidates(self.engine.fromWords(self.wordInCode, candidateWordsList))
+
+    def setCandidates(self, candidates):
+        self.candidates = candidates
+        if candidates is None:
+            self.numberCandidateWords = LIST_UNSET
+        else:
+            self.numberCandidateWords = self.engine.count(self.wordInCode, candidates)
 
     def numberOfCandidates(self):
         return self.numberCandidateWords
 
-    # finds the matches for this wordInCode, from within the supplied list, or it's own if none provided
+    # finds the matches for this wordInCode, from within the supplied candidates (as held
+    # by the engine), or it's own if none provided
     # it then updteas its list to the new collection of candidate words.
-    # KNOWN ISSUE: The inital lists above have not culled candidate words which allocate the same letter
-    #              to different numbers. I cannot see how to do this, iwith my kowledge of regex.
     def updateCandidateList(self, rubric, newCandidateWordsList=None, verbose=False):
-        if newCandidateWordsList == None:
-            newCandidateWordsList = self.candidateWordsList
-        if newCandidateWordsList == None:
+        if newCandidateWordsList is None:
+            newCandidateWordsList = self.candidates
+        if newCandidateWordsList is None:
             print("WordToSolve.updateMatched FAIL - no wordlist to select word from")
             return
 
-        # build the match for letters which are not known - they can be any letter
-        # except an already used one. The brackets make it a capture group, so
-        # so repeats can be used to reduce further search space.
-        if len(rubric) == 0 :
-            unknown_r = 'A-Za-z'
-        else :
-            unknown_r = '^'
-            for letter in rubric.values() :
-                unknown_r += letter
-
-        # Keep a track of the unkonwns already seen
-        seen_unknowns = list()
-    
-        # Build the regex string
-        r = '^'                 # Regex for start of string
-        anyclue = False         # Indicates whether we know any letters yet
-
-        for code in self.wordInCode:      # Each code number in the codes list
-            letter = rubric.get(code)       # Return any matches from the rubric dictionary (if we know the code)
-            if letter != None:
-                r += letter
-                anyclue = True
-            else:
-                if seen_unknowns.count(code) == 0 :
-                    # Haven't seen this number yet, so it is unknown, and won't
-                    # have previously been macthed
-                    r += '([' + unknown_r + '])'
-                    seen_unknowns.append(code)
-                else :
-                    # This unknown is the same as a previous unkown, so match to
-                    # whatever that macthed to.
-                    r += "\\{}".format(seen_unknowns.index(code)+1)
-
-        r += "$"                # Regex for end of string
-
-        if verbose:
-            print("r for", self.wordInCode, " is ", r)
-
-        self.setCandidateWordsList(list(filter(lambda x : re.match(r, x) != None, newCandidateWordsList)))
+        self.setCandidates(self.engine.filter(self.wordInCode, newCandidateWordsList, rubric, verbose))
 
 
 
@@ -155,97 +180,417 @@ it can serve for other problems of a similar type.
 """
         
 class XwordToSolve:
-    def __init__(self, starting_rubric: dict):
+    def __init__(self, starting_rubric: dict, engine: str = wordindex.WordIndex.name):
         if starting_rubric == None:
             self.starting_rubric = dict()
         else:
-            self.starting_rubric = starting_rubric.copy
-
-        self.verbose = True
-        self.veryVerbose = True
+            self.starting_rubric = starting_rubric.copy()
+
+        # Name of the candidate engine to use, see wordindex.ENGINES
+        self.engineName = engine
+        self.engine = None
+
+        # Printing as the search goes, for debugging. For what a search did
+        # without the cost of printing it, see collectStats.
+        self.verbose = False
+        self.veryVerbose = False
+        self.wantStats = False
+        self.trace = None
+        self.stats = None
+
+        # Whether to narrow down the letters each code can be (its domain, a mask
+        # of letters as in wordindex) after each candidate is tried, see propagateDomains.
+        self.forwardChecking = True
+        self.domains = dict()
+        # Which words each code turns up in, see prepareSearch.
+        self.wordsWithCode = dict()
+        # The letters the rubric uses, as a mask, kept up to date as letters go in and come out.
+        self.usedMask = 0
+        # Whether forward checking also prunes the domains so that every code can
+        # get a different letter, see pruneAllDifferent. With what it costs.
+        self.allDifferent = True
+        self.allDifferentCalls = 0
+        self.allDifferentPrunes = 0
+        self.allDifferentTime = 0.0
+        # Memory budget of the cache of filtered candidates (0 for no cache),
+        # see wordindex.FilterCache. Off by default: with the bitset engine a
+        # filter costs about what a cache lookup does, and the other engines
+        # are slower with it (benchmark.py filtercache). The cache is made
+        # when a search starts, unless one for the same engine has been given
+        # (so that it can be shared between solvers).
+        self.filterCacheBytes = 0
+        self.filterCache = None
+
+        # Whether a dead end jumps straight back over the depths which had nothing
+        # to do with it (conflict-directed backjumping), and the most nogoods to
+        # learn from them (0 for none), see generateSolutions. With how often each
+        # happened in the last search. The nogoods are off by default: on the
+        # benchmark puzzles none of them ever came up again (benchmark.py backjumping).
+        self.backjumping = True
+        self.nogoodLimit = 0
+        self.nogoods = None
+        self.backjumps = 0
+        self.nogoodPrunes = 0
+        # The bookkeeping for it: the depths that explain the last failure, the
+        # depths that explain each code's letter and each code's domain, and the
+        # code = letter pairs each depth put in. Masks of depths, bit d for depth d.
+        self.conflict = 0
+        self.codeMasks = dict()
+        self.domainMasks = dict()
+        self.depthPairs = dict()
+
+        # Number of candidate words tried during the last solve.
+        self.nodesVisited = 0
+
+        # The most solutions to search for (None for all of them), whether to
+        # keep the ones found or only count them (see countSolutions), and how
+        # many the last search found.
+        self.solutionLimit = None
+        self.keepSolutions = True
+        self.solutionsFound = 0
+        self.countedSolutions = list()
+
+        # Number of processes to search with, and (in a worker) the event which
+        # tells it the search is over.
+        self.workers = 1
+        self.cancelEvent = None
+
+        # Seconds the search may take (None for as long as it takes), and whether
+        # the last one ran out of time.
+        self.timeLimit = None
+        self.deadline = None
+        self.timedOut = False
+
+        # The rubric with the most codes given letters that the last search got
+        # to with every word still having candidates (packed, see packRubric):
+        # what a search which runs out of time has to show for itself.
+        self.bestPartial = bytes()
+        self.bestPartialSize = 0
+
+        # The file to checkpoint the search to as it goes (None for none), so
+        # that if it is stopped a later solve carries on where it was, and the
+        # seconds between checkpoints, see saveCheckpoint. With the solutions
+        # found since the search started, to go in the checkpoint.
+        self.checkpointPath = None
+        self.checkpointInterval = checkpoint.DEFAULT_INTERVAL
+        self.checkpointKey = None
+        self.nextCheckpoint = 0.0
+        self.checkpointSolutions = list()
 
     def setWordsToSolve(self, start_wts_list):
         self.start_wts_list = start_wts_list.copy()
 
+    def collectStats(self, trace=None):
+        """
+        Collect a searchstats.SearchStats for each search from now on, left in
+        self.stats when it is done. If trace (a file open for text) is given
+        each node is written to it as a line of JSON as well.
+        """
+        self.wantStats = True
+        self.trace = trace
+
     def setBaseDictionary(self, base_dictionary):
+        """
+        Set the dictionary to solve from. This can be a list of words or an
+        engine from wordindex which has already been built (so that many
+        puzzles can share one index).
+        """
         self.base_dictionary = base_dictionary
+        self.engine = wordindex.makeEngine(self.engineName, base_dictionary)
 
     class Solution:
-        # Used for storing a solution ...
-        def __init__ (self, solvedWordList, solvedRubric):
-            self.solvedWordList = solvedWordList.copy()
-            self.solvedRubric = solvedRubric.copy()
-
-
-    def showRubric(self, rubric=None):
+        # Used for storing a solution ... A search can keep thousands of these,
+        # so each holds only its rubric, packed (see packRubric), and the words
+        # solved, shared with every other solution of the same search. The
+        # rubric as a dict and the solved words are made when asked for.
+        __slots__ = ('words', 'packedRubric')
+
+        def __init__ (self, words, solvedRubric):
+            self.words = words
+            self.packedRubric = packRubric(solvedRubric)
+
+        @property
+        def solvedRubric(self):
+            return unpackRubric(self.packedRubric)
+
+        @property
+        def solvedWordList(self):
+            # Each word fixed to the word its codes spell.
+            rubric = self.solvedRubric
+            solvedWordList = list()
+            for wts in self.words:
+                solved = wts.copy()
+                solved.setCandidateWordsList(["".join(rubric[code] for code in wts.wordInCode)])
+                solvedWordList.append(solved)
+            return solvedWordList
+
+
+    def showRubric(self, rubric=None, domains=None):
+        """
+        Show the number to letter rubric. If domains (code -> letter mask) are
+        given, the letters still possible for each code which hasn't been
+        solved but has been narrowed down are listed underneath.
+        """
         if rubric == None :
             rubric = self.starting_rubric
 
+        # Codes 1 to 26, or as many as the puzzle has, 13 to a row.
+        lastCode = max(26, max(rubric, default=0), max(domains or (), default=0),
+                       max(self.wordsWithCode, default=0))
         print("+--"*13,end="+\n")
-        for j in [0,13] :
+        for j in range(0, lastCode, 13) :
+            codes = range(j+1, min(j+13, lastCode)+1)
             print(end="|")
-            for i in range(1,14) :
-                print(f"{j+i:2d}", end="|")
+            for code in codes :
+                print(f"{code:2d}", end="|")
             print()
             print(end="|")
-            for i in range(1,14) :
-                letter = rubric.get(j+i)
+            for code in codes :
+                letter = rubric.get(code)
                 if letter == None:
                     letter = '  '
                 else:
                     letter = ' '+letter.capitalize()
                 print(letter,end="|")
             print()
-            print("+--"*13,end="+\n")
-
-    def solve(self, multipleResults=False):
+            print("+--"*len(codes),end="+\n")
+
+        if domains != None:
+            used = 0
+            for letter in rubric.values():
+                used |= wordindex.LETTER_BIT[letter]
+            for code in sorted(domains):
+                mask = domains[code]
+                if rubric.get(code) == None and mask != wordindex.ALL_LETTERS & ~used:
+                    print("%2d could be %s" % (code, wordindex.maskLetters(mask).upper() or "---"))
+
+    def solve(self, multipleResults=False, workers=None):
+        """
+        Solve the words, returning a list of XwordToSolve.Solution. With
+        multipleResults False the search stops at the first solution found.
+        workers is the number of processes to search with (default
+        self.workers), see solveInParallel.
+        """
         self.multipleResults = multipleResults
-        if self.verbose:
-            print ("Initial list of words to solve, will have no solutions yet")
-            WordToSolve.showList(self.start_wts_list)
+        if workers == None:
+            workers = self.workers
 
         start1 = time.time()
-        
-        # For each word in word_list, generate a list of all possible matches, based on the letters we know so far
-        dictionary_by_word_length = dict()
-
-        # Create the initial list of allowed words for each word if it hasn't been given.
-        for wts in self.start_wts_list:
-            if wts.candidateWordsList == None:
-                dictionary_subset = dictionary_by_word_length.get(wts.length)
-                if dictionary_subset == None :
-                    r = "^" + "."*wts.length + "$"
-                    dictionary_subset = list(filter(lambda x : re.match(r, x) != None, my_dictionary))
-                    dictionary_by_word_length[wts.length] = dictionary_subset
-                wts.updateCandidateList(rubric, dictionary_subset, self.veryVerbose)
-                if wts.numberOfCandidates() == 0 :
-                    print("One of the words has no options at all before even starting. Stopping now.")
-                    exit()
-
-        # order by number of possible solutions
-        self.start_wts_list.sort(key=WordToSolve.numberOfCandidates)
+        rubric = self.prepareSearch()
+        if rubric == None:
+            return list()
 
         start2 = end1 = time.time()
 
         # And recurse to a soltuion
+        self.deadline = None if self.timeLimit == None else time.monotonic() + self.timeLimit
         result = list()
-        self.recurseThroughAllCandidates(self.start_wts_list, rubric, 0, result)
+        if workers > 1:
+            result = self.solveInParallel(workers)
+        else:
+            resume = None
+            if self.checkpointPath != None:
+                resume = self.resumeCheckpoint(result)
+            self.recurseThroughAllCandidates(self.start_wts_list, rubric, 0, result, resume)
+            if self.checkpointPath != None and not self.timedOut:
+                checkpoint.remove(self.checkpointPath)
 
         end2 = time.time()
 
+        self.setupTime = end1 - start1
+        self.searchTime = end2 - start2
+        if self.stats != None:
+            self.stats.finish(self.setupTime, self.searchTime, self.timedOut, self.filterCacheCounters(),
+                              self.backjumps, self.nogoodCounters())
         if self.veryVerbose :
             print("Parsing and getting first long list of word options: ", end1 - start1)
             print("Rescursion / solving: ", end2 - start2)
+            print("Candidates tried: %s (%s per second)" %
+                  ("{:,}".format(self.nodesVisited),
+                   "{:,.0f}".format(self.nodesVisited / max(self.searchTime, 1e-9))))
+            if self.allDifferentCalls > 0:
+                print("All different pruning: %s calls, %s letters removed, %.3fs" %
+                      ("{:,}".format(self.allDifferentCalls), "{:,}".format(self.allDifferentPrunes), self.allDifferentTime))
+            if self.backjumping:
+                print("Backjumps: %s, nogood prunes: %s" % ("{:,}".format(self.backjumps), "{:,}".format(self.nogoodPrunes)))
+            if self.filterCache != None:
+                print("Filter cache: %(hits)s hits, %(misses)s misses, %(evictions)s evictions, "
+                      "%(entries)s entries in %(bytes)s bytes" % self.filterCacheCounters())
 
         return result
 
+    def countSolutions(self, maxCount=None, workers=None):
+        """
+        Count the solutions, stopping as soon as there are maxCount of them
+        (None to search the whole tree). Rather than a Solution each, only
+        the packed rubrics of the solutions counted are kept, in
+        self.countedSolutions, and none at all with maxCount None, so the
+        memory it takes doesn't grow with the number of solutions. Returns
+        the count, which is only how many were found in time if
+        self.timedOut.
+        """
+        self.solutionLimit = maxCount
+        self.keepSolutions = maxCount != None
+        try:
+            solutions = self.solve(True, workers)
+        finally:
+            self.solutionLimit = None
+            self.keepSolutions = True
+        self.countedSolutions = [solution.packedRubric for solution in solutions]
+        return self.solutionsFound
+
+    def iter_solutions(self, limit=None, deadline=None):
+        """
+        Solve the words, yielding each XwordToSolve.Solution as soon as it is
+        found rather than when the whole tree has been searched. Stops after
+        limit solutions (None for all of them), or at deadline (a time.time()
+        value; None for self.timeLimit from now, if set). Whether it ran out
+        of time is in self.timedOut.
+
+        The consumer can stop early (break, or close() the iterator) and the
+        rest of the tree is never explored.
+
+        With a checkpoint (see saveCheckpoint) it carries on from there,
+        first yielding the solutions found before it was written, and
+        removes it once the whole tree has been searched; a consumer that
+        stops early leaves the last checkpoint for next time.
+        """
+        self.multipleResults = True
+        self.solutionLimit = None
+        self.keepSolutions = True
+        start = time.time()
+        rubric = self.prepareSearch()
+        if rubric == None or limit == 0:
+            return
+        self.setupTime = time.time() - start
+
+        if deadline != None:
+            self.deadline = time.monotonic() + (deadline - time.time())
+        else:
+            self.deadline = None if self.timeLimit == None else time.monotonic() + self.timeLimit
+
+        found = 0
+        resumed = list()
+        resume = None
+        if self.checkpointPath != None:
+            resume = self.resumeCheckpoint(resumed)
+        solutions = self.generateSolutions(self.start_wts_list, rubric, 0, resume)
+        try:
+            for solution in itertools.chain(resumed, solutions):
+                yield solution
+                found += 1
+                if limit != None and found >= limit:
+                    return
+            if self.checkpointPath != None and not self.timedOut:
+                checkpoint.remove(self.checkpointPath)
+        finally:
+            # Puts the words and rubric back, however the consumer stopped.
+            solutions.close()
+            self.searchTime = time.time() - start - self.setupTime
+            if self.stats != None:
+                self.stats.finish(self.setupTime, self.searchTime, self.timedOut, self.filterCacheCounters(),
+                                  self.backjumps, self.nogoodCounters())
+
+    def prepareSearch(self):
+        """
+        Get ready to search: the first candidates of each word, the code
+        domains and the words sorted fewest candidates first. Returns the
+        rubric to search from, or None if the words can't be solved at all,
+        or there aren't any (a grid with no run long enough to be a word).
+        """
+        if self.verbose:
+            print ("Initial list of words to solve, will have no solutions yet")
+            WordToSolve.showList(self.start_wts_list)
+
+        rubric = self.starting_rubric.copy()
+        self.nodesVisited = 0
+        self.solutionsFound = 0
+        self.bestPartial = packRubric(rubric)
+        self.bestPartialSize = len(rubric)
+        if not self.filterCacheBytes:
+            self.filterCache = None
+        elif self.filterCache == None or self.filterCache.engine is not self.engine:
+            self.filterCache = wordindex.FilterCache(self.engine, self.filterCacheBytes)
+        self.stats = searchstats.SearchStats(self.trace) if self.wantStats else None
+        self.allDifferentCalls = 0
+        self.allDifferentPrunes = 0
+        self.allDifferentTime = 0.0
+        self.backjumps = 0
+        self.nogoodPrunes = 0
+        self.nogoods = None
+        if self.backjumping and self.nogoodLimit:
+            self.nogoods = nogoods.NogoodStore(self.nogoodLimit)
+        self.depthPairs = dict()
+        self.timedOut = False
+        if len(self.start_wts_list) == 0:
+            if self.verbose:
+                print("There are no words to solve. Stopping now.")
+            return None
+
+        # For each word in word_list, generate a list of all possible matches, based on the letters we know so far
+        # Create the initial list of allowed words for each word if it hasn't been given.
+        # These come from the dictionary words with the same repeat signature as the
+        # code word (see wordindex.signature), so the only letter clashes left to find
+        # are between different words.
+        for wts in self.start_wts_list:
+            wts.engine = self.engine
+            if wts.candidates is None:
+                dictionary_subset = self.engine.initialCandidates(wts.wordInCode)
+                wts.updateCandidateList(rubric, dictionary_subset, self.veryVerbose)
+                if wts.numberOfCandidates() == 0 :
+                    if self.verbose:
+                        print("One of the words has no options at all before even starting. Stopping now.")
+                    return None
+
+        # Which words each code turns up in, and what letters each code could be
+        # given the rubric so far.
+        self.trail = list()
+        self.wordsWithCode = dict()
+        for wts in self.start_wts_list:
+            for code, pos in wts.codePositions:
+                self.wordsWithCode.setdefault(code, list()).append(wts)
+        self.domains = self.startingDomains(rubric)
+        self.usedMask = 0
+        for letter in rubric.values():
+            self.usedMask |= wordindex.LETTER_BIT[letter]
+        # Nothing before the search starts is down to a choice the search made.
+        self.codeMasks = {code: 0 for code in rubric}
+        self.domainMasks = {code: 0 for code in self.wordsWithCode}
+        for i, wts in enumerate(self.start_wts_list):
+            wts.prunedBy = 0
+            wts.index = i
+        if self.forwardChecking and not self.propagateDomains(self.start_wts_list, rubric, -1):
+            if self.verbose:
+                print("The codes can't all be given a letter, before even starting. Stopping now.")
+            return None
+
+        # order by number of possible solutions, the words crossing most others first among equals
+        self.start_wts_list.sort(key=XwordToSolve.orderKey)
+        for i, wts in enumerate(self.start_wts_list):
+            wts.index = i
+        # The words the solutions are of, shared by all of them.
+        self.solutionWords = tuple(self.start_wts_list)
+        self.bestPartial = packRubric(rubric)
+        self.bestPartialSize = len(rubric)
+
+        self.searchRubric = rubric
+        self.timedOut = False
+        return rubric
+
     # Actually do the exhaustive search
-    # 
+    #
+    # The search works on one set of state which it changes in place: the
+    # rubric (letterList), the order of wordToSolveList and each word's
+    # candidates. Every change is recorded on self.trail, and undone from it
+    # when the candidate that caused it is done with, so a node costs only the
+    # filtering it does rather than a copy of every word.
+    #
     # depth: the first call will have this at 0 meaning that the start
     #        all_word_candidates list has beed created and sorted but no
     #        examinataion of it has been done
     # letterList: the letter list currently being used / evaluated.
-    # all_wc: the collection of word clues and current options being explored.
+    # wordToSolveList: the words being solved. Those before depth have been
+    #        fixed to one word, those after are sorted fewest options first.
     #
     # returns:
     # On failure False ; resultList will be an empty list
@@ -254,153 +599,928 @@ class XwordToSolve:
                                     wordToSolveList,
                                     letterList,
                                     depth,
-                                    resultList):
+                                    resultList,
+                                    resume=None):
+        haveFoundSomething = False
+        solutions = self.generateSolutions(wordToSolveList, letterList, depth, resume)
+        for solution in solutions:
+            if self.keepSolutions:
+                resultList.append(solution)
+            haveFoundSomething = True
+            if self.multipleResults == False or self.solutionLimitReached():
+                # Closing it undoes the trail back to where we started.
+                solutions.close()
+                break
+        return haveFoundSomething
+
+    class SearchFrame:
+        # One depth of the search stack (see generateSolutions): the candidates
+        # of the word at depth, the next of them to try, the length of the trail
+        # before the one being tried went in, the depths its failures are down
+        # to so far, and whether anything below worked out.
+        __slots__ = ('depth', 'candidates', 'next', 'trailMark', 'conflicts', 'found')
+
+        def __init__(self, depth, wordToSolve, trailMark):
+            self.depth = depth
+            self.candidates = wordToSolve.candidateWordsList
+            self.next = 0
+            self.trailMark = trailMark
+            self.conflicts = wordToSolve.prunedBy
+            self.found = False
+
+    # The search itself, as a generator yielding each XwordToSolve.Solution
+    # when it gets to it. Nothing below is searched until the next one is asked
+    # for, and if the generator is closed part way through, the trail is undone
+    # on the way out so the state is as it was.
+    #
+    # The search keeps its own stack of depths (XwordToSolve.SearchFrame)
+    # rather than recursing, so there is no limit to how many words it can go
+    # down through, and where it has got to can be written out as it goes and
+    # picked up again later (resume, see saveCheckpoint).
+    #
+    # With self.backjumping, each failure comes with the depths that explain
+    # it (a conflict set, as a mask with bit d for depth d): the depths whose
+    # letters ruled out the word that ran out of candidates, or everything up to
+    # here where propagation was involved (it doesn't say why). If a failure
+    # below doesn't involve a depth, trying that word's other candidates
+    # can't help, so the search jumps straight back to the deepest depth that
+    # is involved. A depth with every candidate failed hands up the union of
+    # their conflict sets, and the code = letter pairs placed at those depths
+    # are recorded as a nogood if there are few enough of them.
+    #
+    # returns: the conflict set once all the candidates have failed, or None if
+    # there were solutions below (or the search was stopped), when there is
+    # nothing to jump over.
+    def generateSolutions(self,
+                          wordToSolveList,
+                          letterList,
+                          depth,
+                          resume=None):
+        stats = self.stats
+        backjumping = self.backjumping
+        lastDepth = len(wordToSolveList) - 1
+        startMark = len(self.trail)
+        try:
+            if resume == None:
+                stack = [self.enterDepth(wordToSolveList, depth)]
+            else:
+                stack = self.resumeStack(wordToSolveList, letterList, depth, resume)
+
+            while True:
+                frame = stack[-1]
+                depth = frame.depth
+                if frame.next < len(frame.candidates) and self.searchStopped():
+                    # Everything above stops too, with nothing to jump over.
+                    if self.checkpointPath != None:
+                        self.saveCheckpoint(stack)
+                    return None
+
+                if frame.next == len(frame.candidates):
+                    # If we get here, we've failed to find a valid word for this level
+                    # and so we need to go back up a level and try again.
+                    result = self.depthFailed(frame)
+                else:
+                    if self.checkpointPath != None and time.monotonic() >= self.nextCheckpoint:
+                        self.saveCheckpoint(stack)
+
+                    # Try all the words this answer might be for the current scenario
+                    wordToSolve = wordToSolveList[depth]
+                    depthBit = 1 << depth
+                    candidate = frame.candidates[frame.next]
+                    frame.next += 1
+                    self.nodesVisited += 1
+                    if self.verbose:
+                        print("\nTrying %s for word %s at depth %d" % (candidate, wordToSolve.string(), depth))
+                    if stats != None:
+                        filterStart = time.perf_counter()
+                        candidatesBelow = sum(wts.numberCandidateWords for wts in wordToSolveList[depth + 1:])
+
+                    # Put the candidate's letters into the rubric, then apply the rubric to all the
+                    # words (one at a time) that are after this one. If any of them then gives a zero
+                    # option, it means that this substitutaion has failed. If it hasn't failed, keep
+                    # digging deeper.
+
+                    # You might thinkg that if one of them gives one option, it means we have
+                    # a definite
+                    # part of the answer. But that's not the case. It might only have one answer
+                    # because of a previous but wrong substitution. The sorting means that we will
+                    # dive down the "single option" levels quickly and see if when we make those
+                    # substitutions they provide options for lower levles. Or not.
+                    frame.trailMark = len(self.trail)
+                    self.conflict = (depthBit << 1) - 1
+                    exploreMore = (self.assignCandidate(letterList, candidate, wordToSolve.wordInCode, depthBit) and
+                                   self.filterWordsBelow(wordToSolveList, letterList, depth, candidate, frame.trailMark))
+                    if stats != None:
+                        stats.node(depth, candidate, exploreMore,
+                                   candidatesBelow - sum(wts.numberCandidateWords for wts in wordToSolveList[depth + 1:]),
+                                   time.perf_counter() - filterStart)
+                    if exploreMore and len(letterList) > self.bestPartialSize:
+                        self.bestPartial = packRubric(letterList)
+                        self.bestPartialSize = len(letterList)
+
+                    # If the word we've just put in is actually the word for the final
+                    # one to be solved, we have succeeded (but we did have to put it in, hence this
+                    # is after the line above.)
+                    if exploreMore and depth == lastDepth:
+                        if self.verbose :
+                            print("Got to the last word in the puzzle with no failures = found a solution")
+                        if stats != None:
+                            stats.solution(depth)
+                        frame.found = True
+                        self.solutionsFound += 1
+                        solution = XwordToSolve.Solution(self.solutionWords, letterList)
+                        if self.checkpointPath != None and self.keepSolutions:
+                            self.checkpointSolutions.append(solution.packedRubric)
+                        yield solution
+                        self.undoTrail(wordToSolveList, letterList, frame.trailMark)
+                        continue
+
+                    # Otherwise Look at the subsequent layers (word candidates) and
+                    # find one that doesn't fail.
+                    if exploreMore:
+                        # All the lower levels have at least one option, so let's explore them
+                        stack.append(self.enterDepth(wordToSolveList, depth + 1))
+                        continue
+
+                    if self.verbose :
+                        print("That's a branch with no solutions on it")
+                    failed = self.conflict
+                    if not backjumping or failed & depthBit:
+                        frame.conflicts |= failed & ~depthBit
+                        self.undoTrail(wordToSolveList, letterList, frame.trailMark)
+                        continue
+                    # This depth had nothing to do with it, so nor will its other candidates.
+                    if self.verbose:
+                        print("Jumping back from depth %d" % depth)
+                    self.backjumps += 1
+                    result = failed
+
+                # This depth is done with, and result is what it came to: hand it up
+                # the stack, jumping back over the depths it has nothing to do with.
+                stack.pop()
+                while len(stack) > 0:
+                    parent = stack[-1]
+                    self.undoTrail(wordToSolveList, letterList, parent.trailMark)
+                    if result == None:
+                        parent.found = True
+                    elif not result & (1 << parent.depth):
+                        if self.verbose:
+                            print("Jumping back from depth %d" % parent.depth)
+                        self.backjumps += 1
+                        stack.pop()
+                        continue
+                    else:
+                        parent.conflicts |= result & ~(1 << parent.depth)
+                    break
+                if len(stack) == 0:
+                    return result
+        finally:
+            self.undoTrail(wordToSolveList, letterList, startMark)
+
+    def enterDepth(self, wordToSolveList, depth):
+        """
+        The search stack's frame for starting on the candidates at depth.
+        """
         if self.verbose:
             print("===== Ordered list incoming at depth %d =====" % depth)
             WordToSolve.showList(wordToSolveList)
-    
-        # Try all the words this answer might be for the current scenario
         wordToSolve = wordToSolveList[depth]
-        haveFoundSomething = False;
-        for candidate in wordToSolve.candidateWordsList:
-            if self.verbose:
-                print("\nTrying %s for word %s at depth %d" % (candidate, wordToSolve.string(), depth))
+        if self.stats != None:
+            self.stats.expand(depth, wordToSolve)
+        return XwordToSolve.SearchFrame(depth, wordToSolve, len(self.trail))
+
+    def depthFailed(self, frame):
+        """
+        What the depth of frame comes to once all its candidates have been
+        tried: None if something below it worked (or there's no backjumping),
+        otherwise its conflict set, which is learnt as a nogood if there are nogoods.
+        """
+        if self.verbose :
+            print("Depth %d completed one way or another, going back up a step" % frame.depth)
+        if frame.found or not self.backjumping:
+            return None
+        conflicts = frame.conflicts
+        if self.nogoods != None and conflicts != 0:
+            pairs = list()
+            mask = conflicts
+            while mask and len(pairs) <= self.nogoods.maxPairs:
+                bit = mask & -mask
+                mask ^= bit
+                pairs.extend(self.depthPairs[bit.bit_length() - 1].items())
+            self.nogoods.add(pairs)
+        return conflicts
+
+    def resumeStack(self, wordToSolveList, letterList, depth, frames):
+        """
+        Rebuild the search stack from depth down saved in a checkpoint (see
+        saveCheckpoint), putting back the candidate each depth was on.
+        """
+        stack = list()
+        for saved in frames:
+            frame = self.enterDepth(wordToSolveList, depth)
+            frame.next = saved['next']
+            frame.conflicts = saved['conflicts']
+            frame.found = saved['found']
+            stack.append(frame)
+            if frame.next > len(frame.candidates):
+                raise ValueError("The checkpoint doesn't fit this search")
+            if len(stack) == len(frames):
+                break
+            candidate = saved['candidate']
+            frame.trailMark = len(self.trail)
+            if (frame.next == 0 or frame.candidates[frame.next - 1] != candidate or
+                    not (self.assignCandidate(letterList, candidate, wordToSolveList[depth].wordInCode, 1 << depth) and
+                         self.filterWordsBelow(wordToSolveList, letterList, depth, candidate, frame.trailMark))):
+                raise ValueError("The checkpoint doesn't fit this search")
+            depth += 1
+        return stack
+
+    def searchDescription(self):
+        """
+        What a checkpoint of this search is tagged with: the words in the
+        order they are searched, the rubric, and the settings which change
+        which nodes get visited.
+        """
+        return {'engine': self.engineName,
+                'ranks': None if self.engine.ranks is None else len(self.engine.ranks),
+                'rubric': sorted(self.starting_rubric.items()),
+                'words': [[wts.posX, wts.posY, wts.direction, wts.wordInCode, wts.numberCandidateWords]
+                          for wts in self.start_wts_list],
+                'multipleResults': self.multipleResults,
+                'solutionLimit': self.solutionLimit,
+                'keepSolutions': self.keepSolutions,
+                'forwardChecking': self.forwardChecking,
+                'allDifferent': self.allDifferent,
+                'backjumping': self.backjumping}
+
+    def saveCheckpoint(self, stack):
+        """
+        Write where the search has got to, to self.checkpointPath: for each
+        depth on the stack the candidate it is on and the next to try (the
+        last depth hasn't started on its next yet), with the solutions found
+        so far, the best partial rubric and the counts. The nogoods aren't
+        kept; they only save time.
+        """
+        state = {
+            'frames': [{'candidate': frame.candidates[frame.next - 1] if frame.next > 0 else None,
+                        'next': frame.next, 'conflicts': frame.conflicts, 'found': frame.found}
+                       for frame in stack],
+            'solutions': [packed.hex() for packed in self.checkpointSolutions],
+            'solutionsFound': self.solutionsFound,
+            'bestPartial': self.bestPartial.hex(),
+            'nodes': self.nodesVisited,
+            'backjumps': self.backjumps,
+            'nogoodPrunes': self.nogoodPrunes,
+        }
+        checkpoint.save(self.checkpointPath, self.checkpointKey, state)
+        self.nextCheckpoint = time.monotonic() + self.checkpointInterval
+
+    def resumeCheckpoint(self, result):
+        """
+        If there is a checkpoint of this search at self.checkpointPath, take
+        back its counts, best partial rubric and the solutions it had found
+        (into result), and return its stack for generateSolutions to carry on
+        from. None if there isn't, to start from the beginning.
+        """
+        self.checkpointKey = checkpoint.searchKey(self.searchDescription())
+        self.checkpointSolutions = list()
+        self.nextCheckpoint = time.monotonic() + self.checkpointInterval
+        state = checkpoint.load(self.checkpointPath, self.checkpointKey)
+        if state == None:
+            return None
+        if self.verbose:
+            print("Carrying on from the checkpoint in %s" % self.checkpointPath)
+        for packed in state['solutions']:
+            self.checkpointSolutions.append(bytes.fromhex(packed))
+            result.append(self.solutionFromRubric(unpackRubric(bytes.fromhex(packed))))
+        bestPartial = bytes.fromhex(state['bestPartial'])
+        if len(unpackRubric(bestPartial)) > self.bestPartialSize:
+            self.bestPartial = bestPartial
+            self.bestPartialSize = len(unpackRubric(bestPartial))
+        self.solutionsFound = state['solutionsFound']
+        self.nodesVisited = state['nodes']
+        self.backjumps = state['backjumps']
+        self.nogoodPrunes = state['nogoodPrunes']
+        return state['frames']
+
+    def bestPartialRubric(self):
+        """
+        The rubric with the most codes given letters that the last search got
+        to with every word still having candidates; the solution, if it found one.
+        """
+        return unpackRubric(self.bestPartial)
 
-            potentialLetterList = self.createPotentialLetterList(letterList, candidate, wordToSolve.wordInCode)
+    def nogoodCounters(self):
+        """
+        The nogoods added, evicted, hit and kept in the last search, or None
+        if it didn't keep any.
+        """
+        if self.nogoods == None:
+            return None
+        return self.nogoods.counters()
 
-            # Now, that letter list is be applied to all the words (one at a time) that
-            # are after this one. If any of them then gives a zero option, it means that
-            # this substitutaion has failed. If it hasn't failed, keep digging deeper.
-        
-            # You might thinkg that if one of them gives one option, it means we have
-            # a definite
-            # part of the answer. But that's not the case. It might only have one answer
-            # because of a previous but wrong substitution. The sorting means that we will
-            # dive down the "single option" levels quickly and see if when we make those
-            # substitutions they provide options for lower levles. Or not.
-
-            # Create a fresh wordToSolve list using the new potential letters
-            wts_list_test = self.createNewWCsortedList(wordToSolveList, potentialLetterList, depth, candidate)
-
-
-            # If the word we've just put in is actually the word for the final
-            # one to be solved, we have succeeded (but we did have to put it in, hence this
-            # is after the line above.)
-            if depth == len(wts_list_test) - 1:
-                if self.verbose :
-                    print("Got to the last word in the puzzle with no failures = found a solution")
-                resultList.append(XwordToSolve.Solution(wts_list_test, potentialLetterList))
-                if self.multipleResults == False :
-                    return True
-                haveFoundSomething = True
-
-            # Otherwise Look at the subsequent layers (word candidates) and
-            # find one that doesn't fail.
-            else :
-                exploreMore = True
-                for wts in wts_list_test[depth + 1:]:
-                    numCandidatesHere = wts.numberOfCandidates()
-                    if numCandidatesHere == 0:
-                        if self.verbose :
-                            print("That's a branch with no solutions on it")
-                        exploreMore = False
-                        break
+    def filterCacheCounters(self):
+        """
+        The filter cache's hits, misses, evictions, entries and bytes (since
+        it was made, which may be before this search), or None if there isn't one.
+        """
+        if self.filterCache == None:
+            return None
+        return self.filterCache.counters()
 
-                if exploreMore == True:
-                    # All the lower levels have at least one option, so let's explore them
-                    haveFoundSomething = self.recurseThroughAllCandidates(wts_list_test,
-                                                               potentialLetterList,
-                                                               depth + 1,
-                                                               resultList)
-                    if haveFoundSomething == True and self.multipleResults == False:
-                        return True
-
-        # If we get here, we've failed to find a valid word for this level
-        # and so we need to go back up a level and try again.
-        if self.verbose :
-            print("Depth %d completed one way or another, going back up a step" % depth)
-        return haveFoundSomething
+    def solutionLimitReached(self):
+        """
+        True if the search has found as many solutions as it is looking for
+        (see countSolutions).
+        """
+        return self.solutionLimit != None and self.solutionsFound >= self.solutionLimit
 
-    def createPotentialLetterList(self, startingList, word, codes):
+    def searchStopped(self):
+        """
+        True if the search should stop where it is: another worker of a parallel
+        search has found what we're after, or the time limit is up.
         """
-        Give a starting number to letter list (startingList) a word (word)
-        and the letters codes (codes) for ech letter of that word create a new
-        number to letter list.
+        if self.cancelEvent != None and self.cancelEvent.is_set():
+            return True
+        if self.deadline != None and time.monotonic() > self.deadline:
+            self.timedOut = True
+            return True
+        return False
+
+    def solveInParallel(self, workers):
+        """
+        Split the search tree into branches and search them in a pool of worker
+        processes. A branch is the words for the first few depths (a prefix),
+        cut deep enough that there are a few branches per worker. The workers
+        get a copy of this solver, index and all, once when they start (for
+        free, where processes are forked) rather than with every branch.
+
+        With multipleResults False the first solution back stops the other
+        workers, as does reaching self.solutionLimit; otherwise the solutions
+        are merged in the order the serial search would find them, without
+        duplicates.
+        """
+        prefixes = self.splitSearch(workers * 4)
+        if self.verbose:
+            print("Searching %d branches with %d workers" % (len(prefixes), workers))
+
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+        cancelEvent = context.Event()
+
+        branchResults = dict()
+        with concurrent.futures.ProcessPoolExecutor(workers, mp_context=context,
+                                                    initializer=_initBranchSolver,
+                                                    initargs=(self, cancelEvent)) as executor:
+            futures = [executor.submit(_solveBranch, prefix) for prefix in prefixes]
+            branchOf = {future: i for i, future in enumerate(futures)}
+            for future in concurrent.futures.as_completed(futures):
+                rubrics, found, nodes, backjumps, nogoodPrunes, timedOut, bestPartial, stats = future.result()
+                if len(unpackRubric(bestPartial)) > self.bestPartialSize:
+                    self.bestPartial = bestPartial
+                    self.bestPartialSize = len(unpackRubric(bestPartial))
+                self.nodesVisited += nodes
+                self.backjumps += backjumps
+                self.nogoodPrunes += nogoodPrunes
+                if self.stats != None:
+                    self.stats.merge(stats)
+                self.timedOut = self.timedOut or timedOut
+                branchResults[branchOf[future]] = rubrics
+                self.solutionsFound += found
+                if found > 0 and (self.multipleResults == False or self.solutionLimitReached()):
+                    cancelEvent.set()
+                    for other in futures:
+                        other.cancel()
+                    break
+
+        result = list()
+        seen = set()
+        for i in sorted(branchResults):
+            for packed in branchResults[i]:
+                if packed not in seen:
+                    seen.add(packed)
+                    result.append(self.solutionFromRubric(unpackRubric(packed)))
+        if self.multipleResults == False:
+            result = result[:1]
+            self.solutionsFound = min(self.solutionsFound, 1)
+        elif self.solutionLimit != None:
+            # Branches finishing together can take it past the limit.
+            result = result[:self.solutionLimit]
+            self.solutionsFound = min(self.solutionsFound, self.solutionLimit)
+        return result
+
+    def splitSearch(self, minBranches):
+        """
+        Split the search into branches, each a tuple of the candidates chosen at
+        the first depths, in the order the serial search would try them. Goes
+        deeper until there are at least minBranches (or the tree runs out).
+        Branches which fail straight away are dropped.
+        """
+        wordToSolveList = self.start_wts_list
+        letterList = self.searchRubric
+        prefixes = [tuple()]
+        depth = 0
+        while len(prefixes) < minBranches and depth < len(wordToSolveList):
+            deeper = list()
+            for prefix in prefixes:
+                trailMark = len(self.trail)
+                if self.applyPrefix(prefix):
+                    for candidate in wordToSolveList[depth].candidateWordsList:
+                        self.nodesVisited += 1
+                        candidateMark = len(self.trail)
+                        if (self.assignCandidate(letterList, candidate, wordToSolveList[depth].wordInCode) and
+                                self.filterWordsBelow(wordToSolveList, letterList, depth, candidate, candidateMark)):
+                            deeper.append(prefix + (candidate,))
+                        self.undoTrail(wordToSolveList, letterList, candidateMark)
+                self.undoTrail(wordToSolveList, letterList, trailMark)
+            prefixes = deeper
+            depth += 1
+        return prefixes
+
+    def applyPrefix(self, prefix):
+        """
+        Put the candidates in prefix in place for the first depths, as the
+        search would have. Returns False if one of them fails.
+        """
+        for depth, candidate in enumerate(prefix):
+            wordToSolve = self.start_wts_list[depth]
+            trailMark = len(self.trail)
+            if not (self.assignCandidate(self.searchRubric, candidate, wordToSolve.wordInCode, 1 << depth) and
+                    self.filterWordsBelow(self.start_wts_list, self.searchRubric, depth, candidate, trailMark)):
+                return False
+        return True
+
+    def solveBranch(self, prefix):
+        """
+        Search the branch of the tree below prefix (see splitSearch). Returns
+        the rubrics of the solutions found (packed, see packRubric; none if
+        they are only being counted), how many there were, the number of nodes visited, of
+        backjumps and of nogood prunes, whether it ran out of time, the best
+        partial rubric it got to (packed) and the SearchStats of the branch
+        (None if they aren't being collected).
+        """
+        self.nodesVisited = 0
+        self.solutionsFound = 0
+        self.backjumps = 0
+        self.nogoodPrunes = 0
+        if self.stats != None:
+            self.stats = searchstats.SearchStats()
+        result = list()
+        trailMark = len(self.trail)
+        if self.applyPrefix(prefix):
+            if len(prefix) == len(self.start_wts_list):
+                self.solutionsFound = 1
+                if self.keepSolutions:
+                    result.append(XwordToSolve.Solution(self.solutionWords, self.searchRubric))
+            else:
+                self.recurseThroughAllCandidates(self.start_wts_list, self.searchRubric, len(prefix), result)
+        self.undoTrail(self.start_wts_list, self.searchRubric, trailMark)
+        return ([solution.packedRubric for solution in result], self.solutionsFound, self.nodesVisited, self.backjumps,
+                self.nogoodPrunes, self.timedOut, self.bestPartial, self.stats)
+
+    def solutionFromRubric(self, rubric):
+        """
+        Make a Solution from a solved rubric alone.
+        """
+        return XwordToSolve.Solution(self.solutionWords, rubric)
+
+    # The kinds of entry on the trail, and what they hold:
+    TRAIL_RUBRIC     = 0  # (TRAIL_RUBRIC, code) - code was added to the rubric
+    TRAIL_CANDIDATES = 1  # (TRAIL_CANDIDATES, wts, candidates, prunedBy) - wts had these candidates before
+    TRAIL_ORDER      = 2  # (TRAIL_ORDER, i, j) - the words at i and j were swapped
+    TRAIL_DOMAIN     = 3  # (TRAIL_DOMAIN, code, mask, reason) - code's domain was mask
+
+    def assignCandidate(self, letterList, word, codes, reason=0):
+        """
+        Add the letters of word to the number to letter list (letterList) for
+        its codes (codes), recording the additions on the trail.
         Assumes that word and codeas are of the same length and that if there
         are duplicate numbers / letters they match,
+        reason is the mask of depths the word is down to (see generateSolutions).
+        Returns False if that leaves some other code with no letter it could be.
         """
-        newList = startingList.copy()
-        i = 0;
-        for code in codes:
-            newList[code] = word[i]
-            i = i + 1
-        return newList
+        for code, letter in zip(codes, word):
+            if code not in letterList:
+                if not self.assignLetter(letterList, code, letter, reason=reason):
+                    return False
+        return True
 
+    def assignLetter(self, letterList, code, letter, narrowedCodes=None, reason=0):
+        """
+        Put code = letter into letterList, reason being the mask of depths it
+        is down to. When forward checking, the code's domain becomes just that
+        letter and the letter is taken out of every other code's domain; the
+        codes whose domains that narrowed are added to narrowedCodes (if given).
+        Returns False if a domain is left empty.
+        """
+        letterList[code] = letter
+        self.trail.append((XwordToSolve.TRAIL_RUBRIC, code))
+        self.codeMasks[code] = reason
+        bit = wordindex.LETTER_BIT[letter]
+        self.usedMask |= bit
+        if not self.forwardChecking:
+            return True
+
+        if self.domains[code] != bit:
+            self.setDomain(code, bit, reason)
+        for other, mask in self.domains.items():
+            if other != code and mask & bit:
+                self.setDomain(other, mask & ~bit, reason)
+                if narrowedCodes != None:
+                    narrowedCodes.append(other)
+                if mask == bit:
+                    self.conflict = self.domainMasks[other]
+                    return False
+        return True
+
+    def setDomain(self, code, mask, reason=0):
+        """
+        Give code the domain mask, reason being the mask of depths which took
+        the other letters away, on the trail.
+        """
+        self.trail.append((XwordToSolve.TRAIL_DOMAIN, code, self.domains[code], self.domainMasks[code]))
+        self.domains[code] = mask
+        self.domainMasks[code] |= reason
 
-    # depth is the depth to which words have been fixed in this allWClist
-    def createNewWCsortedList(self, startingWordToSolveList, letterToNumberList, depth, wordForThisDepth):
+    def startingDomains(self, rubric):
+        """
+        The domain of each code (the mask of letters it could be) from the
+        rubric alone: a known letter, or any letter not already used.
+        """
+        used = 0
+        for letter in rubric.values():
+            used |= wordindex.LETTER_BIT[letter]
+        domains = {code: wordindex.ALL_LETTERS & ~used for code in self.wordsWithCode}
+        for code, letter in rubric.items():
+            domains[code] = wordindex.LETTER_BIT[letter]
+        return domains
+
+    def propagateDomains(self, wordToSolveList, letterList, depth, changed=None):
+        """
+        Forward checking on the words below depth, to a fixed point. For each
+        word, its candidates are cut down to those whose letters are in the
+        domains of their codes, then each code's domain is cut down to the
+        letters its candidates allow. A narrowed domain means the other words
+        with that code get looked at again, and a domain down to one letter
+        goes straight into the rubric (taking that letter from everyone else).
+        changed is the words below whose candidates have changed since the
+        last fixed point; the others have nothing new to say until then (it
+        is used up as the queue of words to look at). None starts from all of them.
+        All changes go on the trail.
+        Returns False if a word is left with no candidates or a code with no
+        letters, in which case this branch can't lead to a solution.
         """
-        Given the currently being explores WC list andan updated number to letter
-        list, remove all the words which no longer word from the candidates lists
-        and put the resutls in a fresh WC list, sorted so that layer up to depth
-        retain their current order (they should be 1 by definition, and should keep
-        recursion order), lower ayer reordered to have lowest number of options first.
+        engine = self.engine
+        domains = self.domains
+        if depth + 1 >= len(wordToSolveList):
+            return True
+        domainMasks = self.domainMasks
+        # All different works from every domain at once, so what it does is
+        # down to everything up to here (see generateSolutions).
+        upToDepth = (1 << (depth + 1)) - 1
+
+        # The words below have been filtered against the rubric, so their
+        # candidates already leave out the letters it uses.
+        filtered = wordindex.ALL_LETTERS & ~self.usedMask
+
+        # A word is below depth if its index is (see WordToSolve.index).
+        queue = wordToSolveList[depth + 1:] if changed == None else changed
+        queued = set(queue)
+        while True:
+            # When the words have nothing more to say, see whether giving every code its
+            # own letter rules anything else out. If it does, round we go again.
+            if len(queue) == 0:
+                if not self.allDifferent:
+                    break
+                narrowedCodes = self.pruneAllDifferent(letterList, upToDepth)
+                if narrowedCodes == None:
+                    self.conflict = upToDepth
+                    return False
+                for code in narrowedCodes:
+                    for other in self.wordsWithCode.get(code, list()):
+                        if other.index > depth and other not in queued:
+                            queue.append(other)
+                            queued.add(other)
+                if len(queue) == 0:
+                    break
+
+            wts = queue.pop()
+            queued.discard(wts)
+
+            candidates = wts.candidates
+            reason = 0
+            for code, pos in wts.codePositions:
+                if domains[code] != filtered:
+                    candidates = engine.restrictAt(wts.wordInCode, candidates, pos, domains[code])
+                    reason |= domainMasks[code]
+            if engine.count(wts.wordInCode, candidates) != wts.numberCandidateWords:
+                self.setWordCandidates(wts, candidates, reason)
+                if wts.numberCandidateWords == 0:
+                    if self.verbose:
+                        print("Domains leave word %s with no options" % wts.string())
+                    self.conflict = wts.prunedBy
+                    return False
+
+            narrowedCodes = list()
+            for code, pos in wts.codePositions:
+                if code in letterList:
+                    continue
+                mask = domains[code]
+                supported = mask & engine.lettersAt(wts.wordInCode, candidates, pos)
+                if supported == mask:
+                    continue
+                if supported == 0:
+                    self.conflict = wts.prunedBy | domainMasks[code]
+                    return False
+                self.setDomain(code, supported, wts.prunedBy)
+                narrowedCodes.append(code)
+                if supported & (supported - 1) == 0:
+                    # Only one letter left, so that's what this code is.
+                    letter = wordindex.LETTERS[supported.bit_length() - 1]
+                    if self.verbose:
+                        print("Code %d can only be %s" % (code, letter))
+                    if not self.assignLetter(letterList, code, letter, narrowedCodes, domainMasks[code]):
+                        return False
+
+            for code in narrowedCodes:
+                for other in self.wordsWithCode[code]:
+                    if other.index > depth and other not in queued and (other is not wts or code not in letterList):
+                        queue.append(other)
+                        queued.add(other)
+
+        return True
+
+    def pruneAllDifferent(self, letterList, reason=0):
         """
+        Take out of the domains of the codes not yet in letterList any letters
+        which can't be part of a complete assignment of different letters to
+        them (see alldifferent.py). Codes narrowed to one letter are assigned.
+        reason is the mask of depths the pruning is put down to.
+        Returns the codes whose domains narrowed, or None if the codes left
+        can't all be given different letters.
+        """
+        start = time.perf_counter()
+        self.allDifferentCalls += 1
+        unassigned = {code: mask for code, mask in self.domains.items() if code not in letterList}
+        narrowed = alldifferent.allDifferentDomains(unassigned)
+        narrowedCodes = None
+        if narrowed == None:
+            if self.verbose:
+                print("Not enough letters to go round the codes left")
+        else:
+            narrowedCodes = list()
+            for code, mask in narrowed.items():
+                self.allDifferentPrunes += (self.domains[code] & ~mask).bit_count()
+                self.setDomain(code, mask, reason)
+                narrowedCodes.append(code)
+            for code, mask in narrowed.items():
+                if mask & (mask - 1) == 0 and code not in letterList:
+                    if not self.assignLetter(letterList, code, wordindex.LETTERS[mask.bit_length() - 1],
+                                             narrowedCodes, reason):
+                        narrowedCodes = None
+                        break
+        self.allDifferentTime += time.perf_counter() - start
+        return narrowedCodes
 
-        # NOTE: we probably don't need to redo the previously done levels here ...
-    
-        newWTSlist      = list()
-        newWTSlistBelow = list()
-        myDepth = 0;
-        for wts in startingWordToSolveList:
+    def setWordCandidates(self, wts, candidates, reason=0):
+        """
+        Give wts new candidates, reason being the mask of depths which took the
+        others away (see generateSolutions), on the trail.
+        """
+        self.trail.append((XwordToSolve.TRAIL_CANDIDATES, wts, wts.candidates, wts.prunedBy))
+        wts.setCandidates(candidates)
+        wts.prunedBy |= reason
+
+    # depth is the depth to which words have been fixed in wordToSolveList
+    def filterWordsBelow(self, wordToSolveList, letterToNumberList, depth, wordForThisDepth, trailMark):
+        """
+        Given the word list being explored and an updated number to letter
+        list, fix the word at depth to wordForThisDepth and remove all the words
+        which no longer fit from the candidates of the words below it.
+        trailMark is the length of the trail before wordForThisDepth's letters
+        went into the rubric, which is how the codes it gave letters to are found.
+
+        The words below were filtered against the rubric as it was, so only
+        the difference is applied, to every word below: where it has a newly
+        assigned code it is cut down to that letter at that position, and
+        where its code is still unknown it loses the candidates with a newly
+        used letter. (With a filter cache, a word with a newly assigned code
+        is intersected with the cached filter on the whole rubric instead.)
+        Only the words whose candidates changed are handed on to
+        propagateDomains. Then the word below with fewest options is swapped
+        up to depth + 1, to be tried next; the rest are left where they are.
+        All changes go on the trail.
+        Returns False if one of the words below has been left with no options.
+        """
+        engine = self.engine
+        wordToSolve = wordToSolveList[depth]
+        self.setWordCandidates(wordToSolve, engine.fromWords(wordToSolve.wordInCode, [wordForThisDepth]))
+
+        newLetters = dict()
+        newMask = 0
+        for i in range(trailMark, len(self.trail)):
+            entry = self.trail[i]
+            if entry[0] == XwordToSolve.TRAIL_RUBRIC:
+                letter = letterToNumberList[entry[1]]
+                newLetters[entry[1]] = letter
+                newMask |= wordindex.LETTER_BIT[letter]
+
+        if self.backjumping:
+            depthBit = 1 << depth
+            self.depthPairs[depth] = newLetters
+            for code in newLetters:
+                self.codeMasks[code] = depthBit
+            if self.nogoods != None and newMask:
+                nogood = self.nogoods.violated(letterToNumberList, newLetters)
+                if nogood != None:
+                    self.nogoodPrunes += 1
+                    self.conflict = 0
+                    for code, letter in nogood:
+                        self.conflict |= self.codeMasks[code]
+                    return False
+
+        changed = list()
+        if newMask:
+            cache = self.filterCache
+            for i in range(depth + 1, len(wordToSolveList)):
+                wts = wordToSolveList[i]
+                # Trim the candidates for this word/answer given the new code letters
+                candidates = wts.candidates
+                # The candidates taken away here are down to this depth's letters alone.
+                reason = 1 << depth
+                if cache != None and any(code in newLetters for code, pos in wts.codePositions):
+                    candidates = engine.intersect(wts.wordInCode, candidates,
+                                                  cache.filtered(wts.wordInCode, letterToNumberList, self.usedMask))
+                    # Unless they come from the cache, which filters on the whole rubric.
+                    reason = (1 << (depth + 1)) - 1
+                else:
+                    for code, pos in wts.codePositions:
+                        if code in newLetters:
+                            candidates = engine.restrictAt(wts.wordInCode, candidates, pos,
+                                                           wordindex.LETTER_BIT[newLetters[code]])
+                        elif code not in letterToNumberList:
+                            candidates = engine.excludeAt(wts.wordInCode, candidates, pos, newMask)
+                if engine.count(wts.wordInCode, candidates) != wts.numberCandidateWords:
+                    self.setWordCandidates(wts, candidates, reason)
+                    if wts.numberCandidateWords == 0:
+                        self.conflict = wts.prunedBy
+                        return False
+                    changed.append(wts)
+
+        if self.forwardChecking and not self.propagateDomains(wordToSolveList, letterToNumberList, depth, changed):
+            return False
+
+        # Bring the word below with fewest options up next
+        first = depth + 1
+        if first < len(wordToSolveList):
+            best = first
+            bestKey = XwordToSolve.orderKey(wordToSolveList[first])
+            for i in range(first + 1, len(wordToSolveList)):
+                if wordToSolveList[i].numberCandidateWords <= bestKey[0]:
+                    key = XwordToSolve.orderKey(wordToSolveList[i])
+                    if key < bestKey:
+                        best = i
+                        bestKey = key
+            if best != first:
+                self.trail.append((XwordToSolve.TRAIL_ORDER, first, best))
+                wordToSolveList[first], wordToSolveList[best] = wordToSolveList[best], wordToSolveList[first]
+                wordToSolveList[first].index = first
+                wordToSolveList[best].index = best
+        return True
+
+    @staticmethod
+    def orderKey(wts):
+        # Which word to search next: fewest candidates first, and of those the
+        # one crossing most other words (see CodewordToSolve.crossWords), as it
+        # narrows down most of what is left.
+        return (wts.numberCandidateWords, -len(wts.crossings))
+
+    def undoTrail(self, wordToSolveList, letterList, trailMark):
+        """
+        Undo the changes recorded on the trail since it was trailMark long.
+        """
+        trail = self.trail
+        while len(trail) > trailMark:
+            entry = trail.pop()
+            if entry[0] == XwordToSolve.TRAIL_RUBRIC:
+                # No two codes have the same letter, so the letter is free again.
+                self.usedMask &= ~wordindex.LETTER_BIT[letterList.pop(entry[1])]
+            elif entry[0] == XwordToSolve.TRAIL_CANDIDATES:
+                entry[1].setCandidates(entry[2])
+                entry[1].prunedBy = entry[3]
+            elif entry[0] == XwordToSolve.TRAIL_DOMAIN:
+                self.domains[entry[1]] = entry[2]
+                self.domainMasks[entry[1]] = entry[3]
+            else:
+                i, j = entry[1], entry[2]
+                wordToSolveList[i], wordToSolveList[j] = wordToSolveList[j], wordToSolveList[i]
+                wordToSolveList[i].index = i
+                wordToSolveList[j].index = j
 
-            # If we've alreday got this one down to one option, simply copy
-            # it trhough to the new list or create and append the one that is being
-            # fixed to one answer
-            copyWTS = wts.copy()
-            if myDepth < depth :
-                newWTSlist.append(copyWTS)
-            elif myDepth == depth:
-                copyWTS.setCandidateWordsList([wordForThisDepth])
-                newWTSlist.append(copyWTS)
-            else :
-                # Create trimmed list for this word/answer given the new code letter
-                # list
-                copyWTS.updateCandidateList(letterToNumberList)
-                newWTSlistBelow.append(copyWTS)
 
-            myDepth = myDepth + 1
 
-        # Sort the below list and then append all of its entries to the result
-        newWTSlistBelow.sort(key=WordToSolve.numberOfCandidates)
-        newWTSlist.extend(newWTSlistBelow)
+# The solver a worker process of XwordToSolve.solveInParallel searches its branches with.
+_branchSolver = None
 
-        return newWTSlist
+def _initBranchSolver(solver, cancelEvent):
+    global _branchSolver
+    _branchSolver = solver
+    _branchSolver.cancelEvent = cancelEvent
+
+def _solveBranch(prefix):
+    return _branchSolver.solveBranch(prefix)
 
 
 
 class CodewordToSolve:
-    def __init__(self, starting_grid: tuple, starting_rubric: dict, base_dictionary: dict):
+    def __init__(self, starting_grid: tuple, starting_rubric: dict, base_dictionary: dict,
+                 engine: str = wordindex.WordIndex.name):
         self.starting_grid = starting_grid
         self.starting_rubric = starting_rubric.copy()
         self.base_dictionary = base_dictionary
 
-        self.xwts = XwordToSolve(rubric)
+        self.xwts = XwordToSolve(self.starting_rubric, engine)
 
-        self.verbose = True
+        self.verbose = False
         self.multipleResults = False
+        self.workers = 1
+        self.minWordLength = MIN_WORD_LENGTH
 
     def assumeManySolutions(self):
         self.multipleResults = True
 
+    def setMinWordLength(self, length):
+        """
+        Take runs of at least length squares as words, see parse.
+        """
+        self.minWordLength = length
+
+    def useWorkers(self, workers):
+        """
+        Search with this many processes, see XwordToSolve.solveInParallel.
+        """
+        self.workers = workers
+
+    def collectStats(self, trace=None):
+        """
+        Collect stats on each search, see XwordToSolve.collectStats. After a
+        solve they are in searchStats().
+        """
+        self.xwts.collectStats(trace)
+
+    def searchStats(self):
+        return self.xwts.stats
+
+    def useFilterCache(self, maxBytes=wordindex.FILTER_CACHE_BYTES, cache=None):
+        """
+        Cache filtered candidates, in up to maxBytes, or in cache (a
+        wordindex.FilterCache shared with other solvers using the same engine).
+        """
+        self.xwts.filterCacheBytes = maxBytes
+        self.xwts.filterCache = cache
+
+    def useNogoods(self, limit=nogoods.DEFAULT_LIMIT):
+        """
+        Learn nogoods from the dead ends backjumping finds, keeping up to
+        limit of them (0 for none).
+        """
+        self.xwts.nogoodLimit = limit
+
+    def setTimeLimit(self, seconds):
+        """
+        Give up the search after this many seconds (None for no limit),
+        returning whatever has been found by then.
+        """
+        self.xwts.timeLimit = seconds
+
+    def useCheckpoint(self, path, seconds=checkpoint.DEFAULT_INTERVAL):
+        """
+        Checkpoint the search to path every so many seconds (and when it runs
+        out of time), carrying on from the checkpoint there if there is one
+        for the same puzzle. The file is removed once the search is over.
+        Only for searches in one process.
+        """
+        self.xwts.checkpointPath = path
+        self.xwts.checkpointInterval = seconds
+
+    def bestPartialRubric(self):
+        """
+        After a solve, the rubric with most codes filled in that the search got
+        to without running into a conflict, see XwordToSolve.bestPartialRubric.
+        """
+        return self.xwts.bestPartialRubric()
+
     def showGrid(self, grid=None, knownLetters=None):
         if grid == None:
             grid = self.starting_grid
         if knownLetters == None:
             knownLetters = self.starting_rubric
         
-        for row in matrix:
-            print("+--"*len(row),end="+\n")
+        # Rows may be any length; the short ones are blocked to the end.
+        width = max(len(row) for row in grid)
+        for row in grid:
+            row = tuple(row) + (SQ_BLOCK,) * (width - len(row))
+            print("+--"*width,end="+\n")
             print(end="|")
             for element in row:
                 if element == SQ_BLOCK:
@@ -419,7 +1539,7 @@ class CodewordToSolve:
                     else:
                         print("  ", end="|")
             print()
-        print("+--"*len(row),end="+\n")
+        print("+--"*width,end="+\n")
     
 
     def showRubric(self, rubric):
@@ -434,101 +1554,341 @@ class CodewordToSolve:
         self.wts_list = self.parse()
         self.xwts.setWordsToSolve(self.wts_list)
         self.xwts.setBaseDictionary(self.base_dictionary)
-        return self.xwts.solve(self.multipleResults)
+        return self.xwts.solve(self.multipleResults, self.workers)
+
+    def iter_solutions(self, limit=None, deadline=None):
+        """
+        Yield the solutions one at a time as they are found, see
+        XwordToSolve.iter_solutions. Always searches in this process.
+        """
+        if self.verbose == True :
+            print("Starting grid.")
+            self.showGrid()
+        self.wts_list = self.parse()
+        self.xwts.setWordsToSolve(self.wts_list)
+        self.xwts.setBaseDictionary(self.base_dictionary)
+        return self.xwts.iter_solutions(limit, deadline)
+
+    def count_solutions(self, max_count=None):
+        """
+        Count the solutions, stopping once there are max_count of them (None
+        for all of them), without keeping each one as it is found, see
+        XwordToSolve.countSolutions. The rubrics of those counted are in
+        countedSolutions().
+        """
+        if self.verbose == True :
+            print("Starting grid.")
+            self.showGrid()
+        self.wts_list = self.parse()
+        self.xwts.setWordsToSolve(self.wts_list)
+        self.xwts.setBaseDictionary(self.base_dictionary)
+        return self.xwts.countSolutions(max_count, self.workers)
+
+    def is_unique(self):
+        """
+        True if the puzzle has exactly one solution, stopping the search as
+        soon as a second one turns up. None if it ran out of time before it
+        could tell.
+        """
+        count = self.count_solutions(2)
+        if count < 2 and self.xwts.timedOut:
+            return None
+        return count == 1
+
+    def countedSolutions(self):
+        """
+        The rubrics of the solutions the last count_solutions counted.
+        """
+        return [unpackRubric(packed) for packed in self.xwts.countedSolutions]
         
 
     # =============== Extract words ===============
-    # Horizontal words: Have a word list. This will be a list of lists. First two elements
-    # are the position of the first letter.
-    # For each row, start at [0] and test if non-zero.
-    # If it's non-zero, test whether next element is non-zero. If it is, this is becoming a word.
-    # Add the first two letters to a tentative word, then progress until we hit a zero. Add
-    # the word to the word list - also need to store the location of the word (or at least of
-    # the first letter).
+    # A word is a run of squares which aren't blocked, across a row or down a
+    # column, at least self.minWordLength long. One pass over the grid, row by
+    # row, finds both: the run across this row, and the run down each column
+    # so far, each ended by a blocked square or the edge of the grid. Rows
+    # may be any length; beyond the end of a short row is blocked.
     def parse(self, m: tuple = None):
-        if m == None:
-            m = self.starting_grid
-            
         """
         Parse the puzzle matrix both across and down to find words to solve.
-        Return results as a list of lists. Each inner list represents one word and is structured:
-        [(direction, row, col), n1, n2, n3,...] where n1... is the code for the letter
+        Returns them as a list of WordToSolve, the across words row by row
+        then the down words column by column, each with the words it shares
+        a square with in its crossings (see crossWords).
 
-        NOTE: Currently assumes a square grid, and a size of 11x11.
-
-        :param m:
+        :param m: the grid, rows of codes (default self.starting_grid)
         :return: word_list: list
         """
-        directions = ['across', 'down']
-        word = list()  # Used to store the word we're working on
-        wordToSolveList = list() # Stores the list of words to solve.
-
-        # There is probably a way of doing this in three nestled loops and handling
-        # non-square unknown size grids. But I can;t work it out. So we have two loops.
-        # It still assumes a rectangle.
-        xLast = len(m[0]) - 1
-        direction = 'across'
-        for y in range(len(m)):          # number of rows (size of outer tuple)
-            for x in range(len(m[y])):   # number of columns (size of inner tuple)
-                square = m[y][x]
-
-                if square != 0:  # Encountered a letter
-                    if len(word) == 0:
-                        startX = x
-                        startY = y
-                    word.append(square)  # First letter
-
-                if square == 0 or x == xLast:  # Encountered a blank space or end of row
-                    if len(word) > 3:  # Then we collected a word and have come to the end of it
-                        wordToSolveList.append(WordToSolve(startX, startY, direction, word))
-
-                    word = list() # Reset word (either it wasn't a word, or it has been noted)
-
-
-        direction = 'down' # So now go through them the other way round running down.
-        yLast = len(m) - 1
-        for x in range(len(m[0])):    
-            for y in range(len(m)):
-                square = m[y][x]
-
-                if square != 0:  # Encountered a letter
-                    if len(word) == 0:
-                        startX = x
-                        startY = y
-                    word.append(square)  # First letter
-
-                if square == 0 or y == yLast:  # Encountered a blank space or end of column
-                    if len(word) > 3:  # Then we collected a word and have come to the end of it
-                        wordToSolveList.append(WordToSolve(startX, startY, direction, word))
-
-                    word = list() # Reset word (either it wasn't a word, or it has been noted)
-
-
+        if m == None:
+            m = self.starting_grid
+        minWordLength = self.minWordLength
+        width = max((len(row) for row in m), default=0)
+        acrossWords = list()
+        downWords = list()
+        downRuns = [None] * width   # For each column, the (start row, codes) of the run going down it.
+
+        for y, row in enumerate(m):
+            run = None
+            for x in range(width + 1):
+                square = row[x] if x < len(row) else SQ_BLOCK
+                if square != SQ_BLOCK:
+                    if run == None:
+                        run = (x, list())
+                    run[1].append(square)
+                    if downRuns[x] == None:
+                        downRuns[x] = (y, list())
+                    downRuns[x][1].append(square)
+                    continue
+                # A blocked square (or the end of the row) ends the runs it is in.
+                if run != None and len(run[1]) >= minWordLength:
+                    acrossWords.append(WordToSolve(run[0], y, 'across', run[1]))
+                run = None
+                if x < width and downRuns[x] != None:
+                    if len(downRuns[x][1]) >= minWordLength:
+                        downWords.append(WordToSolve(x, downRuns[x][0], 'down', downRuns[x][1]))
+                    downRuns[x] = None
+        for x, run in enumerate(downRuns):
+            if run != None and len(run[1]) >= minWordLength:
+                downWords.append(WordToSolve(x, run[0], 'down', run[1]))
+
+        downWords.sort(key=lambda wts: (wts.posX, wts.posY))
+        wordToSolveList = acrossWords + downWords
+        self.crossWords(wordToSolveList)
         return wordToSolveList
 
+    def crossWords(self, wordToSolveList):
+        """
+        Fill in the crossing graph of the words parse found: each word's
+        crossings are the words which share a square with it, the square
+        being where they cross. (The words which share a code, wherever it
+        is, are in XwordToSolve.wordsWithCode once a search has started.) The
+        search breaks ties between words with as many candidates as each
+        other on them, see XwordToSolve.orderKey.
+        """
+        acrossAt = dict()
+        for wts in wordToSolveList:
+            wts.crossings = list()
+            if wts.direction == 'across':
+                for i in range(wts.length):
+                    acrossAt[(wts.posX + i, wts.posY)] = wts
+        for wts in wordToSolveList:
+            if wts.direction == 'down':
+                for i in range(wts.length):
+                    across = acrossAt.get((wts.posX, wts.posY + i))
+                    if across != None:
+                        wts.crossings.append(across)
+                        across.crossings.append(wts)
+        for wts in wordToSolveList:
+            wts.crossings = tuple(wts.crossings)
+
+
+# =============== Batches of puzzles ===============
+# A batch is a stream of puzzles, one JSON object per line:
+#   {"id": "any name", "grid": [[0, 25, 0, ...], ...], "rubric": {"22": "o", ...}, "multiple": false}
+# where grid is the puzzle as setPuzzle() lays it out (rows of codes, SQ_BLOCK
+# for blocked squares) and rubric and multiple are optional. "count": n in
+# place of multiple counts the solutions, stopping at n of them (2 to check
+# that a puzzle has only the one), see CodewordToSolve.count_solutions, and
+# "minWord": n takes runs of n or more squares as words (default
+# MIN_WORD_LENGTH). Grids can be any size, and needn't be square. Each
+# result is written as one JSON line as soon as that puzzle is done:
+#   {"id": ..., "status": "solved" | "unsolved" | "timeout" | "error",
+#    "solutions": [{"1": "c", ...}, ...], "nodes": n, "seconds": s}
+# with "count" too if the puzzle asked for one.
+# and on a timeout "partial", the rubric with most codes the search got to.
+# A search stopped by cancelEvent (see solvePuzzle) is "cancelled".
+
+def solvePuzzle(line, index, engine=wordindex.WordIndex.name, timeout=None, stats=False, cancelEvent=None):
+    """
+    Solve one puzzle of a batch, given as its line of JSON, against index (a
+    candidate engine already built, so all the puzzles share it). Returns the
+    result as a dict ready to be written out as JSON, with the search's
+    stats (see searchstats.SearchStats.toDict) if stats is True. The search
+    stops where it is if cancelEvent (a multiprocessing.Event, or None) is set.
+    """
+    start = time.time()
+    result = {'id': None}
+    try:
+        puzzle = json.loads(line)
+        result['id'] = puzzle.get('id')
+        matrix = tuple(tuple(row) for row in puzzle['grid'])
+        rubric = {int(code): letter for code, letter in puzzle.get('rubric', dict()).items()}
+
+        cwts = CodewordToSolve(matrix, rubric, index, engine)
+        cwts.verbose = False
+        cwts.xwts.verbose = False
+        cwts.xwts.veryVerbose = False
+        cwts.setMinWordLength(puzzle.get('minWord', MIN_WORD_LENGTH))
+        if puzzle.get('multiple', False):
+            cwts.assumeManySolutions()
+        cwts.setTimeLimit(timeout)
+        cwts.xwts.cancelEvent = cancelEvent
+        if stats:
+            cwts.collectStats()
+        if 'count' in puzzle:
+            result['count'] = cwts.count_solutions(puzzle['count'])
+            solutions = cwts.countedSolutions()
+        else:
+            solutions = [s.solvedRubric for s in cwts.solve()]
 
-   
-
+        if cancelEvent != None and cancelEvent.is_set():
+            result['status'] = 'cancelled'
+        elif cwts.xwts.timedOut:
+            result['status'] = 'timeout'
+            result['partial'] = {str(code): letter for code, letter in sorted(cwts.bestPartialRubric().items())}
+        else:
+            result['status'] = 'solved' if result.get('count', len(solutions)) > 0 else 'unsolved'
+        result['solutions'] = [{str(code): letter for code, letter in sorted(s.items())} for s in solutions]
+        result['nodes'] = cwts.xwts.nodesVisited
+        if cwts.searchStats() != None:
+            result['stats'] = cwts.searchStats().toDict()
+    except Exception as e:
+        # One bad puzzle shouldn't stop the rest of the batch.
+        result['status'] = 'error'
+        result['error'] = "%s: %s" % (type(e).__name__, e)
+    result['seconds'] = round(time.time() - start, 6)
+    return result
+
+
+def solveBatch(inputLines, output, dictionary, engine=wordindex.WordIndex.name, workers=1, timeout=None,
+               stats=False):
+    """
+    Solve a stream of puzzles (see above) from inputLines, writing each
+    result to output as it finishes. The index is built once and shared by
+    every puzzle; with workers > 1 the puzzles are solved in that many
+    processes (so the results may come out of order - use the ids), with a
+    few more puzzles read ahead than there are workers. With stats each
+    result has the stats of its search in too.
+    Returns the number of puzzles solved, and the time taken.
+    """
+    start = time.time()
+    index = wordindex.makeEngine(engine, dictionary)
+    count = 0
+
+    def write(result):
+        output.write(json.dumps(result) + "\n")
+        output.flush()
+
+    lines = (line for line in inputLines if len(line.strip()) > 0)
+    if workers <= 1:
+        for line in lines:
+            write(solvePuzzle(line, index, engine, timeout, stats))
+            count += 1
+    else:
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+        with concurrent.futures.ProcessPoolExecutor(workers, mp_context=context,
+                                                    initializer=_initBatchIndex,
+                                                    initargs=(index, engine, timeout, stats)) as executor:
+            pending = set()
+            for line in lines:
+                pending.add(executor.submit(_solveBatchPuzzle, line))
+                if len(pending) >= 2 * workers:
+                    done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        write(future.result())
+                        count += 1
+            for future in concurrent.futures.as_completed(pending):
+                write(future.result())
+                count += 1
+
+    return count, time.time() - start
+
+
+# The index, engine name, time limit and whether to collect stats, that each
+# worker process of solveBatch solves with.
+_batchSettings = None
+
+def _initBatchIndex(index, engine, timeout, stats):
+    global _batchSettings
+    _batchSettings = (index, engine, timeout, stats)
+
+def _solveBatchPuzzle(line):
+    index, engine, timeout, stats = _batchSettings
+    return solvePuzzle(line, index, engine, timeout, stats)
 
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Solve codeword puzzles: the sample in setPuzzle(), or a batch.")
+    parser.add_argument("--batch", metavar="FILE",
+                        help="solve the puzzles in FILE, JSON lines (see solveBatch), - for stdin")
+    parser.add_argument("--engine", default=wordindex.WordIndex.name, choices=sorted(wordindex.ENGINES),
+                        help="candidate engine (default %(default)s)")
+    parser.add_argument("--workers", type=int, default=1, help="processes to solve with (default 1)")
+    parser.add_argument("--timeout", type=float, help="seconds to give each puzzle")
+    parser.add_argument("--frequencies", metavar="FILE",
+                        help="try the commonest words first, ranked by FILE (see wordlayers.py)")
+    parser.add_argument("--layer", action="append", default=list(), metavar="FILE",
+                        help="add words to and take words out of the dictionary, from FILE (see wordlayers.py)")
+    parser.add_argument("--unique", action="store_true",
+                        help="only check that the sample has exactly one solution, stopping at a second")
+    parser.add_argument("--checkpoint", metavar="FILE",
+                        help="checkpoint the search to FILE as it goes, carrying on from it if it is there")
+    parser.add_argument("--stats", action="store_true", help="report what each search did")
+    parser.add_argument("--trace", metavar="FILE", help="write every node of the search to FILE as JSON lines")
+    parser.add_argument("--verbose", action="store_true", help="print the search as it goes (slow)")
+    args = parser.parse_args()
+
+    my_dictionary = wordcache.loadDictionary()
+    if args.frequencies != None or len(args.layer) > 0:
+        # Built here so that the layers and ranks go into the one index everything uses.
+        my_dictionary = wordindex.makeEngine(args.engine, my_dictionary)
+        wordlayers.applyLayers(my_dictionary, args.layer)
+        if args.frequencies != None:
+            wordlayers.useFrequencies(my_dictionary, args.frequencies)
+
+    if args.batch != None:
+        if args.batch == "-":
+            count, seconds = solveBatch(sys.stdin, sys.stdout, my_dictionary, args.engine, args.workers, args.timeout,
+                                        args.stats)
+        else:
+            with open(args.batch, "r") as batchFile:
+                count, seconds = solveBatch(batchFile, sys.stdout, my_dictionary, args.engine, args.workers,
+                                            args.timeout, args.stats)
+        print("%d puzzles in %.3fs: %.1f puzzles/second" % (count, seconds, count / max(seconds, 1e-9)),
+              file=sys.stderr)
+        sys.exit()
 
     # Get the thing you need to solve it: the puzzle and the dictionary
     matrix, rubric = setPuzzle()
-    dir_path = os.path.dirname(os.path.realpath(__file__))
-    with open(dir_path + "/ukenglish.txt", "r", encoding="latin-1") as myfile:
-        my_dictionary = myfile.read().splitlines()
 
 
     # Set up the class and solve
-    cwts = CodewordToSolve(matrix, rubric, my_dictionary)
+    cwts = CodewordToSolve(matrix, rubric, my_dictionary, args.engine)
     cwts.assumeManySolutions()
+    cwts.useWorkers(args.workers)
+    cwts.setTimeLimit(args.timeout)
+    if args.checkpoint != None:
+        cwts.useCheckpoint(args.checkpoint)
+    if args.verbose:
+        cwts.verbose = True
+        cwts.xwts.verbose = True
+        cwts.xwts.veryVerbose = True
+    if args.unique:
+        unique = cwts.is_unique()
+        if unique == None:
+            print("Ran out of time after %d solution(s)" % cwts.xwts.solutionsFound)
+        else:
+            print("Unique" if unique else "Not unique: %d or more solutions" % cwts.xwts.solutionsFound)
+        sys.exit()
+    traceFile = None
+    if args.trace != None:
+        traceFile = open(args.trace, "w")
+    if args.stats or traceFile != None:
+        cwts.collectStats(traceFile)
     results = cwts.solve()
+    if traceFile != None:
+        traceFile.close()
+    if args.stats:
+        cwts.searchStats().show()
 
     # Output results
     if (len(results) == 0) :
         print("FAILED TO SOLVE PUZZLE")
+        if cwts.xwts.timedOut:
+            partial = cwts.bestPartialRubric()
+            print("Ran out of time; the most codes without a conflict: %d" % len(partial))
+            cwts.showGrid(matrix, partial)
     else :
         print("Solutions found: %d" % len(results))
         for r in results:
@@ -536,4 +1896,3 @@ if __name__ == "__main__":
             cwts.showGrid(matrix, r.solvedRubric)
             #and a sorted version of the number to letter result:
             cwts.showRubric(r.solvedRubric)
-
@@ -0,0 +1,72 @@
+#!/usr/bin/python3
+# nogoods.py
+# A bounded store of nogoods: small sets of code = letter assignments which
+# the search has proved can't all be part of a solution. Checked as each
+# candidate goes in, so a combination already known to be hopeless is cut
+# off straight away rather than searched out again below.
+#
+# A nogood is a frozenset of (code, letter) pairs. It only holds for the
+# starting rubric of the search that found it.
+
+import collections
+
+# Most nogoods kept (least recently useful out first), and the most pairs a
+# nogood can have to be worth keeping.
+DEFAULT_LIMIT = 10000
+MAX_PAIRS = 8
+
+
+class NogoodStore:
+    def __init__(self, limit=DEFAULT_LIMIT, maxPairs=MAX_PAIRS):
+        self.limit = limit
+        self.maxPairs = maxPairs
+        self.nogoods = collections.OrderedDict()
+        # Each (code, letter) pair -> the nogoods with it in.
+        self.byPair = dict()
+        self.added = 0
+        self.evicted = 0
+        self.hits = 0
+
+    def __len__(self):
+        return len(self.nogoods)
+
+    def add(self, pairs):
+        """
+        Record the (code, letter) pairs in pairs as a nogood, if there are
+        few enough of them. Returns True if it was added.
+        """
+        if len(pairs) == 0 or len(pairs) > self.maxPairs:
+            return False
+        nogood = frozenset(pairs)
+        if nogood in self.nogoods:
+            return False
+        self.nogoods[nogood] = None
+        for pair in nogood:
+            self.byPair.setdefault(pair, set()).add(nogood)
+        self.added += 1
+        while len(self.nogoods) > self.limit:
+            old, _ = self.nogoods.popitem(last=False)
+            for pair in old:
+                holders = self.byPair[pair]
+                holders.discard(old)
+                if len(holders) == 0:
+                    del self.byPair[pair]
+            self.evicted += 1
+        return True
+
+    def violated(self, rubric, newLetters):
+        """
+        A nogood which rubric (code -> letter) now has all of, looking only at
+        those with one of the assignments just made (newLetters, code ->
+        letter). None if there isn't one.
+        """
+        for pair in newLetters.items():
+            for nogood in self.byPair.get(pair, ()):
+                if all(rubric.get(code) == letter for code, letter in nogood):
+                    self.hits += 1
+                    self.nogoods.move_to_end(nogood)
+                    return nogood
+        return None
+
+    def counters(self):
+        return {'added': self.added, 'evicted': self.evicted, 'hits': self.hits, 'kept': len(self.nogoods)}
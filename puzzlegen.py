@@ -0,0 +1,291 @@
+#!/usr/bin/python3
+# puzzlegen.py
+# Make codeword puzzles to benchmark the solver on: lay out a grid, fill it
+# with words from the dictionary, then encode the letters as numbers and give
+# away a few of them.
+#
+# Everything comes from one seed, so the same arguments give the same puzzles
+# (as long as the word list doesn't change). The output is the batch format of
+# codeword.solveBatch, with the answer and how it was made added on.
+#
+# Usage: puzzlegen.py [options] > puzzles.jsonl    (puzzlegen.py --help)
+
+import argparse, json, random, sys
+
+import codeword
+import wordcache
+import wordindex
+
+# Shortest run of squares which counts as a word, as CodewordToSolve.parse has it.
+MIN_WORD = codeword.MIN_WORD_LENGTH
+
+# The suite made by default: grid sizes (a size n is n x n, or a
+# (width, height) pair), fractions of the squares blocked, numbers of
+# letters given and puzzles of each size and density.
+DEFAULT_SIZES = (7, 9, 11, 13, 15)
+DEFAULT_DENSITIES = (0.25, 0.36, 0.48)
+DEFAULT_GIVENS = (0, 4)
+DEFAULT_COUNT = 2
+
+
+def gridSize(size):
+    """
+    The (width, height) of a grid size: n for n x n, "WxH" or a (width,
+    height) pair.
+    """
+    if isinstance(size, str):
+        size = tuple(int(n) for n in size.lower().split("x")) if "x" in size.lower() else int(size)
+    if isinstance(size, int):
+        return size, size
+    return tuple(size)
+
+
+def sizeName(size):
+    width, height = gridSize(size)
+    return "%dx%d" % (width, height)
+
+
+def latticeGrid(width, height=None):
+    """
+    The starting layout for a grid width x height (width x width if height
+    is None): blocks where both the row and the column are odd, so the even
+    rows and columns are words the full width of the grid, crossing each
+    other at every other square. True is a white square, False a block.
+    """
+    if height == None:
+        height = width
+    return [[not (y % 2 == 1 and x % 2 == 1) for x in range(width)] for y in range(height)]
+
+
+def gridSlots(grid):
+    """
+    The words (slots) of a grid layout, each a list of (y, x) squares, across
+    then down as CodewordToSolve.parse finds them.
+    """
+    height, width = len(grid), len(grid[0])
+    lines = [[(y, x) for x in range(width)] for y in range(height)]
+    lines += [[(y, x) for y in range(height)] for x in range(width)]
+    slots = list()
+    for line in lines:
+        run = list()
+        for square in line + [None]:
+            if square != None and grid[square[0]][square[1]]:
+                run.append(square)
+                continue
+            if len(run) >= MIN_WORD:
+                slots.append(run)
+            run = list()
+    return slots
+
+
+def allCovered(grid):
+    """
+    True if every white square of the grid is part of at least one word, so
+    that the solver gets to find its letter.
+    """
+    covered = set(square for slot in gridSlots(grid) for square in slot)
+    return all((y, x) in covered for y, row in enumerate(grid) for x, white in enumerate(row) if white)
+
+
+def addBlocks(grid, density, rng):
+    """
+    Block more squares of the grid until density (a fraction) of them are
+    blocks, or there is nowhere left to put one. Blocks go in pairs which
+    keep the grid the same under a half turn, and only where every white
+    square is still part of a word. Changes grid, and returns it.
+    """
+    height, width = len(grid), len(grid[0])
+    blocks = sum(not white for row in grid for white in row)
+    squares = [(y, x) for y in range(height) for x in range(width) if grid[y][x]]
+    rng.shuffle(squares)
+    for y, x in squares:
+        if blocks >= density * width * height:
+            break
+        pair = {(y, x), (height - 1 - y, width - 1 - x)}
+        if not all(grid[py][px] for py, px in pair):
+            continue
+        for py, px in pair:
+            grid[py][px] = False
+        if allCovered(grid):
+            blocks += len(pair)
+        else:
+            for py, px in pair:
+                grid[py][px] = True
+    return grid
+
+
+class GridFiller:
+    """
+    Fills the words of a grid layout with different words from the
+    dictionary. The word with fewest dictionary words that fit goes next,
+    worked out from a wordindex.BitsetBucket of each length, and each
+    word's fits are tried in a random order.
+    """
+    # Fits tried for any one word before giving up on the word above it, and
+    # words tried in all before giving up on the layout.
+    TRIES = 20
+    BUDGET = 20000
+
+    def __init__(self, dictionary):
+        self.dictionary = dictionary
+        self.buckets = dict()
+
+    def bucket(self, length):
+        bucket = self.buckets.get(length)
+        if bucket is None:
+            if hasattr(self.dictionary, 'lengthWords'):
+                words = self.dictionary.lengthWords(length)
+            else:
+                words = [word for word in wordindex.puzzleWords(self.dictionary) if len(word) == length]
+            bucket = self.buckets[length] = wordindex.BitsetBucket(words)
+        return bucket
+
+    def fits(self, slot, letters):
+        """
+        Bitset (over the words of the slot's length) of the words which fit
+        the letters already in the slot.
+        """
+        bucket = self.bucket(len(slot))
+        bits = bucket.allBits
+        for pos, square in enumerate(slot):
+            letter = letters.get(square)
+            if letter != None:
+                bits &= bucket.positionBits[pos].get(letter, 0)
+        return bits
+
+    def fill(self, grid, rng):
+        """
+        Fill the grid layout. Returns the letter of each white square, as a
+        dict of (y, x) -> letter, or None if it couldn't be done in BUDGET words.
+        """
+        slots = gridSlots(grid)
+        letters = dict()
+        used = set()
+        tries = [0]
+
+        def fillFrom(unfilled):
+            if len(unfilled) == 0:
+                return True
+            best = None
+            for slot in unfilled:
+                bits = self.fits(slot, letters)
+                count = bits.bit_count()
+                if count == 0:
+                    return False
+                if best == None or count < best[0]:
+                    best = (count, slot, bits)
+            count, slot, bits = best
+            rest = [other for other in unfilled if other is not slot]
+            words = self.bucket(len(slot)).words
+            ids = wordindex.bitsToIds(bits)
+            rng.shuffle(ids)
+            for i in ids[:GridFiller.TRIES]:
+                word = words[i]
+                if word in used:
+                    continue
+                tries[0] += 1
+                if tries[0] > GridFiller.BUDGET:
+                    return False
+                placed = [square for square in slot if square not in letters]
+                for square, letter in zip(slot, word):
+                    letters[square] = letter
+                used.add(word)
+                if fillFrom(rest):
+                    return True
+                used.discard(word)
+                for square in placed:
+                    del letters[square]
+            return False
+
+        if fillFrom(slots):
+            return letters
+        return None
+
+
+def encode(grid, letters, given, rng):
+    """
+    Turn a filled grid into a codeword: each letter used gets its own
+    number from 1 up, in a random order. Returns the matrix (as setPuzzle()
+    lays it out), the answer (code -> letter) and a rubric giving away given
+    of the codes.
+    """
+    used = sorted(set(letters.values()))
+    codes = list(range(1, len(used) + 1))
+    rng.shuffle(codes)
+    codeOf = dict(zip(used, codes))
+    matrix = tuple(tuple(codeOf[letters[(y, x)]] if white else codeword.SQ_BLOCK
+                         for x, white in enumerate(row)) for y, row in enumerate(grid))
+    answer = {code: letter for letter, code in codeOf.items()}
+    rubric = {code: answer[code] for code in sorted(rng.sample(codes, min(given, len(codes))))}
+    return matrix, answer, rubric
+
+
+def makePuzzle(filler, size, density, given, rng, attempts=20):
+    """
+    A codeword puzzle of size (see gridSize) with density of its squares
+    blocked (at least the lattice's) and given letters in the rubric, as a
+    dict in the batch format of codeword.solveBatch plus its answer. None if
+    no layout could be filled in attempts goes.
+    """
+    for _ in range(attempts):
+        grid = addBlocks(latticeGrid(*gridSize(size)), density, rng)
+        letters = filler.fill(grid, rng)
+        if letters != None:
+            matrix, answer, rubric = encode(grid, letters, given, rng)
+            return {'grid': [list(row) for row in matrix],
+                    'rubric': {str(code): letter for code, letter in rubric.items()},
+                    'multiple': True,
+                    'answer': {str(code): letter for code, letter in sorted(answer.items())},
+                    'size': size if isinstance(size, int) else sizeName(size), 'density': density, 'given': given}
+    return None
+
+
+def makeSuite(dictionary, sizes=DEFAULT_SIZES, densities=DEFAULT_DENSITIES, givens=DEFAULT_GIVENS,
+              count=DEFAULT_COUNT, seed=1):
+    """
+    count puzzles for each size, density and number of given letters. The
+    same layout and fill is used for each number of given letters, so they
+    differ only in the rubric. Puzzles which can't be made are left out.
+    """
+    filler = GridFiller(dictionary)
+    puzzles = list()
+    for size in sizes:
+        for density in densities:
+            for n in range(count):
+                # A seed of its own, so adding sizes or densities doesn't change the other puzzles.
+                fillSeed = "%d-%s-%s-%d" % (seed, size if isinstance(size, int) else sizeName(size), density, n)
+                puzzle = makePuzzle(filler, size, density, 0, random.Random(fillSeed))
+                if puzzle == None:
+                    print("Couldn't fill a %s grid at density %s" % (sizeName(size), density), file=sys.stderr)
+                    continue
+                for given in givens:
+                    rng = random.Random("%s-%d" % (fillSeed, given))
+                    codes = sorted(int(code) for code in puzzle['answer'])
+                    rubric = sorted(rng.sample(codes, min(given, len(codes))))
+                    puzzles.append(dict(puzzle,
+                                        id="gen-%s-b%02d-g%d-%d" % (sizeName(size), round(density * 100), given, n),
+                                        rubric={str(code): puzzle['answer'][str(code)] for code in rubric},
+                                        given=given))
+    return puzzles
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate codeword puzzles, as JSON lines for codeword.py --batch.")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="comma separated grid sizes, n for n x n or WxH (default %(default)s)")
+    parser.add_argument("--densities", default=",".join(map(str, DEFAULT_DENSITIES)),
+                        help="comma separated fractions of blocked squares (default %(default)s)")
+    parser.add_argument("--given", default=",".join(map(str, DEFAULT_GIVENS)),
+                        help="comma separated numbers of letters given (default %(default)s)")
+    parser.add_argument("--count", type=int, default=DEFAULT_COUNT,
+                        help="puzzles of each size and density (default %(default)s)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    puzzles = makeSuite(wordcache.loadDictionary(),
+                        [gridSize(size) if "x" in size.lower() else int(size) for size in args.sizes.split(",")],
+                        [float(density) for density in args.densities.split(",")],
+                        [int(given) for given in args.given.split(",")],
+                        args.count, args.seed)
+    for puzzle in puzzles:
+        print(json.dumps(puzzle))
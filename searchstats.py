@@ -0,0 +1,171 @@
+#!/usr/bin/python3
+# searchstats.py
+# What a search did, collected as it goes rather than printed node by node:
+# nodes, candidates filtered out, prunes per depth, branching factor, time
+# filtering against time recursing, and how deep the paths through the tree
+# got. Optionally every node is also written out as a line of JSON (a trace).
+#
+# The solvers only collect these when asked to (XwordToSolve.collectStats),
+# otherwise a node costs one test of "is there a stats object".
+
+import json
+
+
+class SearchStats:
+    def __init__(self, trace=None):
+        # Where to write the JSON trace, a file opened for text (or None).
+        self.trace = trace
+
+        self.nodes = 0           # candidates tried
+        self.expansions = 0      # nodes whose candidates were tried in turn
+        self.solutions = 0
+        self.candidatesFiltered = 0
+        self.filterTime = 0.0    # seconds in filterWordsBelow (propagation included)
+        self.setupTime = 0.0
+        self.searchTime = 0.0
+        self.timedOut = False
+        # The counters of the filter cache, if there was one (see wordindex.FilterCache).
+        self.filterCache = None
+        # Jumps back over depths, and the nogoods counters (see nogoods.NogoodStore).
+        self.backjumps = 0
+        self.nogoods = None
+
+        # Indexed by depth.
+        self.nodesByDepth = list()
+        self.prunesByDepth = list()
+        # How many paths through the tree ended (pruned, or a solution) at each depth.
+        self.pathDepths = list()
+
+    @staticmethod
+    def _bump(counts, depth, by=1):
+        while len(counts) <= depth:
+            counts.append(0)
+        counts[depth] += by
+
+    def expand(self, depth, wts):
+        """
+        The search has started on the candidates of wts, at depth.
+        """
+        self.expansions += 1
+        if self.trace != None:
+            self.write({'event': 'expand', 'depth': depth, 'word': wts.string(),
+                        'candidates': wts.numberCandidateWords})
+
+    def node(self, depth, candidate, ok, removed, seconds):
+        """
+        candidate has been tried at depth: ok is whether the words below all
+        still have candidates, removed how many candidates the filtering took
+        away from them and seconds how long that took.
+        """
+        self.nodes += 1
+        self.candidatesFiltered += removed
+        self.filterTime += seconds
+        self._bump(self.nodesByDepth, depth)
+        if not ok:
+            self._bump(self.prunesByDepth, depth)
+            self._bump(self.pathDepths, depth)
+        if self.trace != None:
+            self.write({'event': 'node', 'depth': depth, 'candidate': candidate, 'ok': ok,
+                        'removed': removed, 'seconds': round(seconds, 6)})
+
+    def solution(self, depth):
+        self.solutions += 1
+        self._bump(self.pathDepths, depth)
+        if self.trace != None:
+            self.write({'event': 'solution', 'depth': depth})
+
+    def merge(self, other):
+        """
+        Add in the counts from other, the stats of another part of the same
+        search (a branch searched by a worker process).
+        """
+        self.nodes += other.nodes
+        self.expansions += other.expansions
+        self.solutions += other.solutions
+        self.candidatesFiltered += other.candidatesFiltered
+        self.filterTime += other.filterTime
+        self.timedOut = self.timedOut or other.timedOut
+        for mine, theirs in ((self.nodesByDepth, other.nodesByDepth),
+                             (self.prunesByDepth, other.prunesByDepth),
+                             (self.pathDepths, other.pathDepths)):
+            for depth, count in enumerate(theirs):
+                self._bump(mine, depth, count)
+
+    def finish(self, setupTime, searchTime, timedOut, filterCache=None, backjumps=0, nogoods=None):
+        self.setupTime = setupTime
+        self.searchTime = searchTime
+        self.timedOut = timedOut
+        self.filterCache = filterCache
+        self.backjumps = backjumps
+        self.nogoods = nogoods
+        if self.trace != None:
+            self.write(dict(event='stats', **self.toDict()))
+
+    def branchingFactor(self):
+        """
+        Candidates tried per node expanded, and of those how many survived
+        their filtering (the effective branching factor).
+        """
+        if self.expansions == 0:
+            return 0.0, 0.0
+        return self.nodes / self.expansions, (self.nodes - sum(self.prunesByDepth)) / self.expansions
+
+    def maxDepth(self):
+        return len(self.nodesByDepth) - 1
+
+    def recursionTime(self):
+        """
+        Time searching other than filtering: trying candidates, sorting, undoing.
+        """
+        return max(self.searchTime - self.filterTime, 0.0)
+
+    def toDict(self):
+        branching, effective = self.branchingFactor()
+        return {
+            'nodes': self.nodes,
+            'expansions': self.expansions,
+            'solutions': self.solutions,
+            'candidatesFiltered': self.candidatesFiltered,
+            'branchingFactor': round(branching, 3),
+            'effectiveBranchingFactor': round(effective, 3),
+            'maxDepth': self.maxDepth(),
+            'nodesByDepth': self.nodesByDepth,
+            'prunesByDepth': self.prunesByDepth,
+            'pathDepths': self.pathDepths,
+            'setupSeconds': round(self.setupTime, 6),
+            'searchSeconds': round(self.searchTime, 6),
+            'filterSeconds': round(self.filterTime, 6),
+            'recursionSeconds': round(self.recursionTime(), 6),
+            'timedOut': self.timedOut,
+            'filterCache': self.filterCache,
+            'backjumps': self.backjumps,
+            'nogoods': self.nogoods,
+        }
+
+    def write(self, event):
+        self.trace.write(json.dumps(event) + "\n")
+
+    def show(self):
+        branching, effective = self.branchingFactor()
+        print("Nodes: %s, solutions: %d, candidates filtered out: %s" %
+              ("{:,}".format(self.nodes), self.solutions, "{:,}".format(self.candidatesFiltered)))
+        print("Branching factor: %.2f (%.2f surviving filtering), max depth %d" %
+              (branching, effective, self.maxDepth()))
+        print("Setup %.3fs, search %.3fs: filtering %.3fs, recursion %.3fs" %
+              (self.setupTime, self.searchTime, self.filterTime, self.recursionTime()))
+        if self.backjumps > 0 or self.nogoods != None:
+            print("Backjumps: %s, nogoods: %s" % ("{:,}".format(self.backjumps), self.nogoods))
+        if self.filterCache != None:
+            print("Filter cache: %(hits)s hits, %(misses)s misses, %(evictions)s evictions, "
+                  "%(entries)s entries in %(bytes)s bytes" % self.filterCache)
+        print("depth  nodes  prunes  paths ended")
+        for depth in range(len(self.nodesByDepth)):
+            print("%5d %6d %7d %12d" % (depth, self.nodesByDepth[depth],
+                                        self.prunesByDepth[depth] if depth < len(self.prunesByDepth) else 0,
+                                        self.pathDepths[depth] if depth < len(self.pathDepths) else 0))
+
+    def __getstate__(self):
+        # Sent back from worker processes without the trace file.
+        state = self.__dict__.copy()
+        state['trace'] = None
+        return state
@@ -0,0 +1,443 @@
+#!/usr/bin/python3
+# solveserver.py
+# A local server that solves codewords and circlegrams sent to it, so the
+# dictionary is loaded and the indexes built once rather than for every
+# puzzle. It speaks just enough HTTP/1.1 (one request per connection) over
+# TCP or a Unix socket:
+#
+#   POST /codeword     a codeword as a line of codeword.solveBatch takes
+#   POST /circlegram   a circlegram as a line of circlegram.solveBatch takes
+#   GET  /metrics      latency (p50, p99) and throughput of what's been solved
+#
+# and answers with the JSON result of the same solvePuzzle the batches use.
+# Either puzzle can have "timeout" in it, the seconds it may take from being
+# sent to being answered (at most the server's --timeout).
+#
+# The puzzles are solved in a pool of worker processes, forked once the
+# indexes are built so they all share them. A request waits for a worker,
+# up to --queue of them at once (more are turned away with 503); one still
+# waiting at its deadline gets 504. A puzzle of either kind whose deadline
+# passes, or whose client goes away, while it's being solved is stopped where
+# it is, through a cancel event for each worker, and answered 504 with what
+# it had got to. One that hasn't stopped CANCEL_GRACE seconds after that is
+# answered 504 without it, and its worker is only taken again once it has.
+#
+# Usage: solveserver.py [--socket PATH | --host HOST --port PORT] [options]
+#        solveserver.py --send codeword|circlegram FILE ...   (a client, for trying it)
+
+import argparse, asyncio, collections, concurrent.futures, functools, json, math, multiprocessing, os, signal, socket, sys, time
+
+import circlegram
+import codeword
+import themetable
+import wordcache
+import wordindex
+import wordlayers
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8742
+
+# Most seconds a request may have, and the default if it doesn't say.
+DEFAULT_TIMEOUT = 30.0
+
+# Most requests waiting for a worker at once.
+DEFAULT_QUEUE = 64
+
+# Seconds past a deadline to wait for a solve to notice it has been cancelled,
+# before answering 504 without it (the worker stays busy until it's done).
+CANCEL_GRACE = 1.0
+
+# Largest request body taken.
+MAX_BODY = 1 << 20
+
+# Requests the latency percentiles are over (the last so many), and the
+# seconds the recent throughput is over.
+LATENCY_WINDOW = 1000
+THROUGHPUT_WINDOW = 60.0
+
+KINDS = ('codeword', 'circlegram')
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large", 503: "Service Unavailable", 504: "Gateway Timeout"}
+
+
+class Metrics:
+    """
+    Latency and throughput of the requests of one kind: the last
+    LATENCY_WINDOW latencies for the percentiles, and when the requests of
+    the last THROUGHPUT_WINDOW seconds finished.
+    """
+    def __init__(self):
+        self.count = 0
+        self.statuses = collections.Counter()
+        self.latencies = collections.deque(maxlen=LATENCY_WINDOW)
+        self.finished = collections.deque()
+
+    def record(self, seconds, status):
+        now = time.monotonic()
+        self.count += 1
+        self.statuses[status] += 1
+        self.latencies.append(seconds)
+        self.finished.append(now)
+        while self.finished[0] < now - THROUGHPUT_WINDOW:
+            self.finished.popleft()
+
+    def percentile(self, fraction):
+        """
+        The latency fraction of the recent requests took no longer than
+        (nearest rank), or None if there haven't been any.
+        """
+        if len(self.latencies) == 0:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+    def toDict(self, uptime):
+        now = time.monotonic()
+        recent = sum(1 for finished in self.finished if finished >= now - THROUGHPUT_WINDOW)
+        p50 = self.percentile(0.5)
+        p99 = self.percentile(0.99)
+        return {'requests': self.count,
+                'statuses': dict(self.statuses),
+                'p50Seconds': None if p50 == None else round(p50, 6),
+                'p99Seconds': None if p99 == None else round(p99, 6),
+                'perSecond': round(self.count / max(uptime, 1e-9), 3),
+                'recentPerSecond': round(recent / max(min(uptime, THROUGHPUT_WINDOW), 1e-9), 3)}
+
+
+class SolveServer:
+    def __init__(self, dictionary, engine=wordindex.WordIndex.name, workers=None, queue=DEFAULT_QUEUE,
+                 timeout=DEFAULT_TIMEOUT, themes=None, topK=circlegram.TOP_K, codewordLayers=(),
+                 circlegramLayers=(), frequencies=None):
+        self.engine = engine
+        self.workers = workers if workers else (os.cpu_count() or 1)
+        self.queueLimit = queue
+        self.timeout = timeout
+        # Each kind of puzzle has its own layers over the one dictionary (see wordlayers.py).
+        self.codewordIndex = wordlayers.applyLayers(wordindex.makeEngine(engine, dictionary), codewordLayers)
+        wordlayers.useFrequencies(self.codewordIndex, frequencies)
+        self.circlegramIndex = wordlayers.applyLayers(circlegram.INDEXES['anagram'](dictionary), circlegramLayers)
+        self.themes = themes
+        self.topK = topK
+
+        self.executor = None
+        self.cancelEvents = None
+        self.freeWorkers = None
+        self.waiting = 0
+        self.started = time.monotonic()
+        self.metrics = {kind: Metrics() for kind in KINDS}
+        self.rejected = collections.Counter()
+
+    def startWorkers(self):
+        """
+        Fork the worker processes, with the indexes, and a cancel event each.
+        Each request has one worker to itself (see solve), so the cancel
+        event of the worker it's on stops just that request.
+        """
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+        self.cancelEvents = [context.Event() for _ in range(self.workers)]
+        self.executor = concurrent.futures.ProcessPoolExecutor(
+            self.workers, mp_context=context, initializer=_initServerWorker,
+            initargs=(self.codewordIndex, self.engine, self.circlegramIndex, self.themes, self.topK,
+                      self.cancelEvents))
+        # Forked processes are started with the first job; get them going now,
+        # before there's a connection open for them to keep a copy of.
+        self.executor.submit(int).result()
+        self.freeWorkers = asyncio.Queue()
+        for worker in range(self.workers):
+            self.freeWorkers.put_nowait(worker)
+
+    async def serve(self, socketPath=None, host=DEFAULT_HOST, port=DEFAULT_PORT, ready=None):
+        """
+        Serve until cancelled (or sent SIGTERM), on the Unix socket at
+        socketPath if given, otherwise on host:port. ready, if given, is
+        called once it's listening.
+        """
+        self.startWorkers()
+        try:
+            try:
+                asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+            except NotImplementedError:
+                pass
+            if socketPath != None:
+                if os.path.exists(socketPath):
+                    os.remove(socketPath)
+                server = await asyncio.start_unix_server(self.handle, path=socketPath)
+            else:
+                server = await asyncio.start_server(self.handle, host, port)
+            self.started = time.monotonic()
+            if ready != None:
+                ready()
+            async with server:
+                await server.serve_forever()
+        finally:
+            for event in self.cancelEvents:
+                event.set()
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            if socketPath != None and os.path.exists(socketPath):
+                os.remove(socketPath)
+
+    async def handle(self, reader, writer):
+        start = time.monotonic()
+        try:
+            try:
+                method, path, body = await readRequest(reader)
+            except RequestTooLarge:
+                await respond(writer, 413, {'error': "request too large"})
+                return
+            except (ValueError, asyncio.IncompleteReadError):
+                await respond(writer, 400, {'error': "bad request"})
+                return
+
+            kind = path.strip("/")
+            if path == "/metrics":
+                if method != "GET":
+                    await respond(writer, 405, {'error': "GET only"})
+                else:
+                    await respond(writer, 200, self.metricsDict())
+            elif kind in KINDS:
+                if method != "POST":
+                    await respond(writer, 405, {'error': "POST only"})
+                    return
+                status, result = await self.solve(kind, body, reader, start)
+                if status == None:
+                    # The client has gone, so there's no one to answer.
+                    self.metrics[kind].record(time.monotonic() - start, 'disconnected')
+                    return
+                await respond(writer, status, result)
+                self.metrics[kind].record(time.monotonic() - start, result.get('status', status))
+            else:
+                await respond(writer, 404, {'error': "no such path: %s" % path})
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def solve(self, kind, body, reader, start):
+        """
+        Solve the puzzle in body on a worker, and return the HTTP status and
+        the result (None, None if the client went away first). Gives up with
+        503 if too many requests are waiting already, and with 504 if the
+        deadline passes before a worker is free or the solve finishes.
+        """
+        try:
+            puzzle = json.loads(body)
+            timeout = min(float(puzzle.get('timeout', self.timeout)), self.timeout)
+        except (ValueError, TypeError, AttributeError) as e:
+            return 400, {'id': None, 'status': 'error', 'error': "%s: %s" % (type(e).__name__, e)}
+        deadline = start + timeout
+
+        if self.waiting >= self.queueLimit:
+            self.rejected['queueFull'] += 1
+            return 503, {'id': puzzle.get('id'), 'status': 'rejected', 'error': "queue full"}
+
+        # The client only sends the one request, so reading anything more
+        # (the end of the stream) means it has gone.
+        disconnected = asyncio.ensure_future(reader.read(1))
+        try:
+            self.waiting += 1
+            getWorker = asyncio.ensure_future(self.freeWorkers.get())
+            try:
+                await asyncio.wait({getWorker, disconnected}, timeout=deadline - time.monotonic(),
+                                   return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                self.waiting -= 1
+            if not getWorker.done():
+                getWorker.cancel()
+                if disconnected.done():
+                    return None, None
+                self.rejected['queueTimeout'] += 1
+                return 504, {'id': puzzle.get('id'), 'status': 'timeout', 'error': "no worker free in time"}
+            worker = getWorker.result()
+            if disconnected.done():
+                self.freeWorkers.put_nowait(worker)
+                return None, None
+
+            try:
+                cancelEvent = self.cancelEvents[worker]
+                cancelEvent.clear()
+                loop = asyncio.get_running_loop()
+                job = loop.run_in_executor(self.executor, _serveRequest, kind, body, worker,
+                                           max(0.0, deadline - time.monotonic()))
+                await asyncio.wait({job, disconnected}, timeout=deadline - time.monotonic() + CANCEL_GRACE,
+                                   return_when=asyncio.FIRST_COMPLETED)
+                if not job.done():
+                    cancelEvent.set()
+                    try:
+                        result = await asyncio.wait_for(asyncio.shield(job), CANCEL_GRACE)
+                    except asyncio.TimeoutError:
+                        # Still going: the worker is only free again once its job is done.
+                        self.rejected['solveTimeout'] += 1
+                        job.add_done_callback(functools.partial(self.releaseWorker, worker))
+                        worker = None
+                        if disconnected.done():
+                            return None, None
+                        return 504, {'id': puzzle.get('id'), 'status': 'timeout',
+                                     'error': "solve didn't stop in time"}
+                    if disconnected.done():
+                        return None, None
+                    return 504, result
+                result = job.result()
+            finally:
+                if worker != None:
+                    self.freeWorkers.put_nowait(worker)
+        finally:
+            disconnected.cancel()
+
+        if result['status'] == 'error':
+            return 400, result
+        return 200, result
+
+    def releaseWorker(self, worker, job):
+        """
+        Put worker back for the next request once job, a solve which ran on
+        past its deadline, is done.
+        """
+        if not job.cancelled():
+            job.exception()
+        self.freeWorkers.put_nowait(worker)
+
+    def metricsDict(self):
+        uptime = time.monotonic() - self.started
+        return {'uptimeSeconds': round(uptime, 3),
+                'workers': self.workers,
+                'busy': self.workers - self.freeWorkers.qsize(),
+                'waiting': self.waiting,
+                'queueLimit': self.queueLimit,
+                'rejected': dict(self.rejected),
+                'kinds': {kind: metrics.toDict(uptime) for kind, metrics in self.metrics.items()}}
+
+
+class RequestTooLarge(ValueError):
+    pass
+
+
+async def readRequest(reader):
+    """
+    Read one HTTP request from reader, returning its method, path (without
+    any query) and body.
+    """
+    requestLine = (await reader.readline()).decode("latin-1").rstrip("\r\n")
+    method, target, _ = requestLine.split(" ", 2)
+    headers = dict()
+    while True:
+        line = (await reader.readline()).decode("latin-1").rstrip("\r\n")
+        if line == "":
+            break
+        name, value = line.split(":", 1)
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get('content-length', 0))
+    if length > MAX_BODY:
+        raise RequestTooLarge()
+    body = await reader.readexactly(length) if length > 0 else b""
+    return method, target.split("?", 1)[0], body.decode("utf-8")
+
+
+async def respond(writer, status, result):
+    body = json.dumps(result).encode("utf-8")
+    writer.write(("HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n"
+                  "Connection: close\r\n\r\n" % (status, REASONS[status], len(body))).encode("latin-1") + body)
+    await writer.drain()
+
+
+# The indexes, settings and cancel events each worker process solves with.
+_serverSettings = None
+
+def _initServerWorker(codewordIndex, engine, circlegramIndex, themes, topK, cancelEvents):
+    global _serverSettings
+    _serverSettings = (codewordIndex, engine, circlegramIndex, themes, topK, cancelEvents)
+
+def _serveRequest(kind, line, worker, timeout):
+    codewordIndex, engine, circlegramIndex, themes, topK, cancelEvents = _serverSettings
+    if kind == 'codeword':
+        return codeword.solvePuzzle(line, codewordIndex, engine, timeout, cancelEvent=cancelEvents[worker])
+    return circlegram.solvePuzzle(line, circlegramIndex, themes, topK, cancelEvents[worker])
+
+
+def request(method, path, payload=None, socketPath=None, host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=None):
+    """
+    A client: send one request to the server (on the Unix socket at
+    socketPath if given, otherwise at host:port) with payload as its JSON
+    body, and return the HTTP status and the JSON answer.
+    """
+    if socketPath != None:
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.settimeout(timeout)
+        connection.connect(socketPath)
+    else:
+        connection = socket.create_connection((host, port), timeout)
+    with connection:
+        body = b"" if payload == None else json.dumps(payload).encode("utf-8")
+        connection.sendall(("%s %s HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+                            "Content-Length: %d\r\nConnection: close\r\n\r\n"
+                            % (method, path, len(body))).encode("latin-1") + body)
+        with connection.makefile("rb") as reader:
+            status = int(reader.readline().split(b" ", 2)[1])
+            length = 0
+            while True:
+                line = reader.readline().strip()
+                if line == b"":
+                    break
+                name, value = line.split(b":", 1)
+                if name.strip().lower() == b"content-length":
+                    length = int(value)
+            answer = reader.read(length)
+    return status, json.loads(answer)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Solve codewords and circlegrams sent to a local server.")
+    parser.add_argument("--socket", metavar="PATH", help="listen on (or with --send, send to) a Unix socket")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="host to listen on (default %(default)s)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="port to listen on (default %(default)s)")
+    parser.add_argument("--engine", default=wordindex.WordIndex.name, choices=sorted(wordindex.ENGINES),
+                        help="codeword candidate engine (default %(default)s)")
+    parser.add_argument("--workers", type=int, help="worker processes (default one per CPU)")
+    parser.add_argument("--queue", type=int, default=DEFAULT_QUEUE,
+                        help="most requests waiting for a worker (default %(default)s)")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT,
+                        help="most seconds a request may take (default %(default)s)")
+    parser.add_argument("--themes", nargs="?", const=themetable.DEFAULT_THEMES, metavar="FILE",
+                        help="keep only the circlegram answers whose words share a theme, from FILE")
+    parser.add_argument("--top", type=int, default=circlegram.TOP_K,
+                        help="circlegram answers kept with --themes (default %(default)s)")
+    parser.add_argument("--frequencies", metavar="FILE",
+                        help="try the commonest codeword candidates first, ranked by FILE (see wordlayers.py)")
+    parser.add_argument("--codeword-layer", action="append", default=list(), metavar="FILE",
+                        help="add words to and take words out of the codeword dictionary, from FILE")
+    parser.add_argument("--circlegram-layer", action="append", default=list(), metavar="FILE",
+                        help="add words to and take words out of the circlegram dictionary, from FILE")
+    parser.add_argument("--send", nargs=2, metavar=("KIND", "FILE"),
+                        help="be a client: send each puzzle (JSON line) in FILE, - for stdin, as KIND and print the answers")
+    args = parser.parse_args()
+
+    if args.send != None:
+        kind, fileName = args.send
+        inputFile = sys.stdin if fileName == "-" else open(fileName, "r")
+        with inputFile:
+            for line in inputFile:
+                if len(line.strip()) == 0:
+                    continue
+                status, answer = request("POST", "/" + kind, json.loads(line), args.socket, args.host, args.port)
+                print(json.dumps(answer))
+        status, answer = request("GET", "/metrics", None, args.socket, args.host, args.port)
+        print(json.dumps(answer), file=sys.stderr)
+        sys.exit()
+
+    my_dictionary = wordcache.loadDictionary()
+    themes = None
+    if args.themes != None:
+        themes = themetable.loadThemeTable(my_dictionary, args.themes)
+        if themes == None:
+            print("Theme scoring needs numpy, returning every circlegram answer", file=sys.stderr)
+
+    server = SolveServer(my_dictionary, args.engine, args.workers, args.queue, args.timeout, themes, args.top,
+                         args.codeword_layer, args.circlegram_layer, args.frequencies)
+    where = args.socket if args.socket != None else "%s:%d" % (args.host, args.port)
+    try:
+        asyncio.run(server.serve(args.socket, args.host, args.port,
+                                 ready=lambda: print("Serving on %s with %d workers" % (where, server.workers),
+                                                     file=sys.stderr, flush=True)))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
@@ -0,0 +1,59 @@
+#!/usr/bin/python3
+# test_circlegram.py
+# Theme culling only ranks the answers: a puzzle with answers still has them
+# when none of its words are in a theme.
+#
+# Usage: python3 -m unittest test_circlegram
+
+import json, os, tempfile, unittest
+
+import circlegram
+import themetable
+import wordindex
+
+WORDS = ["house", "table", "bleat", "horse", "shore", "mercury", "jupiter", "neptune"]
+
+
+@unittest.skipIf(themetable.numpy is None, "theme scoring needs numpy")
+class ThemeCullTest(unittest.TestCase):
+    def setUp(self):
+        self.index = wordindex.AnagramIndex(WORDS)
+        self.directory = tempfile.TemporaryDirectory()
+        sourcePath = os.path.join(self.directory.name, "themes.txt")
+        with open(sourcePath, "w") as sourceFile:
+            sourceFile.write("planets: mercury jupiter neptune\n")
+        self.themes = themetable.loadThemeTable(WORDS, sourcePath)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def solve(self, circles, themes):
+        return circlegram.solvePuzzle(json.dumps({"id": "t", "circles": circles}), self.index, themes)
+
+    def test_no_theme_in_common_is_still_solved(self):
+        circles = ["hous", "tabl", "hors"]
+        unscored = self.solve(circles, None)
+        scored = self.solve(circles, self.themes)
+        self.assertEqual(unscored['status'], 'solved')
+        self.assertEqual(scored['status'], 'solved')
+        self.assertEqual(sorted(tuple(r['words']) for r in scored['results']),
+                         sorted(tuple(r['words']) for r in unscored['results']))
+        self.assertTrue(all(r['score'] == 0 for r in scored['results']))
+
+    def test_table_rebuilt_for_dictionary_of_same_size(self):
+        # As many words, but the word ids of the planets have moved.
+        changed = ["house", "table", "bleat", "horse", "shore", "saturns", "mercury", "jupiter"]
+        self.assertEqual(len(changed), len(WORDS))
+        table = themetable.loadThemeTable(changed, self.themes.path[:-len(themetable.TABLE_SUFFIX)])
+        self.assertEqual(table.themesOf("jupiter"), ["planets"])
+        self.assertEqual(table.themesOf("saturns"), [])
+
+    def test_themed_answers_rank_first(self):
+        scored = self.solve(["mercry", "jpiter", "neptne"], self.themes)
+        self.assertEqual(scored['status'], 'solved')
+        self.assertEqual(scored['results'][0]['words'], ["mercury", "jupiter", "neptune"])
+        self.assertGreater(scored['results'][0]['score'], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+#!/usr/bin/python3
+# test_codeword.py
+# Grids which parse to no words at all: the search has nothing to do, and
+# says so rather than falling over. And iter_solutions carrying on from a
+# checkpoint as solve does.
+#
+# Usage: python3 -m unittest test_codeword
+
+import json, os, tempfile, unittest
+
+import codeword
+import wordcache
+import wordindex
+
+WORDS = ["cart", "dart", "part", "tarp", "carts"]
+
+
+class NoWordsTest(unittest.TestCase):
+    def setUp(self):
+        self.index = wordindex.makeEngine(wordindex.WordIndex.name, WORDS)
+
+    def solvePuzzle(self, puzzle):
+        return codeword.solvePuzzle(json.dumps(puzzle), self.index)
+
+    def test_grid_with_no_words(self):
+        for grid in ([[1, 2, 3]], [[1, 2]], [[1, codeword.SQ_BLOCK, 2]]):
+            cwts = codeword.CodewordToSolve(tuple(tuple(row) for row in grid), dict(), self.index)
+            self.assertEqual(cwts.parse(), [])
+            self.assertEqual(cwts.solve(), [])
+            self.assertEqual(list(cwts.iter_solutions()), [])
+            self.assertEqual(cwts.count_solutions(2), 0)
+            self.assertFalse(cwts.is_unique())
+            result = self.solvePuzzle({"id": "none", "grid": grid})
+            self.assertEqual(result['status'], 'unsolved')
+            self.assertEqual(result['solutions'], [])
+
+    def test_grid_with_no_words_in_parallel(self):
+        cwts = codeword.CodewordToSolve(((1, 2, 3),), dict(), self.index)
+        cwts.useWorkers(2)
+        self.assertEqual(cwts.solve(), [])
+
+    def test_min_word_longer_than_every_run(self):
+        grid = [[1, 2, 3, 4]]
+        self.assertEqual(self.solvePuzzle({"id": "short", "grid": grid})['status'], 'solved')
+        result = self.solvePuzzle({"id": "long", "grid": grid, "minWord": 5})
+        self.assertEqual(result['status'], 'unsolved')
+        self.assertEqual(result['solutions'], [])
+        self.assertEqual(self.solvePuzzle({"id": "count", "grid": grid, "minWord": 5, "count": 2})['count'], 0)
+
+
+class CheckpointTest(unittest.TestCase):
+    def setUp(self):
+        self.dictionary = wordcache.loadDictionary()
+        self.matrix = codeword.setPuzzle()[0][3:9]
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "search.checkpoint")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def solver(self):
+        cwts = codeword.CodewordToSolve(self.matrix, dict(), self.dictionary)
+        cwts.useCheckpoint(self.path, 0.0)
+        return cwts
+
+    def test_iter_solutions_carries_on_from_checkpoint(self):
+        everything = [s.solvedRubric for s in self.solver().iter_solutions()]
+        self.assertFalse(os.path.exists(self.path))
+
+        # Stopped part way through, as if it had run out of time.
+        cwts = self.solver()
+        partial = list()
+        for solution in cwts.iter_solutions():
+            partial.append(solution.solvedRubric)
+            if len(partial) == 100:
+                cwts.xwts.deadline = 0.0
+        self.assertTrue(cwts.xwts.timedOut)
+        self.assertLess(len(partial), len(everything))
+        self.assertTrue(os.path.exists(self.path))
+
+        cwts = self.solver()
+        resumed = [s.solvedRubric for s in cwts.iter_solutions()]
+        self.assertEqual(resumed, everything)
+        self.assertFalse(os.path.exists(self.path))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,213 @@
+#!/usr/bin/python3
+# themetable.py
+# Which words go together, for culling circlegram answers whose three words
+# don't share a theme. The themes come from a plain text list (themes.txt),
+# compiled offline into a small numpy file next to it (themes.txt.npz): the
+# dictionary word ids (see wordindex.dictionaryWords) of the words with a
+# theme, and a word x theme matrix of which word is in which theme.
+#
+# A triple of words scores one for each theme all three are in, and
+# PAIR_WEIGHT for each theme each pair of them is in (so a theme all three
+# share counts 1 + 3 x PAIR_WEIGHT). The triples of three word lists are
+# scored a chunk at a time with numpy, keeping only the best few, so a letter
+# with hundreds of words in each circle never has all its triples in memory
+# (or made into Results) at once.
+#
+# The table is rebuilt by itself when themes.txt or the dictionary changes (it
+# keeps a digest of the dictionary's words, not just how many there are).
+#
+# Usage: themetable.py [themes.txt]    compile (or recompile) the table
+
+import hashlib, heapq, os, sys, time
+
+try:
+    import numpy
+except ImportError:
+    # Theme scoring needs it; without it circlegram.py returns every triple.
+    numpy = None
+
+import wordcache
+import wordindex
+
+DEFAULT_THEMES = os.path.join(os.path.dirname(os.path.realpath(__file__)), "themes.txt")
+TABLE_SUFFIX = '.npz'
+
+# What a theme shared by two of the three words counts for, against one for
+# a theme shared by all three.
+PAIR_WEIGHT = 0.25
+
+# Most triples scored in one go.
+CHUNK_CELLS = 1 << 20
+
+
+def readThemes(sourcePath):
+    """
+    The themes in a theme list, as a list of (name, words). Each line is a
+    name, a colon and the words, space separated; # starts a comment line.
+    """
+    themes = list()
+    with open(sourcePath, "r", encoding="utf-8") as sourceFile:
+        for line in sourceFile:
+            line = line.strip()
+            if len(line) == 0 or line.startswith("#"):
+                continue
+            name, _, words = line.partition(":")
+            themes.append((name.strip(), words.lower().split()))
+    return themes
+
+
+def dictionaryDigest(words):
+    """
+    A digest of the dictionary's words, in order: the table holds word ids,
+    which only mean the same words in the same dictionary.
+    """
+    return hashlib.sha1("\n".join(words).encode("utf-8")).hexdigest()
+
+
+def compileThemes(sourcePath, dictionary, tablePath=None):
+    """
+    Compile the theme list at sourcePath against dictionary to a table (by
+    default sourcePath + TABLE_SUFFIX). Returns the path of the table and
+    the words of the list which aren't in the dictionary (and so are left out).
+    """
+    if tablePath == None:
+        tablePath = sourcePath + TABLE_SUFFIX
+    stat = os.stat(sourcePath)
+    themes = readThemes(sourcePath)
+    words = wordindex.dictionaryWords(dictionary)
+    wordIds = {word: i for i, word in enumerate(words)}
+
+    missing = list()
+    themed = dict()  # word id -> the themes it is in
+    for t, (name, themeWords) in enumerate(themes):
+        for word in themeWords:
+            if word in wordIds:
+                themed.setdefault(wordIds[word], set()).add(t)
+            elif word not in missing:
+                missing.append(word)
+    ids = numpy.array(sorted(themed), dtype=numpy.uint32)
+    membership = numpy.zeros((len(ids), len(themes)), dtype=numpy.uint8)
+    for row, wordId in enumerate(ids.tolist()):
+        membership[row, sorted(themed[wordId])] = 1
+
+    # Write to one side and move into place, as wordcache does.
+    tmpPath = "%s.%d.tmp" % (tablePath, os.getpid())
+    with open(tmpPath, "wb") as tableFile:
+        numpy.savez_compressed(tableFile, ids=ids, membership=membership,
+                               themes=numpy.array([name for name, _ in themes]),
+                               source=numpy.array([stat.st_size, stat.st_mtime_ns], dtype=numpy.int64),
+                               dictionaryWords=numpy.array(len(words), dtype=numpy.int64),
+                               dictionaryDigest=numpy.array(dictionaryDigest(words)))
+    os.replace(tmpPath, tablePath)
+    return tablePath, missing
+
+
+class ThemeTable:
+    """
+    A compiled theme table, loaded against the dictionary it was compiled for.
+    """
+    def __init__(self, path, dictionary):
+        self.path = path
+        with numpy.load(path) as table:
+            self.ids = table['ids']
+            self.membership = table['membership']
+            self.themes = [str(name) for name in table['themes']]
+            self.sourceSize, self.sourceMtime = (int(n) for n in table['source'])
+            self.dictionaryCount = int(table['dictionaryWords'])
+            self.dictionaryDigest = str(table['dictionaryDigest'])
+        words = wordindex.dictionaryWords(dictionary)
+        if len(words) != self.dictionaryCount or dictionaryDigest(words) != self.dictionaryDigest:
+            raise ValueError("%s was compiled for a different dictionary" % path)
+        # The table's row of each word with a theme.
+        self.rows = {words[wordId]: row for row, wordId in enumerate(self.ids.tolist())}
+        self.vectors = self.membership.astype(numpy.float32)
+
+    def isFor(self, stat):
+        """
+        True if this table was compiled from a theme list with this os.stat.
+        """
+        return self.sourceSize == stat.st_size and self.sourceMtime == stat.st_mtime_ns
+
+    def themesOf(self, word):
+        row = self.rows.get(word)
+        if row == None:
+            return list()
+        return [self.themes[t] for t in numpy.nonzero(self.membership[row])[0].tolist()]
+
+    def wordVectors(self, words):
+        """
+        The theme vectors of words, one row each (all zero for a word with no theme).
+        """
+        vectors = numpy.zeros((len(words), len(self.themes)), dtype=numpy.float32)
+        known = [(i, self.rows[word]) for i, word in enumerate(words) if word in self.rows]
+        if len(known) > 0:
+            at, rows = zip(*known)
+            vectors[list(at)] = self.vectors[list(rows)]
+        return vectors
+
+    def topTriples(self, wordLists, k):
+        """
+        The k best scoring triples of one word from each of the three
+        wordLists, best first, as (score, (word, word, word)). Triples with no
+        theme in common at all (score 0) are left out. Also returns how many
+        triples were scored.
+        """
+        a, b, c = (self.wordVectors(words) for words in wordLists)
+        if sum(vectors.any() for vectors in (a, b, c)) < 2:
+            # No two of the lists have a word with a theme, so no triple can score.
+            return list(), 0
+        ab, ac, bc = a @ b.T, a @ c.T, b @ c.T
+        best = list()  # heap of the k best (score, i, j, l) so far
+        chunk = max(1, CHUNK_CELLS // max(1, len(b) * len(c)))
+        for start in range(0, len(a), chunk):
+            end = start + chunk
+            scores = numpy.einsum('it,jt,lt->ijl', a[start:end], b, c)
+            scores += PAIR_WEIGHT * (ab[start:end, :, None] + ac[start:end, None, :] + bc[None, :, :])
+            flat = scores.ravel()
+            if len(flat) > k:
+                top = numpy.argpartition(flat, -k)[-k:]
+            else:
+                top = numpy.arange(len(flat))
+            top = top[flat[top] > 0]
+            for cell, score in zip(top.tolist(), flat[top].tolist()):
+                i, j, l = numpy.unravel_index(cell, scores.shape)
+                entry = (score, start + int(i), int(j), int(l))
+                if len(best) < k:
+                    heapq.heappush(best, entry)
+                elif entry > best[0]:
+                    heapq.heapreplace(best, entry)
+        best.sort(reverse=True)
+        triples = [(score, (wordLists[0][i], wordLists[1][j], wordLists[2][l])) for score, i, j, l in best]
+        return triples, len(a) * len(b) * len(c)
+
+
+def loadThemeTable(dictionary, sourcePath=DEFAULT_THEMES):
+    """
+    Load the theme table of sourcePath for dictionary, compiling it first if
+    it is missing or out of date. None if numpy isn't there to use it.
+    """
+    if numpy is None:
+        return None
+    tablePath = sourcePath + TABLE_SUFFIX
+    try:
+        table = ThemeTable(tablePath, dictionary)
+        if table.isFor(os.stat(sourcePath)):
+            return table
+    except (OSError, ValueError, KeyError):
+        pass
+    compileThemes(sourcePath, dictionary, tablePath)
+    return ThemeTable(tablePath, dictionary)
+
+
+if __name__ == "__main__":
+    dictionary = wordcache.loadDictionary()
+    for sourcePath in sys.argv[1:] or [DEFAULT_THEMES]:
+        start = time.time()
+        tablePath, missing = compileThemes(sourcePath, dictionary)
+        table = ThemeTable(tablePath, dictionary)
+        print("%s: %d themes, %s words, %s bytes, %.2fs" % (tablePath, len(table.themes),
+                                                            "{:,}".format(len(table.ids)),
+                                                            "{:,}".format(os.path.getsize(tablePath)),
+                                                            time.time() - start))
+        if len(missing) > 0:
+            print("Not in the dictionary: %s" % " ".join(missing))
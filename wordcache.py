@@ -0,0 +1,326 @@
+#!/usr/bin/python3
+# wordcache.py
+# A compiled, memory mapped form of the dictionary, so that a solver can
+# start in milliseconds rather than reading, cleaning and indexing the whole
+# word list every run.
+#
+# The cache sits next to the word list (ukenglish.txt -> ukenglish.txt.wordcache)
+# and is rebuilt automatically when the word list changes size or time. It is
+# mapped read only, so any number of processes share the one copy in memory.
+#
+# Usage: wordcache.py [wordlist ...]    compile (or recompile) the caches
+
+import array, bisect, json, mmap, os, struct, sys, time
+
+import wordindex
+
+try:
+    import numpy
+except ImportError:
+    # Only needed for the numpy engine's views of the cache.
+    numpy = None
+
+MAGIC = b'XWORDC01'
+# After MAGIC: size and mtime (ns) of the word list compiled, and the length
+# of the JSON table of contents which follows.
+HEADER = struct.Struct('<QqI')
+# After each signature in a length's signature table: offset and count of its
+# word ids, and offset of its position bitsets (NO_BITS if not stored).
+SIGNATURE_RECORD = struct.Struct('<III')
+NO_BITS = 0xFFFFFFFF
+# Buckets smaller than this don't get bitsets stored; they are quicker to
+# work out than to read.
+MIN_BITS_BUCKET = 64
+CACHE_SUFFIX = '.wordcache'
+
+DEFAULT_WORDLIST = os.path.join(os.path.dirname(os.path.realpath(__file__)), "ukenglish.txt")
+
+
+def _uint32s(values):
+    values = array.array('I', values)
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values.tobytes()
+
+
+def compileDictionary(sourcePath, cachePath=None):
+    """
+    Compile the word list at sourcePath to a cache file (by default
+    sourcePath + CACHE_SUFFIX). The file is MAGIC, HEADER, the table of
+    contents (JSON) and then, 8 byte aligned, the data:
+
+      the words of each length, N x L bytes of a-z one after the other
+      for each length, its signature table: sorted records of the L signature
+        bytes followed by a SIGNATURE_RECORD (4 byte aligned)
+      the word ids of each signature, uint32 ids within the length's words
+      the position bitsets of the larger signature buckets: L x 26 bitsets of
+        (N + 7) // 8 bytes each, letter by letter within position by position
+
+    Offsets in the table of contents and records are from the start of the
+    data. Returns the path of the cache.
+    """
+    if cachePath == None:
+        cachePath = sourcePath + CACHE_SUFFIX
+    stat = os.stat(sourcePath)
+    with open(sourcePath, "r", encoding="latin-1") as myfile:
+        words = list(wordindex.puzzleWords(myfile.read().splitlines()))
+
+    byLength = dict()
+    for word in words:
+        byLength.setdefault(len(word), list()).append(word)
+    tables = dict()
+    for length, lengthWords in byLength.items():
+        sigIds = dict()
+        for i, word in enumerate(lengthWords):
+            sigIds.setdefault(wordindex.signature(word), list()).append(i)
+        tables[length] = sorted(sigIds.items())
+
+    # Lay it out first, so the signature tables can point forward at the ids and bitsets.
+    lengths = dict()
+    offset = 0
+    for length in sorted(byLength):
+        lengths[length] = {'words': offset, 'count': len(byLength[length])}
+        offset += length * len(byLength[length])
+    for length in sorted(tables):
+        offset += -offset % 4
+        lengths[length]['signatures'] = offset
+        lengths[length]['signatureCount'] = len(tables[length])
+        offset += len(tables[length]) * (length + SIGNATURE_RECORD.size)
+    offset += -offset % 4
+    idsOffset = offset
+    bitsOffset = idsOffset + 4 * len(words)
+
+    data = bytearray()
+    for length in sorted(byLength):
+        data += "".join(byLength[length]).encode('ascii')
+
+    idsData = bytearray()
+    bitsData = bytearray()
+    for length in sorted(tables):
+        data += bytes(-len(data) % 4)
+        for sig, ids in tables[length]:
+            sigBits = NO_BITS
+            if len(ids) >= MIN_BITS_BUCKET:
+                sigBits = bitsOffset + len(bitsData)
+                bucket = wordindex.BitsetBucket([byLength[length][i] for i in ids])
+                size = (len(ids) + 7) // 8
+                for pos in range(length):
+                    for letter in wordindex.LETTERS:
+                        bitsData += bucket.positionBits[pos].get(letter, 0).to_bytes(size, 'little')
+            data += bytes(sig) + SIGNATURE_RECORD.pack(idsOffset + len(idsData), len(ids), sigBits)
+            idsData += _uint32s(ids)
+    data += bytes(-len(data) % 4)
+    data += idsData
+    data += bitsData
+
+    toc = json.dumps({'words': len(words), 'lengths': lengths}).encode('ascii')
+    header = MAGIC + HEADER.pack(stat.st_size, stat.st_mtime_ns, len(toc)) + toc
+    header += bytes(-len(header) % 8)
+
+    # Write to one side and move into place, so no-one ever maps half a file.
+    tmpPath = "%s.%d.tmp" % (cachePath, os.getpid())
+    with open(tmpPath, "wb") as cacheFile:
+        cacheFile.write(header)
+        cacheFile.write(data)
+    os.replace(tmpPath, cachePath)
+    return cachePath
+
+
+class CompiledDictionary:
+    """
+    A compiled dictionary cache, memory mapped. Nothing is decoded until it is
+    asked for, and then only the length or signature bucket needed.
+
+    The candidate engines in wordindex take one of these in place of a word
+    list: it answers bucket(signature) like wordindex.SignatureBuckets, and
+    has the bitsets and matrices the bitset and numpy engines want ready made.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as cacheFile:
+            self.map = mmap.mmap(cacheFile.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(MAGIC)] != MAGIC:
+            raise ValueError("%s is not a word cache" % path)
+        self.sourceSize, self.sourceMtime, tocLength = HEADER.unpack_from(self.map, len(MAGIC))
+        tocStart = len(MAGIC) + HEADER.size
+        toc = json.loads(self.map[tocStart:tocStart + tocLength])
+        self.dataStart = tocStart + tocLength + (-(tocStart + tocLength) % 8)
+        self.count = toc['words']
+        self.lengths = {int(length): entry for length, entry in toc['lengths'].items()}
+
+        self.wordsOfLength = dict()
+        self.signatures = dict()  # signature -> (ids offset, count, bits offset) or None
+        self.buckets = dict()
+
+    def __getstate__(self):
+        # Passed to another process (e.g. a spawned worker) as just the path,
+        # it maps the same file and so shares the same pages.
+        return self.path
+
+    def __setstate__(self, path):
+        self.__init__(path)
+
+    def isFor(self, stat):
+        """
+        True if this cache was compiled from a word list with this os.stat.
+        """
+        return self.sourceSize == stat.st_size and self.sourceMtime == stat.st_mtime_ns
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for length in sorted(self.lengths):
+            yield from self.lengthWords(length)
+
+    def lengthWords(self, length):
+        """
+        All the words of one length, in word list order.
+        """
+        words = self.wordsOfLength.get(length)
+        if words is None:
+            entry = self.lengths.get(length)
+            if entry is None:
+                words = list()
+            else:
+                start = self.dataStart + entry['words']
+                text = self.map[start:start + length * entry['count']].decode('ascii')
+                words = [text[i:i + length] for i in range(0, len(text), length)]
+            self.wordsOfLength[length] = words
+        return words
+
+    def lengthMatrix(self, length):
+        """
+        The words of one length as an N x L uint8 numpy matrix of ASCII codes,
+        a view onto the mapped file.
+        """
+        entry = self.lengths.get(length)
+        if entry is None:
+            return numpy.zeros((0, length), dtype=numpy.uint8)
+        return numpy.frombuffer(self.map, dtype=numpy.uint8, count=length * entry['count'],
+                                offset=self.dataStart + entry['words']).reshape(entry['count'], length)
+
+    def findSignature(self, sig):
+        """
+        The (ids offset, count, bits offset) record for a signature, by binary
+        search of its length's signature table. None if no word has it.
+        """
+        if sig in self.signatures:
+            return self.signatures[sig]
+        record = None
+        entry = self.lengths.get(len(sig))
+        if entry is not None and max(sig, default=0) < 256:
+            key = bytes(sig)
+            size = len(sig) + SIGNATURE_RECORD.size
+            start = self.dataStart + entry['signatures']
+            table = _RecordKeys(self.map, start, size, len(sig), entry['signatureCount'])
+            i = bisect.bisect_left(table, key)
+            if i < len(table) and table[i] == key:
+                record = SIGNATURE_RECORD.unpack_from(self.map, start + i * size + len(sig))
+        self.signatures[sig] = record
+        return record
+
+    def signatureIdList(self, sig):
+        """
+        The ids (within lengthWords) of the words with signature sig.
+        """
+        record = self.findSignature(sig)
+        if record is None:
+            return array.array('I')
+        ids = array.array('I')
+        start = self.dataStart + record[0]
+        ids.frombytes(self.map[start:start + 4 * record[1]])
+        if sys.byteorder != 'little':
+            ids.byteswap()
+        return ids
+
+    def bucket(self, sig):
+        """
+        The words with signature sig, as wordindex.SignatureBuckets.bucket.
+        """
+        words = self.buckets.get(sig)
+        if words is None:
+            lengthWords = self.lengthWords(len(sig))
+            words = self.buckets[sig] = [lengthWords[i] for i in self.signatureIdList(sig)]
+        return words
+
+    def signatureIds(self, sig):
+        """
+        The ids of the words with signature sig as a numpy index array.
+        """
+        return numpy.array(self.signatureIdList(sig), dtype=numpy.intp)
+
+    def bitsetBucket(self, sig):
+        """
+        A wordindex.BitsetBucket of the words with signature sig, using the
+        stored bitsets where there are some.
+        """
+        words = self.bucket(sig)
+        record = self.findSignature(sig)
+        if record is None or record[2] == NO_BITS:
+            return wordindex.BitsetBucket(words)
+        size = (len(words) + 7) // 8
+        start = self.dataStart + record[2]
+        positionBits = list()
+        for pos in range(len(sig)):
+            letterBits = dict()
+            for letter in wordindex.LETTERS:
+                bits = int.from_bytes(self.map[start:start + size], 'little')
+                if bits:
+                    letterBits[letter] = bits
+                start += size
+            positionBits.append(letterBits)
+        return wordindex.BitsetBucket(words, positionBits)
+
+
+class _RecordKeys:
+    """
+    The signature bytes of a table of fixed size records, as a sequence
+    bisect can search without reading the whole table.
+    """
+    def __init__(self, data, start, size, keyLength, count):
+        self.data = data
+        self.start = start
+        self.size = size
+        self.keyLength = keyLength
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        start = self.start + i * self.size
+        return self.data[start:start + self.keyLength]
+
+
+def loadDictionary(sourcePath=DEFAULT_WORDLIST, useCache=True):
+    """
+    Load the dictionary for the solvers: the compiled cache of sourcePath,
+    compiling it first if it is missing or out of date. If the cache can't
+    be written (or useCache is False) the word list is read as a plain list.
+    """
+    if useCache:
+        cachePath = sourcePath + CACHE_SUFFIX
+        stat = os.stat(sourcePath)
+        try:
+            compiled = CompiledDictionary(cachePath)
+            if compiled.isFor(stat):
+                return compiled
+        except (OSError, ValueError):
+            pass
+        try:
+            compileDictionary(sourcePath, cachePath)
+            return CompiledDictionary(cachePath)
+        except OSError:
+            pass
+
+    with open(sourcePath, "r", encoding="latin-1") as myfile:
+        return myfile.read().splitlines()
+
+
+if __name__ == "__main__":
+    for sourcePath in sys.argv[1:] or [DEFAULT_WORDLIST]:
+        start = time.time()
+        cachePath = compileDictionary(sourcePath)
+        print("%s: %s words, %s bytes, %.2fs" % (cachePath, "{:,}".format(len(CompiledDictionary(cachePath))),
+                                                 "{:,}".format(os.path.getsize(cachePath)), time.time() - start))
@@ -0,0 +1,1028 @@
+#!/usr/bin/python3
+# wordindex.py
+# Indexes over the dictionary, used by the puzzle solvers to cut down
+# candidate word lists without scanning the whole dictionary each time.
+#
+# An "engine" here is the thing a WordToSolve uses to hold and filter its
+# candidate words. Each engine has its own idea of what a candidate set is
+# (a list of words, a bitset of word ids, ...) and the rest of the solver only
+# ever passes them back to the engine that made them.
+
+import collections, re, sys
+
+try:
+    import numpy
+except ImportError:
+    # Only needed for the numpy engine.
+    numpy = None
+
+LETTERS = 'abcdefghijklmnopqrstuvwxyz'
+
+# Sets of letters are held as 26 bit masks, bit 0 for a ... bit 25 for z.
+ALL_LETTERS = (1 << 26) - 1
+LETTER_BIT = {letter: 1 << i for i, letter in enumerate(LETTERS)}
+
+
+def maskLetters(mask):
+    """
+    The letters in a letter mask, as a string.
+    """
+    return "".join(letter for letter in LETTERS if mask & LETTER_BIT[letter])
+
+# For each byte value, the positions of the bits set in it. Used to turn a
+# bitset back into word ids quickly.
+BYTE_BITS = tuple(tuple(b for b in range(8) if n & (1 << b)) for n in range(256))
+
+
+def bitsToIds(bits):
+    """
+    Return the positions of the set bits in bits (an int), lowest first.
+    """
+    ids = list()
+    data = bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+    for i, byte in enumerate(data):
+        if byte:
+            base = i * 8
+            ids.extend(base + b for b in BYTE_BITS[byte])
+    return ids
+
+
+def isPuzzleWord(word):
+    """
+    True if the word can be used in a letter puzzle: lower case a-z only.
+    """
+    return word.isascii() and word.isalpha() and word.islower()
+
+
+def puzzleWords(words):
+    """
+    The puzzle words from a word list: lower cased, a-z only, each once, in
+    the order they come.
+    """
+    seen = set()
+    for word in words:
+        word = word.lower()
+        if isPuzzleWord(word) and word not in seen:
+            seen.add(word)
+            yield word
+
+
+def signature(word):
+    """
+    The repeat pattern of a word, or of a code word: each item is replaced by
+    the order in which it first turned up. So "abca" and [5,13,26,5] both
+    give (0,1,2,0). A word can only be the answer to a code word if the two
+    have the same signature: same code -> same letter and different code ->
+    different letter.
+    """
+    seen = dict()
+    return tuple(seen.setdefault(c, len(seen)) for c in word)
+
+
+def rankedWords(words, ranks):
+    """
+    words in rank order (ranks is a dict of word -> rank, lowest first, see
+    wordlayers.loadFrequencies), the words without a rank after those with
+    one; words as they are if ranks is None. Words of the same rank keep
+    their order, so the unranked ones stay in dictionary order.
+    """
+    if ranks is None:
+        return words
+    unranked = len(ranks)
+    return sorted(words, key=lambda word: ranks.get(word, unranked))
+
+
+class SignatureBuckets:
+    """
+    The puzzle words of a dictionary bucketed by signature (which includes
+    the length). Built in one pass over the dictionary.
+    """
+    def __init__(self, words):
+        self.buckets = dict()
+        for word in puzzleWords(words):
+            self.buckets.setdefault(signature(word), list()).append(word)
+
+    def bucket(self, sig):
+        return self.buckets.get(sig, list())
+
+
+def signatureSource(words):
+    """
+    Something to get the words of a signature from: the dictionary itself if
+    it already knows (a wordcache.CompiledDictionary does), otherwise
+    SignatureBuckets built over it.
+    """
+    if hasattr(words, 'bucket'):
+        return words
+    return SignatureBuckets(words)
+
+
+def anagramKey(letters):
+    """
+    The multiset of some letters as a key: the letters sorted. Two words are
+    anagrams of each other exactly when their keys are the same.
+    """
+    return "".join(sorted(letters))
+
+
+class AnagramIndex:
+    """
+    The puzzle words of a dictionary keyed by anagramKey, so the words made
+    of exactly some letters are one dict lookup away. Each length is indexed
+    the first time letters of that length are looked up; a
+    wordcache.CompiledDictionary hands over the words of one length without
+    the rest.
+    """
+    def __init__(self, words):
+        self.words = words
+        self.lengths = dict()
+
+    def lengthIndex(self, length):
+        index = self.lengths.get(length)
+        if index is None:
+            if hasattr(self.words, 'lengthWords'):
+                words = self.words.lengthWords(length)
+            else:
+                words = [word for word in puzzleWords(self.words) if len(word) == length]
+            index = self.lengths[length] = dict()
+            for word in words:
+                index.setdefault(anagramKey(word), list()).append(word)
+        return index
+
+    def anagrams(self, letters):
+        """
+        The words which use exactly letters (a string or sequence of
+        letters), in dictionary order.
+        """
+        letters = "".join(letters).lower()
+        return self.lengthIndex(len(letters)).get(anagramKey(letters), list())
+
+    def addWords(self, words):
+        """
+        Put words into the index (see wordlayers.py), after the words with
+        the same letters. Only the lengths they are of are touched.
+        """
+        for word in puzzleWords(words):
+            anagrams = self.lengthIndex(len(word)).setdefault(anagramKey(word), list())
+            if word not in anagrams:
+                anagrams.append(word)
+
+    def removeWords(self, words):
+        """
+        Take words out of the index (see wordlayers.py).
+        """
+        for word in puzzleWords(words):
+            anagrams = self.lengthIndex(len(word)).get(anagramKey(word), list())
+            if word in anagrams:
+                anagrams.remove(word)
+
+    def anagramsMany(self, lettersList):
+        """
+        anagrams() of each of lettersList, as a list of word lists.
+        """
+        return [self.anagrams(letters) for letters in lettersList]
+
+
+def wordsByLength(words):
+    """
+    The puzzle words of a dictionary by length, as a dict of length -> words
+    in dictionary order. A wordcache.CompiledDictionary has them that way already.
+    """
+    if hasattr(words, 'lengthWords'):
+        return {length: words.lengthWords(length) for length in sorted(words.lengths)}
+    byLength = dict()
+    for word in puzzleWords(words):
+        byLength.setdefault(len(word), list()).append(word)
+    return byLength
+
+
+def dictionaryWords(words):
+    """
+    The puzzle words of a dictionary in word id order: shortest first, in
+    dictionary order within a length. A word's position in this list is its
+    dictionary word id (as used by LetterCountIndex and themetable.py).
+    """
+    byLength = wordsByLength(words)
+    return [word for length in sorted(byLength) for word in byLength[length]]
+
+
+def letterCounts(letters):
+    """
+    How many of each letter there are in letters, as a list of 26 counts.
+    """
+    counts = [0] * 26
+    for letter in letters:
+        counts[ord(letter) - ord('a')] += 1
+    return counts
+
+
+class LetterCountIndex:
+    """
+    The puzzle words of a dictionary as letter multisets, for "which words
+    can be made from these letters" queries: exactly all of them (anagrams),
+    or any of them with each used no more often than it is there (sub
+    anagrams), down to a shortest word.
+
+    With numpy the words are an N x 26 uint8 matrix of letter counts, with
+    each word's letter mask and length alongside, and a batch of queries is
+    answered by comparing the lot at once: the masks first (a word with a
+    letter not in the query is out), then the counts of the words left.
+    Without it, the same tests are done word by word, a length at a time.
+    Results come shortest words first, in dictionary order within a length
+    (the order of their dictionary word ids, see dictionaryWords).
+    """
+    # Queries compared with the whole dictionary at once, which bounds the
+    # size of the query x word arrays.
+    CHUNK = 64
+
+    def __init__(self, words, useNumpy=True):
+        self.useNumpy = useNumpy and numpy is not None
+        byLength = wordsByLength(words)
+        lengths = sorted(byLength)
+
+        self.words = list()
+        if self.useNumpy:
+            counts, masks, wordLengths = list(), list(), list()
+            for length in lengths:
+                lengthWords = byLength[length]
+                if hasattr(words, 'lengthMatrix'):
+                    matrix = words.lengthMatrix(length)
+                else:
+                    matrix = numpy.frombuffer("".join(lengthWords).encode('ascii'),
+                                              dtype=numpy.uint8).reshape(len(lengthWords), length)
+                rows = numpy.arange(len(lengthWords))
+                lengthCounts = numpy.zeros((len(lengthWords), 26), dtype=numpy.uint8)
+                lengthMasks = numpy.zeros(len(lengthWords), dtype=numpy.uint32)
+                for pos in range(length):
+                    letters = matrix[:, pos] - ord('a')
+                    lengthCounts[rows, letters] += 1
+                    lengthMasks |= numpy.left_shift(numpy.uint32(1), letters.astype(numpy.uint32))
+                counts.append(lengthCounts)
+                masks.append(lengthMasks)
+                wordLengths.append(numpy.full(len(lengthWords), length, dtype=numpy.uint8))
+                self.words.extend(lengthWords)
+            self.counts = numpy.concatenate(counts) if counts else numpy.zeros((0, 26), dtype=numpy.uint8)
+            self.masks = numpy.concatenate(masks) if masks else numpy.zeros(0, dtype=numpy.uint32)
+            self.lengths = numpy.concatenate(wordLengths) if wordLengths else numpy.zeros(0, dtype=numpy.uint8)
+        else:
+            # length -> (words, their masks, their letter counts as bytes)
+            self.byLength = dict()
+            for length in lengths:
+                lengthWords = byLength[length]
+                masks = list()
+                for word in lengthWords:
+                    mask = 0
+                    for letter in word:
+                        mask |= LETTER_BIT[letter]
+                    masks.append(mask)
+                self.byLength[length] = (lengthWords, masks, [bytes(letterCounts(word)) for word in lengthWords])
+                self.words.extend(lengthWords)
+
+    def __len__(self):
+        return len(self.words)
+
+    def query(self, lettersList, exact=False, minLength=1):
+        """
+        The words which can be made from each of lettersList (strings or
+        sequences of letters): with exact, those using all the letters,
+        otherwise any of them, in words at least minLength long. Returns a
+        list of word lists, one for each query.
+        """
+        lettersList = ["".join(letters).lower() for letters in lettersList]
+        if self.useNumpy:
+            return self.queryNumpy(lettersList, exact, minLength)
+        return [self.queryOne(letters, exact, minLength) for letters in lettersList]
+
+    def queryNumpy(self, lettersList, exact, minLength):
+        results = [list() for _ in lettersList]
+        if len(lettersList) == 0:
+            return results
+        queryCounts = numpy.array([letterCounts(letters) for letters in lettersList], dtype=numpy.uint8)
+        queryMasks = numpy.array([sum(LETTER_BIT[letter] for letter in set(letters)) for letters in lettersList],
+                                 dtype=numpy.uint32)
+        queryLengths = numpy.array([len(letters) for letters in lettersList], dtype=numpy.uint8)
+        words = self.words
+        for start in range(0, len(lettersList), LetterCountIndex.CHUNK):
+            end = start + LetterCountIndex.CHUNK
+            masks = queryMasks[start:end, None]
+            lengths = queryLengths[start:end, None]
+            # The words are in length order, so only the lengths these queries
+            # could want need looking at.
+            shortest = int(lengths.min()) if exact else minLength
+            first = int(numpy.searchsorted(self.lengths, shortest, 'left'))
+            last = int(numpy.searchsorted(self.lengths, int(lengths.max()), 'right'))
+            wordMasks = self.masks[None, first:last]
+            wordLengths = self.lengths[None, first:last]
+            if exact:
+                hits = (wordMasks == masks) & (wordLengths == lengths)
+            else:
+                hits = ((wordMasks & ~masks) == 0) & (wordLengths <= lengths)
+            queryIds, wordIds = numpy.nonzero(hits)
+            queryIds += start
+            wordIds += first
+            if exact:
+                fits = (self.counts[wordIds] == queryCounts[queryIds]).all(axis=1)
+            else:
+                fits = (self.counts[wordIds] <= queryCounts[queryIds]).all(axis=1)
+            for q, w in zip(queryIds[fits].tolist(), wordIds[fits].tolist()):
+                results[q].append(words[w])
+        return results
+
+    def queryOne(self, letters, exact, minLength):
+        counts = letterCounts(letters)
+        queryMask = 0
+        for letter in letters:
+            queryMask |= LETTER_BIT[letter]
+        outside = ALL_LETTERS & ~queryMask
+        result = list()
+        for length in ([len(letters)] if exact else range(minLength, len(letters) + 1)):
+            if length not in self.byLength:
+                continue
+            lengthWords, masks, wordCounts = self.byLength[length]
+            for i, mask in enumerate(masks):
+                if mask & outside:
+                    continue
+                if exact:
+                    if mask == queryMask and list(wordCounts[i]) == counts:
+                        result.append(lengthWords[i])
+                elif all(n <= counts[j] for j, n in enumerate(wordCounts[i])):
+                    result.append(lengthWords[i])
+        return result
+
+    def anagrams(self, letters):
+        return self.query([letters], exact=True)[0]
+
+    def anagramsMany(self, lettersList):
+        return self.query(lettersList, exact=True)
+
+    def formable(self, letters, minLength=1):
+        """
+        The words which can be made from some of letters, at least minLength long.
+        """
+        return self.query([letters], minLength=minLength)[0]
+
+    def addWords(self, words):
+        """
+        Put words into the index (see wordlayers.py), after the others of
+        their length. With numpy the arrays are copied with the new rows in
+        place, which is much less than counting every word's letters again.
+        """
+        present = set(self.words)
+        added = [word for word in dict.fromkeys(puzzleWords(words)) if word not in present]
+        if len(added) == 0:
+            return
+        added.sort(key=len)
+        if not self.useNumpy:
+            for word in added:
+                lengthWords, masks, wordCounts = self.byLength.get(len(word), (list(), list(), list()))
+                mask = 0
+                for letter in word:
+                    mask |= LETTER_BIT[letter]
+                self.byLength[len(word)] = (lengthWords + [word], masks + [mask],
+                                            wordCounts + [bytes(letterCounts(word))])
+            self.words = [word for length in sorted(self.byLength) for word in self.byLength[length][0]]
+            return
+
+        positions = numpy.searchsorted(self.lengths, [len(word) for word in added], 'right')
+        masks = list()
+        for word in added:
+            mask = 0
+            for letter in word:
+                mask |= LETTER_BIT[letter]
+            masks.append(mask)
+        self.counts = numpy.insert(self.counts, positions,
+                                   numpy.array([letterCounts(word) for word in added], dtype=numpy.uint8), axis=0)
+        self.masks = numpy.insert(self.masks, positions, numpy.array(masks, dtype=numpy.uint32))
+        self.lengths = numpy.insert(self.lengths, positions, numpy.array([len(word) for word in added],
+                                                                         dtype=numpy.uint8))
+        merged = list()
+        previous = 0
+        for position, word in zip(positions.tolist(), added):
+            merged.extend(self.words[previous:position])
+            merged.append(word)
+            previous = position
+        merged.extend(self.words[previous:])
+        self.words = merged
+
+    def removeWords(self, words):
+        """
+        Take words out of the index (see wordlayers.py).
+        """
+        removed = set(puzzleWords(words))
+        gone = [i for i, word in enumerate(self.words) if word in removed]
+        if len(gone) == 0:
+            return
+        if not self.useNumpy:
+            for length in {len(word) for word in removed}:
+                if length in self.byLength:
+                    kept = [i for i, word in enumerate(self.byLength[length][0]) if word not in removed]
+                    self.byLength[length] = tuple([column[i] for i in kept] for column in self.byLength[length])
+        else:
+            self.counts = numpy.delete(self.counts, gone, axis=0)
+            self.masks = numpy.delete(self.masks, gone)
+            self.lengths = numpy.delete(self.lengths, gone)
+        self.words = [word for word in self.words if word not in removed]
+
+
+class RegexEngine:
+    """
+    The original way of doing it. Candidate sets are lists of words, and each
+    filter builds a regex from the rubric and runs it over the list.
+    """
+    name = 'regex'
+
+    def __init__(self, words):
+        self.words = words
+        self.signatures = None
+        # The order wordList gives candidates in: word -> rank (see
+        # rankedWords), or None for dictionary order.
+        self.ranks = None
+        # The signature buckets words have been put into or taken out of
+        # (see addWords), in place of the ones from the dictionary.
+        self.layered = dict()
+
+    def initialCandidates(self, wordInCode):
+        sig = signature(wordInCode)
+        bucket = self.layered.get(sig)
+        if bucket is not None:
+            return bucket
+        if self.signatures == None:
+            self.signatures = signatureSource(self.words)
+        return self.signatures.bucket(sig)
+
+    def addWords(self, words):
+        """
+        Put words into the index (see wordlayers.py). Only the signature
+        buckets they fall into are touched.
+        """
+        for word in puzzleWords(words):
+            bucket = self.layeredBucket(word)
+            if word not in bucket:
+                bucket.append(word)
+
+    def removeWords(self, words):
+        """
+        Take words out of the index (see wordlayers.py).
+        """
+        for word in puzzleWords(words):
+            bucket = self.layeredBucket(word)
+            if word in bucket:
+                bucket.remove(word)
+
+    def layeredBucket(self, word):
+        # A copy of the word's signature bucket, which is this engine's own to change.
+        sig = signature(word)
+        bucket = self.layered.get(sig)
+        if bucket is None:
+            bucket = self.layered[sig] = list(self.initialCandidates(word))
+        return bucket
+
+    def fromWords(self, wordInCode, words):
+        return list(words)
+
+    def count(self, wordInCode, candidates):
+        return len(candidates)
+
+    def wordList(self, wordInCode, candidates):
+        return rankedWords(candidates, self.ranks)
+
+    def lettersAt(self, wordInCode, candidates, pos):
+        """
+        Mask of the letters found at position pos in the candidates.
+        """
+        mask = 0
+        for word in candidates:
+            mask |= LETTER_BIT[word[pos]]
+        return mask
+
+    def restrictAt(self, wordInCode, candidates, pos, mask):
+        """
+        The candidates which have one of the letters in mask at position pos.
+        """
+        return [word for word in candidates if mask & LETTER_BIT[word[pos]]]
+
+    def excludeAt(self, wordInCode, candidates, pos, mask):
+        """
+        The candidates which don't have one of the letters in mask at position pos.
+        """
+        return [word for word in candidates if not mask & LETTER_BIT[word[pos]]]
+
+    def intersect(self, wordInCode, candidates, others):
+        """
+        The candidates which are also in others, in the order of candidates.
+        """
+        others = set(others)
+        return [word for word in candidates if word in others]
+
+    # The initial lists come from the signature buckets, so they have already
+    # culled candidate words which allocate the same letter to different numbers.
+    def filter(self, wordInCode, candidates, rubric, verbose=False):
+        # build the match for letters which are not known - they can be any letter
+        # except an already used one. The brackets make it a capture group, so
+        # so repeats can be used to reduce further search space.
+        if len(rubric) == 0 :
+            unknown_r = 'A-Za-z'
+        else :
+            unknown_r = '^'
+            for letter in rubric.values() :
+                unknown_r += letter
+
+        # Keep a track of the unkonwns already seen
+        seen_unknowns = list()
+
+        # Build the regex string
+        r = '^'                 # Regex for start of string
+
+        for code in wordInCode:      # Each code number in the codes list
+            letter = rubric.get(code)       # Return any matches from the rubric dictionary (if we know the code)
+            if letter != None:
+                r += letter
+            else:
+                if seen_unknowns.count(code) == 0 :
+                    # Haven't seen this number yet, so it is unknown, and won't
+                    # have previously been macthed
+                    r += '([' + unknown_r + '])'
+                    seen_unknowns.append(code)
+                else :
+                    # This unknown is the same as a previous unkown, so match to
+                    # whatever that macthed to.
+                    r += "\\{}".format(seen_unknowns.index(code)+1)
+
+        r += "$"                # Regex for end of string
+
+        if verbose:
+            print("r for", wordInCode, " is ", r)
+
+        return list(filter(lambda x : re.match(r, x) != None, candidates))
+
+
+class BitsetBucket:
+    """
+    All the dictionary words with one signature, with a bitset of word ids
+    for every (position, letter) pair: bit i of positionBits[p][letter] is set
+    if words[i][p] == letter.
+    """
+    def __init__(self, words, positionBits=None):
+        self.words = words
+        self.length = len(words[0]) if len(words) > 0 else 0
+        self.allBits = (1 << len(words)) - 1
+        self.wordIds = {word: i for i, word in enumerate(words)}
+        # Whether words is this bucket's own list to add to (see addWord).
+        self.ownWords = False
+
+        if positionBits != None:
+            # Already worked out, e.g. read from a wordcache.
+            self.positionBits = positionBits
+            return
+
+        size = (len(words) + 7) // 8
+        data = [dict() for _ in range(self.length)]
+        for i, word in enumerate(words):
+            byte = i >> 3
+            bit = 1 << (i & 7)
+            for pos, letter in enumerate(word):
+                letterData = data[pos].get(letter)
+                if letterData is None:
+                    letterData = data[pos][letter] = bytearray(size)
+                letterData[byte] |= bit
+
+        self.positionBits = [{letter: int.from_bytes(d, 'little') for letter, d in posData.items()}
+                             for posData in data]
+
+    def addWord(self, word):
+        """
+        Put word in the bucket, as the next word id (the words list may be
+        shared, e.g. with a wordcache, so it is copied the first time).
+        """
+        if word in self.wordIds:
+            return
+        if self.length == 0:
+            self.length = len(word)
+            self.positionBits = [dict() for _ in range(self.length)]
+        if not self.ownWords:
+            self.words = list(self.words)
+            self.ownWords = True
+        self.words.append(word)
+        i = len(self.words) - 1
+        bit = 1 << i
+        self.wordIds[word] = i
+        self.allBits |= bit
+        for pos, letter in enumerate(word):
+            self.positionBits[pos][letter] = self.positionBits[pos].get(letter, 0) | bit
+
+    def removeWord(self, word):
+        """
+        Take word out of the bucket. Its word id is left unused, so no other
+        word's id changes.
+        """
+        i = self.wordIds.pop(word, None)
+        if i is None:
+            return
+        bit = 1 << i
+        self.allBits &= ~bit
+        for pos, letter in enumerate(word):
+            self.positionBits[pos][letter] &= ~bit
+
+    def lettersBits(self, pos, letters):
+        """
+        Bitset of the words having any of letters at position pos.
+        """
+        bits = 0
+        posBits = self.positionBits[pos]
+        for letter in letters:
+            bits |= posBits.get(letter, 0)
+        return bits
+
+    def maskBits(self, pos, mask):
+        """
+        Bitset of the words having any of the letters in mask at position pos.
+        """
+        bits = 0
+        posBits = self.positionBits[pos]
+        if mask.bit_count() < len(posBits):
+            # Fewer letters asked for than there are: go by the mask.
+            while mask:
+                bit = mask & -mask
+                mask ^= bit
+                bits |= posBits.get(LETTERS[bit.bit_length() - 1], 0)
+            return bits
+        for letter, letterBits in posBits.items():
+            if mask & LETTER_BIT[letter]:
+                bits |= letterBits
+        return bits
+
+
+class WordIndex:
+    """
+    Positional letter bitset index over a dictionary. Candidate sets are ints
+    used as bitsets of word ids within the BitsetBucket for the code word's
+    signature, so filtering a word against the rubric is a handful of ANDs,
+    and repeated codes never need checking.
+
+    Only words made up of a-z go in the index: nothing else can be the answer
+    to a 26 letter puzzle.
+    """
+    name = 'bitset'
+
+    def __init__(self, words):
+        self.words = words
+        self.signatures = None
+        self.buckets = dict()
+        # The order wordList gives candidates in: word -> rank (see
+        # rankedWords), or None for dictionary order (word id order).
+        self.ranks = None
+
+    def bucket(self, wordInCode):
+        sig = signature(wordInCode)
+        bucket = self.buckets.get(sig)
+        if bucket is None:
+            if self.signatures is None:
+                self.signatures = signatureSource(self.words)
+            if hasattr(self.signatures, 'bitsetBucket'):
+                bucket = self.signatures.bitsetBucket(sig)
+            else:
+                bucket = BitsetBucket(self.signatures.bucket(sig))
+            self.buckets[sig] = bucket
+        return bucket
+
+    def initialCandidates(self, wordInCode):
+        return self.bucket(wordInCode).allBits
+
+    def addWords(self, words):
+        """
+        Put words into the index (see wordlayers.py). Only the signature
+        buckets they fall into are touched, each word taking the next id.
+        """
+        for word in puzzleWords(words):
+            self.bucket(word).addWord(word)
+
+    def removeWords(self, words):
+        """
+        Take words out of the index (see wordlayers.py), leaving their ids unused.
+        """
+        for word in puzzleWords(words):
+            self.bucket(word).removeWord(word)
+
+    def fromWords(self, wordInCode, words):
+        wordIds = self.bucket(wordInCode).wordIds
+        bits = 0
+        for word in words:
+            if word in wordIds:
+                bits |= 1 << wordIds[word]
+        return bits
+
+    def count(self, wordInCode, candidates):
+        return candidates.bit_count()
+
+    def wordList(self, wordInCode, candidates):
+        bucketWords = self.bucket(wordInCode).words
+        return rankedWords([bucketWords[i] for i in bitsToIds(candidates)], self.ranks)
+
+    def lettersAt(self, wordInCode, candidates, pos):
+        mask = 0
+        for letter, letterBits in self.bucket(wordInCode).positionBits[pos].items():
+            if candidates & letterBits:
+                mask |= LETTER_BIT[letter]
+        return mask
+
+    def restrictAt(self, wordInCode, candidates, pos, mask):
+        return candidates & self.bucket(wordInCode).maskBits(pos, mask)
+
+    def excludeAt(self, wordInCode, candidates, pos, mask):
+        return candidates & ~self.bucket(wordInCode).maskBits(pos, mask)
+
+    def intersect(self, wordInCode, candidates, others):
+        return candidates & others
+
+    def filter(self, wordInCode, candidates, rubric, verbose=False):
+        bucket = self.bucket(wordInCode)
+        bits = candidates
+
+        # Letters already used elsewhere can't turn up at an unknown position.
+        # Repeated codes need no checking, the bucket's signature has seen to that.
+        usedLetters = set(rubric.values())
+
+        seen_unknowns = set()
+        for pos, code in enumerate(wordInCode):
+            # (Before looking at the position: a bucket with no words has no positions.)
+            if bits == 0:
+                break
+            letter = rubric.get(code)
+            if letter != None:
+                bits &= bucket.positionBits[pos].get(letter, 0)
+            elif code not in seen_unknowns:
+                seen_unknowns.add(code)
+                if len(usedLetters) > 0:
+                    bits &= ~bucket.lettersBits(pos, usedLetters)
+
+        if verbose:
+            print("bits for", wordInCode, "leave", "{:,}".format(bits.bit_count()), "of", "{:,}".format(len(bucket.words)))
+        return bits
+
+
+class MatrixBucket:
+    """
+    All the dictionary words of one length as an N x L uint8 matrix of their
+    letters (as ASCII codes), one row per word. baseSignatureIds, if given,
+    looks up the rows of a signature among the words the bucket was made
+    with (a wordcache.CompiledDictionary has them ready).
+
+    Words put in later (see addWords) are rows added to the end; words taken
+    out keep their rows, unused, so no other word's row changes.
+    """
+    def __init__(self, words, matrix=None, baseSignatureIds=None):
+        self.words = words
+        self.wordIds = {word: i for i, word in enumerate(words)}
+        if matrix is None:
+            length = len(words[0]) if len(words) > 0 else 0
+            matrix = numpy.frombuffer("".join(words).encode('ascii'), dtype=numpy.uint8).reshape(len(words), length)
+        self.matrix = matrix
+        self.bySignature = dict()
+        self.baseSignatureIds = baseSignatureIds
+        self.baseCount = len(words)
+        self.removedIds = set()
+
+    def signatureIds(self, sig):
+        """
+        The row numbers of the words with signature sig, as an index array.
+        """
+        ids = self.bySignature.get(sig)
+        if ids is None:
+            if self.baseSignatureIds is not None:
+                ids = self.baseSignatureIds(sig).tolist()
+            else:
+                ids = [i for i in range(self.baseCount) if signature(self.words[i]) == sig]
+            ids += [i for i in range(self.baseCount, len(self.words)) if signature(self.words[i]) == sig]
+            if len(self.removedIds) > 0:
+                ids = [i for i in ids if i not in self.removedIds]
+            ids = self.bySignature[sig] = numpy.array(ids, dtype=numpy.intp)
+        return ids
+
+    def addWords(self, words):
+        """
+        Put words (all of the bucket's length) in as new rows at the end.
+        """
+        added = [word for word in dict.fromkeys(words) if word not in self.wordIds]
+        if len(added) == 0:
+            return
+        rows = numpy.frombuffer("".join(added).encode('ascii'), dtype=numpy.uint8).reshape(len(added), -1)
+        self.matrix = numpy.concatenate((self.matrix.reshape(-1, rows.shape[1]), rows))
+        for i, word in enumerate(added, len(self.words)):
+            self.wordIds[word] = i
+            self.bySignature.pop(signature(word), None)
+        self.words = self.words + added
+
+    def removeWords(self, words):
+        for word in words:
+            i = self.wordIds.pop(word, None)
+            if i is not None:
+                self.removedIds.add(i)
+                self.bySignature.pop(signature(word), None)
+
+
+class NumpyEngine:
+    """
+    Vectorised candidate filtering. Each length bucket of the dictionary is a
+    uint8 matrix (see MatrixBucket) and candidate sets are index arrays of
+    rows in it, so filtering against the rubric is a comparison per known
+    letter and a table lookup per unknown one over the whole candidate set.
+    Repeated codes are taken care of by starting from the rows with the
+    right signature.
+
+    Needs numpy, which is otherwise optional.
+    """
+    name = 'numpy'
+
+    def __init__(self, words):
+        if numpy is None:
+            raise ImportError("The numpy candidate engine needs numpy installed")
+        self.words = words
+        self.buckets = None
+        # The order wordList gives candidates in: word -> rank (see
+        # rankedWords), or None for dictionary order (row order).
+        self.ranks = None
+
+    def bucket(self, length):
+        if self.buckets is None:
+            self.buckets = dict()
+            if not hasattr(self.words, 'lengthMatrix'):
+                byLength = dict()
+                for word in puzzleWords(self.words):
+                    byLength.setdefault(len(word), list()).append(word)
+                self.buckets = {n: MatrixBucket(words) for n, words in byLength.items()}
+        bucket = self.buckets.get(length)
+        if bucket is None:
+            if hasattr(self.words, 'lengthMatrix'):
+                # The matrix is a view straight onto the cache file.
+                bucket = MatrixBucket(self.words.lengthWords(length), self.words.lengthMatrix(length),
+                                      self.words.signatureIds)
+            else:
+                bucket = MatrixBucket(list())
+            self.buckets[length] = bucket
+        return bucket
+
+    def initialCandidates(self, wordInCode):
+        return self.bucket(len(wordInCode)).signatureIds(signature(wordInCode))
+
+    def addWords(self, words):
+        """
+        Put words into the index (see wordlayers.py). Only the lengths they
+        are of are touched, the new words going on the end of the matrix.
+        """
+        byLength = dict()
+        for word in puzzleWords(words):
+            byLength.setdefault(len(word), list()).append(word)
+        for length, lengthWords in byLength.items():
+            self.bucket(length).addWords(lengthWords)
+
+    def removeWords(self, words):
+        """
+        Take words out of the index (see wordlayers.py), leaving their rows unused.
+        """
+        for word in puzzleWords(words):
+            self.bucket(len(word)).removeWords([word])
+
+    def fromWords(self, wordInCode, words):
+        bucket = self.bucket(len(wordInCode))
+        sig = signature(wordInCode)
+        return numpy.array([bucket.wordIds[w] for w in words
+                            if w in bucket.wordIds and signature(w) == sig], dtype=numpy.intp)
+
+    def count(self, wordInCode, candidates):
+        return len(candidates)
+
+    def wordList(self, wordInCode, candidates):
+        bucketWords = self.bucket(len(wordInCode)).words
+        return rankedWords([bucketWords[i] for i in candidates.tolist()], self.ranks)
+
+    def lettersAt(self, wordInCode, candidates, pos):
+        column = self.bucket(len(wordInCode)).matrix[candidates, pos] - ord('a')
+        return int(numpy.bitwise_or.reduce(numpy.left_shift(1, column, dtype=numpy.uint32)))
+
+    def restrictAt(self, wordInCode, candidates, pos, mask):
+        allowed = numpy.zeros(128, dtype=bool)
+        allowed[ord('a'):ord('a') + 26] = (mask >> numpy.arange(26)) & 1 == 1
+        return candidates[allowed[self.bucket(len(wordInCode)).matrix[candidates, pos]]]
+
+    def excludeAt(self, wordInCode, candidates, pos, mask):
+        return self.restrictAt(wordInCode, candidates, pos, ALL_LETTERS & ~mask)
+
+    def intersect(self, wordInCode, candidates, others):
+        return candidates[numpy.isin(candidates, others, assume_unique=True)]
+
+    def filter(self, wordInCode, candidates, rubric, verbose=False):
+        matrix = self.bucket(len(wordInCode)).matrix
+
+        # A lookup table (by ASCII code) of the letters already used, which
+        # can't turn up at an unknown position.
+        used = numpy.zeros(128, dtype=bool)
+        for letter in rubric.values():
+            used[ord(letter)] = True
+        anyUsed = used.any()
+
+        mask = numpy.ones(len(candidates), dtype=bool)
+        seen_unknowns = set()
+        for pos, code in enumerate(wordInCode):
+            letter = rubric.get(code)
+            if letter != None:
+                mask &= matrix[candidates, pos] == ord(letter)
+            elif code not in seen_unknowns:
+                seen_unknowns.add(code)
+                if anyUsed:
+                    mask &= ~used[matrix[candidates, pos]]
+
+        if verbose:
+            print("mask for", wordInCode, "leaves", "{:,}".format(int(mask.sum())), "of", "{:,}".format(len(candidates)))
+        return candidates[mask]
+
+
+# Default memory budget of a FilterCache.
+FILTER_CACHE_BYTES = 32 * 1024 * 1024
+
+
+class FilterCache:
+    """
+    A bounded LRU cache of filtered candidate sets, for an engine.
+
+    Filtering a code word's initial candidates against the rubric only
+    depends on the word's signature, the letters the rubric gives its codes
+    and (if any of its codes are still unknown) the letters used elsewhere.
+    That is the key, so different branches of a search - and different
+    words with the same signature - that come to the same filter share one
+    result. The search intersects that with the word's current candidates
+    (see the engines' intersect), which is a single AND for the bitset engine.
+
+    The entries are kept to about maxBytes, least recently used out first.
+    """
+    def __init__(self, engine, maxBytes=FILTER_CACHE_BYTES):
+        self.engine = engine
+        self.maxBytes = maxBytes
+        self.entries = collections.OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(wordInCode, rubric, usedMask):
+        seen = dict()
+        letters = list()
+        for code in wordInCode:
+            if code not in seen:
+                seen[code] = len(seen)
+                letters.append(rubric.get(code))
+        if None not in letters:
+            usedMask = 0
+        return tuple(seen[code] for code in wordInCode), tuple(letters), usedMask
+
+    def filtered(self, wordInCode, rubric, usedMask):
+        """
+        The initial candidates of wordInCode filtered against rubric, where
+        usedMask is the mask of the letters in the rubric.
+        """
+        key = FilterCache.key(wordInCode, rubric, usedMask)
+        entries = self.entries
+        candidates = entries.get(key)
+        if candidates is not None:
+            self.hits += 1
+            entries.move_to_end(key)
+            return candidates
+
+        self.misses += 1
+        candidates = self.engine.filter(wordInCode, self.engine.initialCandidates(wordInCode), rubric)
+        size = sys.getsizeof(candidates) + sys.getsizeof(key)
+        if size <= self.maxBytes:
+            entries[key] = candidates
+            self.bytes += size
+            while self.bytes > self.maxBytes:
+                oldKey, old = entries.popitem(last=False)
+                self.bytes -= sys.getsizeof(old) + sys.getsizeof(oldKey)
+                self.evictions += 1
+        return candidates
+
+    def counters(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'entries': len(self.entries), 'bytes': self.bytes}
+
+
+ENGINES = {
+    RegexEngine.name: RegexEngine,
+    WordIndex.name: WordIndex,
+    NumpyEngine.name: NumpyEngine,
+}
+
+
+def makeEngine(name, dictionary):
+    """
+    Return the candidate engine called name over dictionary. dictionary can
+    be a list of words, or an engine already built (which is reused if it is
+    the right kind, so an index only has to be built once).
+    """
+    engineClass = ENGINES.get(name)
+    if engineClass == None:
+        raise ValueError("Unknown candidate engine: %s (known: %s)" % (name, ", ".join(ENGINES)))
+    if isinstance(dictionary, engineClass):
+        return dictionary
+    if hasattr(dictionary, 'words'):
+        dictionary = dictionary.words
+    return engineClass(dictionary)
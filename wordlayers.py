@@ -0,0 +1,104 @@
+#!/usr/bin/python3
+# wordlayers.py
+# Changes to the base word list for one kind of puzzle, and an order to try
+# words in, both kept in small local files next to it.
+#
+# A layer file adds words to the dictionary and takes words out: one word a
+# line, "-word" to take it out, anything after a # ignored. A layer is put
+# into an index that is already built (applyLayers), touching only the
+# buckets its words fall into, so a codeword index and a circlegram index
+# can each have their own layers over the one base list without either
+# being built again.
+#
+# A frequency file ranks words, most common first: one word a line, or
+# "word count" lines in any order (highest count first). The codeword search
+# tries a word's candidates in that order (see wordindex.rankedWords), so
+# the common words real puzzles use are tried before obscure ones.
+#
+# Usage: wordlayers.py LAYER ...    show what each layer adds and takes out
+
+import collections, sys
+
+import wordindex
+
+Layer = collections.namedtuple('Layer', ('path', 'additions', 'exclusions'))
+
+
+def _lines(path):
+    with open(path, "r", encoding="latin-1") as layerFile:
+        for line in layerFile:
+            line = line.split("#", 1)[0].strip()
+            if len(line) > 0:
+                yield line
+
+
+def loadLayer(path):
+    """
+    The Layer in the file at path: the words it adds and the words it takes
+    out, each in the order they come.
+    """
+    additions = list()
+    exclusions = list()
+    for line in _lines(path):
+        if line.startswith("-"):
+            exclusions.append(line[1:].strip())
+        else:
+            additions.append(line.lstrip("+").strip())
+    return Layer(path, additions, exclusions)
+
+
+def applyLayers(index, layers):
+    """
+    Put layers (Layers, or paths of layer files) into index, one after
+    another: any of the candidate engines in wordindex, an AnagramIndex or a
+    LetterCountIndex. A word a layer both adds and takes out is taken out.
+    Returns index.
+    """
+    for layer in layers:
+        if not isinstance(layer, Layer):
+            layer = loadLayer(layer)
+        index.addWords(layer.additions)
+        index.removeWords(layer.exclusions)
+    return index
+
+
+def loadFrequencies(path):
+    """
+    The ranks in the frequency file at path, as a dict of word -> rank (0
+    for the most common), for wordindex.rankedWords.
+    """
+    counted = list()
+    for order, line in enumerate(_lines(path)):
+        fields = line.split()
+        count = None
+        if len(fields) > 1:
+            try:
+                count = float(fields[1])
+            except ValueError:
+                pass
+        # Counted words by count; any without one after them, in order.
+        counted.append(((0, -count) if count != None else (1, order), order, fields[0].lower()))
+    ranks = dict()
+    for _, _, word in sorted(counted):
+        if wordindex.isPuzzleWord(word) and word not in ranks:
+            ranks[word] = len(ranks)
+    return ranks
+
+
+def useFrequencies(engine, ranks):
+    """
+    Have engine (a candidate engine from wordindex) give candidates in the
+    order of ranks (from loadFrequencies, or a path to load them from; None
+    for dictionary order). Returns engine.
+    """
+    if isinstance(ranks, str):
+        ranks = loadFrequencies(ranks)
+    engine.ranks = ranks
+    return engine
+
+
+if __name__ == "__main__":
+    for path in sys.argv[1:]:
+        layer = loadLayer(path)
+        print("%s: adds %s, takes out %s" % (path, "{:,}".format(len(layer.additions)),
+                                             "{:,}".format(len(layer.exclusions))))